@@ -30,7 +30,7 @@ setuptools.setup(
             "doc_url = mtd_sync:MODULE_DOC_URL",
             "blueprint = mtd_sync.blueprint:blueprint",
             "config_schema = mtd_sync.conf_schema_toml:GnModuleSchemaConf",
-            # "migrations = mtd_sync:migrations",
+            "migrations = mtd_sync:migrations",
         ],
     },
     classifiers=[
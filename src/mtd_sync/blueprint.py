@@ -13,8 +13,12 @@ blueprint = Blueprint("mtd_sync", __name__)
 
 from .mtd_sync import (
     sync_af_and_ds as mtd_sync_af_and_ds,
+    SyncBudgetExceeded,
     sync_af_and_ds_by_user,
+    sync_af_and_ds_by_user_afs,
 )
+from .sync_state import is_user_sync_fresh
+from .user_sync import get_user_sync_executor
 
 
 @current_app.before_request
@@ -27,12 +31,54 @@ def synchronize_mtd():
 
         if current_user.is_authenticated:
             params = request.json if request.is_json else request.args
+            id_role = current_user.id_role
+
+            # Skip the syncs which succeeded less than SYNC_USER_FRESHNESS_TTL seconds ago
+            freshness_ttl = current_app.config["MTD_SYNC"]["SYNC_USER_FRESHNESS_TTL"]
+
+            def is_fresh(id_af=None):
+                return bool(freshness_ttl) and is_user_sync_fresh(
+                    id_role, id_af, ttl=freshness_ttl
+                )
+
             try:
                 list_id_af = params.get("id_acquisition_frameworks", [])
-                for id_af in list_id_af:
-                    sync_af_and_ds_by_user(id_role=current_user.id_role, id_af=id_af)
-                if not list_id_af:
-                    sync_af_and_ds_by_user(id_role=current_user.id_role)
+                if list_id_af:
+                    # All the AFs of the request are synchronized at once
+                    id_afs = [id_af for id_af in list_id_af if not is_fresh(id_af)]
+                    if not id_afs:
+                        return
+                elif is_fresh():
+                    return
+                else:
+                    id_afs = None
+
+                # Asynchronous mode: the request is served with the data already in the database
+                if current_app.config["MTD_SYNC"]["SYNC_USER_ASYNC"]:
+                    get_user_sync_executor(current_app._get_current_object()).submit(
+                        id_role, id_afs=id_afs
+                    )
+                    return
+
+                # The part of the sync not run within the time budget is deferred to the background
+                time_budget = current_app.config["MTD_SYNC"]["SYNC_USER_REQUEST_BUDGET"] or None
+                try:
+                    if id_afs:
+                        sync_af_and_ds_by_user_afs(id_role, id_afs, time_budget=time_budget)
+                    else:
+                        sync_af_and_ds_by_user(id_role, time_budget=time_budget)
+                except SyncBudgetExceeded as budget_exceeded:
+                    timings = ", ".join(
+                        f"{stage}={duration:.2f}s"
+                        for stage, duration in budget_exceeded.timings.items()
+                    )
+                    log.warning(
+                        f"MTD - SYNC USER : id_role={id_role} time budget of {time_budget}s "
+                        f"exceeded at stage '{budget_exceeded.stage}' ({timings}), deferred"
+                    )
+                    get_user_sync_executor(current_app._get_current_object()).submit(
+                        id_role, id_afs=id_afs, resume=budget_exceeded.resume
+                    )
             except Exception as e:
                 log.exception(f"Error while get JDD via MTD: {e}")
 
@@ -46,7 +92,13 @@ def synchronize_mtd():
     default=None,
     help="ID of an acquisition framework",
 )
-def sync(id_role, id_af):
+@click.option(
+    "--engine",
+    type=click.Choice(["record", "bulk", "copy"]),
+    default=None,
+    help="Synchronization engine, SYNC_ENGINE by default",
+)
+def sync(id_role, id_af, engine):
     """
     \b
     Triggers :
@@ -57,9 +109,9 @@ def sync(id_role, id_af):
     NOTE: if both id_role and id_af are provided, only the datasets possibly associated to both the AF and the user will be retrieved.
     """
     if id_role:
-        return sync_af_and_ds_by_user(id_role, id_af)
+        return sync_af_and_ds_by_user(id_role, id_af, sync_engine=engine)
     else:
-        return mtd_sync_af_and_ds()
+        return mtd_sync_af_and_ds(sync_engine=engine)
 
 
 @blueprint.route("/extended_af_publish/<int:af_id>", endpoint="extended_af_publish")
@@ -1,4 +1,4 @@
-from marshmallow import Schema, fields, post_load
+from marshmallow import Schema, fields, post_load, validate
 
 
 class GnModuleSchemaConf(Schema):
@@ -19,3 +19,29 @@ class GnModuleSchemaConf(Schema):
     MAIL_CONTENT_AF_CLOSED_PDF = fields.String(load_default="")
     MAIL_CONTENT_AF_CLOSED_URL = fields.String(load_default="")
     MAIL_CONTENT_AF_CLOSED_GREETINGS = fields.String(load_default="")
+    HTTP_POOL_CONNECTIONS = fields.Integer(load_default=10)
+    HTTP_POOL_MAXSIZE = fields.Integer(load_default=10)
+    HTTP_POOL_MAXSIZE_BY_HOST = fields.Dict(
+        keys=fields.String(), values=fields.Integer(), load_default={}
+    )
+    HTTP_CONNECT_TIMEOUT = fields.Float(load_default=10)
+    HTTP_READ_TIMEOUT = fields.Float(load_default=120)
+    XML_CACHE_ENABLED = fields.Boolean(load_default=False)
+    XML_CACHE_DIR = fields.String(load_default="")
+    XML_CACHE_MAX_SIZE_MB = fields.Integer(load_default=500)
+    XML_CACHE_MAX_AGE_DAYS = fields.Float(load_default=7)
+    SYNC_CONCURRENT_FETCH = fields.Boolean(load_default=False)
+    SYNC_ENGINE = fields.String(
+        load_default="record", validate=validate.OneOf(["record", "bulk", "copy"])
+    )
+    SYNC_BULK_CHUNK_SIZE = fields.Integer(load_default=1000, validate=validate.Range(min=1))
+    SYNC_COMMIT_BATCH_SIZE = fields.Integer(load_default=0, validate=validate.Range(min=0))
+    SYNC_COMMIT_BATCH_SECONDS = fields.Float(load_default=10, validate=validate.Range(min=0))
+    SYNC_INCREMENTAL = fields.Boolean(load_default=False)
+    SYNC_FINGERPRINTS = fields.Boolean(load_default=False)
+    SYNC_USER_ASYNC = fields.Boolean(load_default=False)
+    SYNC_USER_ASYNC_WORKERS = fields.Integer(load_default=2, validate=validate.Range(min=1))
+    SYNC_USER_FRESHNESS_TTL = fields.Integer(load_default=0, validate=validate.Range(min=0))
+    SYNC_SINGLE_FLIGHT = fields.Boolean(load_default=False)
+    SYNC_SINGLE_FLIGHT_WAIT = fields.Float(load_default=0, validate=validate.Range(min=0))
+    SYNC_USER_REQUEST_BUDGET = fields.Float(load_default=0, validate=validate.Range(min=0))
@@ -0,0 +1,152 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from geonature.utils.config import config
+
+# Get the logger instance "MTD_SYNC"
+logger = logging.getLogger("MTD_SYNC")
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+class MTDHttpClient:
+    """
+    HTTP client shared by every call made to the INPN web services (MTD exports, CAS user lookups).
+
+    A single `requests.Session` is used so that TCP/TLS connections are kept alive and reused
+    across calls. Each host gets its own connection pool, whose size can be configured per host.
+    """
+
+    def __init__(
+        self,
+        pool_connections=10,
+        pool_maxsize=10,
+        pool_maxsize_by_host=None,
+        connect_timeout=10,
+        read_timeout=120,
+    ):
+        """
+        Parameters
+        ----------
+        pool_connections : int
+            number of per-host connection pools kept in memory
+        pool_maxsize : int
+            maximum number of connections kept alive for a given host
+        pool_maxsize_by_host : dict, optional
+            maximum number of connections kept alive, by host (overrides `pool_maxsize`)
+        connect_timeout : float
+            timeout, in seconds, to establish a connection
+        read_timeout : float
+            timeout, in seconds, between two bytes received from the server
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        # Explicitly negotiate compression: the XML exports compress very well
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        for host, host_pool_maxsize in (pool_maxsize_by_host or {}).items():
+            host_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=host_pool_maxsize)
+            self.session.mount(f"http://{host}", host_adapter)
+            self.session.mount(f"https://{host}", host_adapter)
+
+    def get(self, url, **kwargs):
+        """
+        Send a GET request through the shared session.
+
+        Parameters
+        ----------
+        url : str
+            URL to request
+        **kwargs
+            keyword arguments passed to `requests.Session.get` ; a default `timeout` is set
+
+        Returns
+        -------
+        requests.Response
+            the response
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def get_pool_stats(self) -> list:
+        """
+        Return statistics of the connection pools opened by the client, one entry per host.
+
+        Returns
+        -------
+        list
+            list of dict with keys `host`, `maxsize`, `num_connections`, `num_requests`
+            and `idle_connections`
+        """
+        pool_stats = []
+        adapters = {id(adapter): adapter for adapter in self.session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is None or pool.pool is None:
+                    continue
+                pool_stats.append(
+                    {
+                        "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                        "maxsize": pool.pool.maxsize,
+                        "num_connections": pool.num_connections,
+                        "num_requests": pool.num_requests,
+                        "idle_connections": sum(
+                            1 for conn in list(pool.pool.queue) if conn is not None
+                        ),
+                    }
+                )
+        return pool_stats
+
+    def log_pool_stats(self, level=logging.INFO):
+        """
+        Log the statistics of the connection pools.
+
+        Parameters
+        ----------
+        level : int
+            logging level
+        """
+        for stats in self.get_pool_stats():
+            logger.log(
+                level,
+                "MTD - HTTP POOL %(host)s : %(num_requests)s requests over %(num_connections)s"
+                " connections (%(idle_connections)s idle, max %(maxsize)s)" % stats,
+            )
+
+    def close(self):
+        """
+        Close the session and every pooled connection.
+        """
+        self.session.close()
+
+
+def get_http_client() -> MTDHttpClient:
+    """
+    Return the HTTP client shared by the whole module, creating it from configuration on first call.
+
+    Returns
+    -------
+    MTDHttpClient
+        the shared HTTP client
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                configuration_mtd = config["MTD_SYNC"]
+                _http_client = MTDHttpClient(
+                    pool_connections=configuration_mtd["HTTP_POOL_CONNECTIONS"],
+                    pool_maxsize=configuration_mtd["HTTP_POOL_MAXSIZE"],
+                    pool_maxsize_by_host=configuration_mtd["HTTP_POOL_MAXSIZE_BY_HOST"],
+                    connect_timeout=configuration_mtd["HTTP_CONNECT_TIMEOUT"],
+                    read_timeout=configuration_mtd["HTTP_READ_TIMEOUT"],
+                )
+    return _http_client
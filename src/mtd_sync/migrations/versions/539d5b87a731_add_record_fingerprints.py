@@ -0,0 +1,32 @@
+"""add the fingerprints of the synchronized records
+
+Revision ID: 539d5b87a731
+Revises: f0d38e421d9a
+Create Date: 2026-10-17 11:03:27.904716
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+# revision identifiers, used by Alembic.
+revision = "539d5b87a731"
+down_revision = "f0d38e421d9a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "t_record_fingerprints",
+        sa.Column("object_type", sa.Unicode(2), primary_key=True),
+        sa.Column("unique_id", UUID(as_uuid=True), primary_key=True),
+        sa.Column("fingerprint", sa.Unicode(64), nullable=False),
+        sa.Column("meta_update_date", sa.DateTime, server_default=sa.func.now()),
+        schema="gn_mtd_sync",
+    )
+
+
+def downgrade():
+    op.drop_table("t_record_fingerprints", schema="gn_mtd_sync")
@@ -0,0 +1,30 @@
+"""add the dates of the last per-user synchronizations
+
+Revision ID: 7c2e5b19d4a6
+Revises: 539d5b87a731
+Create Date: 2026-10-17 15:24:08.611437
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "7c2e5b19d4a6"
+down_revision = "539d5b87a731"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "t_user_sync_freshness",
+        sa.Column("id_role", sa.Integer, primary_key=True),
+        sa.Column("id_af", sa.Integer, primary_key=True),
+        sa.Column("last_sync_date", sa.DateTime, nullable=False),
+        schema="gn_mtd_sync",
+    )
+
+
+def downgrade():
+    op.drop_table("t_user_sync_freshness", schema="gn_mtd_sync")
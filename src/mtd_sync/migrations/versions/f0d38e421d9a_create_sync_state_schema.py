@@ -0,0 +1,33 @@
+"""create gn_mtd_sync schema with the synchronization watermarks
+
+Revision ID: f0d38e421d9a
+Revises:
+Create Date: 2026-10-17 09:12:41.518204
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "f0d38e421d9a"
+down_revision = None
+branch_labels = ("mtd_sync",)
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE SCHEMA gn_mtd_sync")
+    op.create_table(
+        "t_sync_watermarks",
+        sa.Column("id_instance", sa.Integer, primary_key=True),
+        sa.Column("object_type", sa.Unicode(2), primary_key=True),
+        sa.Column("watermark", sa.DateTime, nullable=False),
+        sa.Column("meta_update_date", sa.DateTime, server_default=sa.func.now()),
+        schema="gn_mtd_sync",
+    )
+
+
+def downgrade():
+    op.drop_table("t_sync_watermarks", schema="gn_mtd_sync")
+    op.execute("DROP SCHEMA gn_mtd_sync")
@@ -0,0 +1,50 @@
+from geonature.utils.env import DB
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import UUID
+
+
+class TSyncWatermark(DB.Model):
+    """
+    High-water mark of a global synchronization: the most recent update date of the acquisition
+    frameworks (`object_type` "AF") or of the datasets ("DS") of an instance of
+    'INPN Métadonnées', as of the last synchronization that completed.
+
+    `id_instance` is 0 when the synchronization is not filtered on an instance.
+    """
+
+    __tablename__ = "t_sync_watermarks"
+    __table_args__ = {"schema": "gn_mtd_sync"}
+
+    id_instance = DB.Column(DB.Integer, primary_key=True)
+    object_type = DB.Column(DB.Unicode(2), primary_key=True)
+    watermark = DB.Column(DB.DateTime, nullable=False)
+    meta_update_date = DB.Column(DB.DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class TRecordFingerprint(DB.Model):
+    """
+    Fingerprint of the content of an acquisition framework (`object_type` "AF") or of a dataset
+    ("DS"), as parsed from 'INPN Métadonnées' when it was last written to the database.
+    """
+
+    __tablename__ = "t_record_fingerprints"
+    __table_args__ = {"schema": "gn_mtd_sync"}
+
+    object_type = DB.Column(DB.Unicode(2), primary_key=True)
+    unique_id = DB.Column(UUID(as_uuid=True), primary_key=True)
+    fingerprint = DB.Column(DB.Unicode(64), nullable=False)
+    meta_update_date = DB.Column(DB.DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class TUserSyncFreshness(DB.Model):
+    """
+    Date of the last successful synchronization of a user, for all its metadata (`id_af` 0) or
+    restricted to an acquisition framework.
+    """
+
+    __tablename__ = "t_user_sync_freshness"
+    __table_args__ = {"schema": "gn_mtd_sync"}
+
+    id_role = DB.Column(DB.Integer, primary_key=True)
+    id_af = DB.Column(DB.Integer, primary_key=True)
+    last_sync_date = DB.Column(DB.DateTime, nullable=False)
@@ -1,6 +1,14 @@
+from collections import Counter
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from contextlib import nullcontext
+from functools import partial
 import logging
+import threading
+import time
 from urllib.parse import urljoin
 
+from flask import current_app
 from lxml import etree
 import requests
 
@@ -9,18 +17,50 @@ from geonature.core.gn_meta.models import (
     CorAcquisitionFrameworkActor,
     CorDatasetActor,
     TAcquisitionFramework,
+    TDatasets,
 )
 
 from geonature.utils.config import config
 from geonature.utils.env import db
 
-from pypnnomenclature.models import TNomenclatures
 from pypnusershub.db.models import User
 from pypnusershub.auth.providers.cas_inpn_provider import *
 from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
 
-from .mtd_utils import associate_actors, sync_af, sync_ds, insert_user_and_org
+from .http_client import get_http_client
+from .resolvers import SyncContext, to_uuid
+from .sync_lock import global_sync_lock, user_sync_lock
+from .staging import merge_actor_links, merge_af_list, merge_ds_list
+from .sync_state import (
+    cap_watermark,
+    filter_changed_records,
+    filter_unchanged_fingerprints,
+    get_max_update_date,
+    get_watermarks,
+    set_user_sync_fresh,
+    set_watermarks,
+    store_fingerprints,
+)
+from .xml_cache import get_xml_cache
+from .mtd_utils import (
+    CasAuthentificationError,
+    associate_actors,
+    associate_datasets_modules,
+    format_sqlalchemy_error_for_logging,
+    get_actor_rows,
+    get_dataset_module_ids,
+    get_or_create_orphan_contact_user,
+    insert_user_and_org,
+    sync_af,
+    sync_af_list,
+    sync_ds,
+    sync_ds_list,
+    write_actor_rows,
+)
 from .xml_parser import (
+    iter_acquisition_frameworks_xml,
+    iter_jdd_xml,
     parse_single_acquisition_framework_xml,
     parse_jdd_xml,
     parse_acquisition_frameworks_xml,
@@ -43,7 +83,13 @@ logger.propagate = False
 
 if level_log_mtd_sync == "DEBUG":
     from sqlalchemy import exists
-    from geonature.core.gn_meta.models.datasets import TDatasets
+
+
+class FetchCancelled(Exception):
+    """
+    Raised by `MTDInstanceApi` when its cancellation event is set, e.g. as the synchronization
+    ran over its time budget.
+    """
 
 
 class MTDInstanceApi:
@@ -52,37 +98,171 @@ class MTDInstanceApi:
     ds_user_path = "/mtd/cadre/jdd/export/xml/GetRecordsByUserId?id={ID_ROLE}"
     af_user_path = "/mtd/cadre/export/xml/GetRecordsByUserId?id={ID_ROLE}"
     single_af_path = "/mtd/cadre/export/xml/GetRecordById?id={ID_AF}"  # NOTE: `ID_AF` is actually an UUID and not an ID from the point of view of geonature database.
+    xml_chunk_size = 64 * 1024
 
     # https://inpn.mnhn.fr/mtd/cadre/jdd/export/xml/GetRecordsByUserId?id=41542"
-    def __init__(self, api_endpoint, instance_id, id_role=None):
+    def __init__(self, api_endpoint, instance_id, id_role=None, xml_cache=None, cancel_event=None):
         self.api_endpoint = api_endpoint
         self.instance_id = instance_id
         self.id_role = id_role
+        self.xml_cache = xml_cache
+        # URLs of the responses to be committed to the XML cache once they have been synchronized
+        self._pending_cache_urls = []
+        # Number of records skipped by the parsers, by reason
+        self.parse_stats = Counter()
+        # Once set, the requests not sent yet and the downloads in progress are cancelled
+        self.cancel_event = cancel_event or threading.Event()
 
-    def _get_xml_by_url(self, url):
+    def _check_cancelled(self, url):
+        if self.cancel_event.is_set():
+            logger.info("MTD - REQUEST CANCELLED : %s" % url)
+            raise FetchCancelled(url)
+
+    def _get_response(self, url, headers=None, stream=False):
+        self._check_cancelled(url)
         logger.debug("MTD - REQUEST : %s" % url)
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.content
+        response = get_http_client().get(url, headers=headers, stream=stream)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def _get_xml_by_url(self, url):
+        # Streamed too, so that the download can be cancelled
+        response = self._get_response(url, stream=True)
+        return b"".join(self._iter_response_chunks(response))
+
+    def _iter_response_chunks(self, response):
+        try:
+            for chunk in response.iter_content(chunk_size=self.xml_chunk_size):
+                # Closing the response stops the download
+                self._check_cancelled(response.url)
+                yield chunk
+        finally:
+            response.close()
 
     def _get_xml(self, path):
+        """
+        Retrieve an instance-wide XML export, streamed by chunks.
+
+        If the XML cache is enabled, the request is conditional on the validators of the last
+        synchronized response for the same URL, and the response is spooled to the cache.
+
+        Returns
+        -------
+        Iterator[bytes] or None
+            the chunks of the XML, or None if it has not been modified since the last synchronization
+        """
         url = urljoin(self.api_endpoint, path)
         url = url.format(ID_INSTANCE=self.instance_id)
-        return self._get_xml_by_url(url)
+        headers = None
+        if self.xml_cache is not None:
+            headers = self.xml_cache.get_conditional_headers(url)
+        response = self._get_response(url, headers=headers, stream=True)
+        if response.status_code == 304:
+            response.close()
+            logger.info("MTD - NOT MODIFIED SINCE LAST SYNC : %s" % url)
+            return None
+        xml_chunks = self._iter_response_chunks(response)
+        if self.xml_cache is not None:
+            xml_chunks = self.xml_cache.spool(
+                url,
+                xml_chunks,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+            self._pending_cache_urls.append(url)
+        return xml_chunks
+
+    def commit_xml_cache(self):
+        """
+        Commit to the XML cache the responses retrieved by `_get_xml`.
+
+        Must be called only once the responses have been successfully synchronized: otherwise
+        the next synchronization would be skipped for data that has never been written.
+        """
+        if self.xml_cache is None:
+            return
+        for url in self._pending_cache_urls:
+            self.xml_cache.commit(url)
+        self._pending_cache_urls = []
+
+    def log_parse_stats(self):
+        """
+        Log the number of records skipped by the parsers because not associated to the instance.
+        """
+        if self.parse_stats:
+            logger.info(
+                f"MTD - {self.parse_stats['af_skipped_instance']} AF and {self.parse_stats['ds_skipped_instance']} DS skipped"
+                f" - not associated to the instance with ID_INSTANCE_FILTER '{self.instance_id}'"
+            )
 
     def _get_af_xml(self):
         return self._get_xml(self.af_path)
 
+    def iter_af_list(self):
+        """
+        Retrieve the acquisition frameworks (af) of the instance, parsed while being downloaded.
+
+        Returns
+        -------
+        Iterator[dict] or None
+            A generator of acquisition frameworks, or None if unchanged since the last synchronization.
+        """
+        xml_chunks = self._get_af_xml()
+        if xml_chunks is None:
+            return None
+        return iter_acquisition_frameworks_xml(xml_chunks, stats=self.parse_stats)
+
     def get_af_list(self) -> list:
-        xml = self._get_af_xml()
-        return parse_acquisition_frameworks_xml(xml)
+        """
+        Retrieve the list of acquisition frameworks (af) of the instance.
+
+        The XML is parsed while being downloaded, but the records are all held in memory: the
+        synchronization filters them, then writes the DS after the AF, as a whole.
+
+        Returns
+        -------
+        list or None
+            A list of acquisition frameworks, or None if unchanged since the last synchronization.
+        """
+        af_iter = self.iter_af_list()
+        if af_iter is None:
+            return None
+        return list(af_iter)
 
     def _get_ds_xml(self):
         return self._get_xml(self.ds_path)
 
+    def iter_ds_list(self):
+        """
+        Retrieve the datasets (ds) of the instance, parsed while being downloaded.
+
+        Returns
+        -------
+        Iterator[dict] or None
+            A generator of datasets, or None if unchanged since the last synchronization.
+        """
+        xml_chunks = self._get_ds_xml()
+        if xml_chunks is None:
+            return None
+        return iter_jdd_xml(xml_chunks, stats=self.parse_stats)
+
     def get_ds_list(self) -> list:
-        xml = self._get_ds_xml()
-        return parse_jdd_xml(xml)
+        """
+        Retrieve the list of datasets (ds) of the instance.
+
+        The XML is parsed while being downloaded, but the records are all held in memory: the
+        synchronization filters them, then writes the DS after the AF, as a whole.
+
+        Returns
+        -------
+        list or None
+            A list of datasets, or None if unchanged since the last synchronization.
+        """
+        ds_iter = self.iter_ds_list()
+        if ds_iter is None:
+            return None
+        return list(ds_iter)
 
     def get_ds_user_list(self):
         """
@@ -104,7 +284,7 @@ class MTDInstanceApi:
                 warning_message = f"""{warning_message} > Probably no dataset found for the user with ID '{self.id_role}'"""
             logger.warning(warning_message)
             return []
-        ds_list = parse_jdd_xml(xml)
+        ds_list = parse_jdd_xml(xml, stats=self.parse_stats)
         return ds_list
 
     def get_list_af_for_user(self):
@@ -126,7 +306,7 @@ class MTDInstanceApi:
                 warning_message = f"""{warning_message} > Probably no acquisition framework found for the user with ID '{self.id_role}'"""
             logger.warning(warning_message)
             return []
-        af_list = parse_acquisition_frameworks_xml(xml)
+        af_list = parse_acquisition_frameworks_xml(xml, stats=self.parse_stats)
         return af_list
 
     def get_single_af(self, af_uuid):
@@ -159,7 +339,13 @@ class INPNCAS:
     def _get_user_json(cls, user_id):
         url = urljoin(cls.base_url, cls.id_search_path)
         url = url.format(user_id=user_id)
-        response = requests.get(url, auth=(cls.user, cls.password))
+        try:
+            response = get_http_client().get(url, auth=(cls.user, cls.password))
+        except requests.RequestException as error:
+            # e.g. a read timeout, as the shared client sets a default timeout
+            raise CasAuthentificationError(
+                message="Error while requesting URL {}: {}".format(url, error), status_code=500
+            )
         if response.status_code == 200:
             return response.json()
 
@@ -181,7 +367,14 @@ def add_unexisting_digitizer(id_digitizer):
         > 0
     ):
         # not fast - need perf optimization on user call
-        user = INPNCAS.get_user(id_digitizer)
+        try:
+            user = INPNCAS.get_user(id_digitizer)
+        except CasAuthentificationError as error:
+            # The digitizer is skipped, not the whole synchronization
+            logger.warning(
+                f"MTD - DIGITIZER WITH ID '{id_digitizer}' NOT RETRIEVED - SKIPPING : {error.message}"
+            )
+            return None
         if not user:
             return None
         # to avoid to create org
@@ -192,139 +385,940 @@ def add_unexisting_digitizer(id_digitizer):
         return user
 
 
-def process_af_and_ds(af_list, ds_list, id_role=None):
+def add_unexisting_digitizers(records, id_role=None):
     """
-    Synchro AF<array>, Synchro DS<array>
+    Create the digitizers of AFs or DS, checking each distinct digitizer once.
 
-    :param af_list: list af
-    :param ds_list: list ds
+    :param records: list of AF or DS
     :param id_role: use role id pass on user authent only
     """
-    cas_api = INPNCAS()
-    # read nomenclatures from DB to avoid errors if GN nomenclature is not the same
-    list_cd_nomenclature = db.session.scalars(
-        select(TNomenclatures.cd_nomenclature).distinct()
-    ).all()
-    nb_af = len(af_list)
-    nb_ds = len(ds_list)
-    logger.info(f"Number of AF to process : {nb_af}")
-    logger.info(f"Number of DS to process : {nb_ds}")
-    if level_log_mtd_sync == "DEBUG":
-        nb_updated_af = 0
-        nb_updated_ds = 0
-        nb_retrieved_new_af = 0
-        nb_retrieved_new_ds = 0
-    logger.debug("MTD - PROCESS AF LIST")
-    for af in af_list:
-        actors = af.pop("actors")
+    id_digitizers = (
+        [id_role] if id_role else dict.fromkeys(record["id_digitizer"] for record in records)
+    )
+    for id_digitizer in id_digitizers:
         with db.session.begin_nested():
-            add_unexisting_digitizer(af["id_digitizer"] if not id_role else id_role)
-        if level_log_mtd_sync == "DEBUG":
-            af_already_exists = db.session.scalar(
-                exists()
-                .where(
-                    TAcquisitionFramework.unique_acquisition_framework_id
-                    == af["unique_acquisition_framework_id"]
+            add_unexisting_digitizer(id_digitizer)
+
+
+def process_in_batches(
+    records_with_actors,
+    process_record,
+    type_mtd,
+    uuid_field,
+    written_uuids: set = None,
+    failed_uuids: set = None,
+    deadline: float = None,
+    remaining: list = None,
+):
+    """
+    Process records in batches of `SYNC_COMMIT_BATCH_SIZE` records, each batch in a savepoint,
+    and commit after each batch. A batch is also closed once it has lasted for
+    `SYNC_COMMIT_BATCH_SECONDS` seconds. Past the deadline, no batch is started anymore.
+
+    If a record fails because of a database error, its batch is rolled back to its savepoint and
+    replayed record by record, each in its own savepoint, so that only the failing records are
+    left out.
+
+    Parameters
+    ----------
+    records_with_actors : list
+        list of tuple of a record - AF or DS - and its actors
+    process_record : callable
+        function synchronizing a record and its actors, returning None if the record is skipped
+    type_mtd : str
+        "AF" or "DS"
+    uuid_field : str
+        name of the UUID field of the records
+    written_uuids : set, optional
+        if provided, the UUIDs of the records synchronized are added to it, once committed
+    failed_uuids : set, optional
+        if provided, the UUIDs of the records failing on a database error are added to it
+    deadline : float, optional
+        `time.monotonic()` past which no batch is started
+    remaining : list, optional
+        if provided, the records - with their actors - not processed as the deadline passed are
+        added to it
+
+    Returns
+    -------
+    Counter
+        number of records `synchronized`, `skipped` and `failed`
+    """
+    batch_size = configuration_mtd["SYNC_COMMIT_BATCH_SIZE"]
+    batch_seconds = configuration_mtd["SYNC_COMMIT_BATCH_SECONDS"]
+    counts = Counter()
+    if written_uuids is None:
+        written_uuids = set()
+    if failed_uuids is None:
+        failed_uuids = set()
+    if remaining is None:
+        remaining = []
+
+    def get_uuid(record_with_actors):
+        return to_uuid(record_with_actors[0][uuid_field])
+
+    def replay(batch):
+        for record_with_actors in batch:
+            try:
+                with db.session.begin_nested():
+                    result = process_record(record_with_actors)
+            except SQLAlchemyError as error:
+                logger.error(
+                    f"MTD - DB ERROR - synchronization failed for {type_mtd} with UUID '{record_with_actors[0][uuid_field]}':\n"
+                    + format_sqlalchemy_error_for_logging(error)
                 )
-                .select()
+                counts["failed"] += 1
+                failed_uuids.add(get_uuid(record_with_actors))
+                continue
+            counts["synchronized" if result is not None else "skipped"] += 1
+            if result is not None:
+                written_uuids.add(get_uuid(record_with_actors))
+
+    batch = []
+    batch_counts = Counter()
+    batch_written = []
+    records_with_actors = iter(records_with_actors)
+    for record_with_actors in records_with_actors:
+        if not batch and deadline is not None and time.monotonic() >= deadline:
+            remaining.append(record_with_actors)
+            remaining.extend(records_with_actors)
+            break
+        if not batch:
+            savepoint = db.session.begin_nested()
+            batch_start = time.monotonic()
+        batch.append(record_with_actors)
+        try:
+            result = process_record(record_with_actors)
+        except SQLAlchemyError:
+            savepoint.rollback()
+            logger.warning(
+                f"MTD - DB ERROR in a batch of {len(batch)} {type_mtd} - REPLAYING THE BATCH RECORD BY RECORD"
             )
-        af = sync_af(af)
-        # TODO: choose whether or not to commit retrieval of the AF before association of actors
-        #   and possibly retrieve an AF without any actor associated to it
-        # Commit here to retrieve the AF even if the association of actors that follows is to fail
+            replay(batch)
+            db.session.commit()
+            batch, batch_counts, batch_written = [], Counter(), []
+            continue
+        batch_counts["synchronized" if result is not None else "skipped"] += 1
+        if result is not None:
+            batch_written.append(get_uuid(record_with_actors))
+        if len(batch) >= batch_size or time.monotonic() - batch_start >= batch_seconds:
+            savepoint.commit()
+            db.session.commit()
+            counts.update(batch_counts)
+            written_uuids.update(batch_written)
+            batch, batch_counts, batch_written = [], Counter(), []
+    if batch:
+        savepoint.commit()
         db.session.commit()
-        # If the AF has not been retrieved, associated actors cannot be retrieved either
-        #   and thus we continue to the next AF
+        counts.update(batch_counts)
+        written_uuids.update(batch_written)
+    return counts
+
+
+def process_af_list_batched(af_list, context, id_role=None):
+    """
+    Synchronize a list of acquisition frameworks (AF) and associate their actors, committing by
+    batches - see `process_in_batches`.
+
+    Parameters
+    ----------
+    af_list : list
+        list of AF
+    context : SyncContext
+        resolvers of the nomenclatures, organisms and users, and report of the synchronization
+    id_role : int, optional
+        use role id pass on user authent only
+    """
+    add_unexisting_digitizers(af_list, id_role)
+
+    def process_af(af_with_actors):
+        af, actors = af_with_actors
+        # Synchronize a copy, as the AF may be replayed
+        af = sync_af(dict(af), context.report)
         if af is not None:
-            if level_log_mtd_sync == "DEBUG":
-                if af_already_exists:
-                    nb_updated_af += 1
-                else:
-                    nb_retrieved_new_af += 1
             associate_actors(
                 actors,
                 CorAcquisitionFrameworkActor,
                 "id_acquisition_framework",
                 af.id_acquisition_framework,
                 af.unique_acquisition_framework_id,
+                context,
             )
-        # TODO: remove actors removed from MTD
-    db.session.commit()
-    logger.debug("MTD - PROCESS DS LIST")
-    for ds in ds_list:
-        actors = ds.pop("actors")
-        # CREATE DIGITIZER
-        with db.session.begin_nested():
-            if not id_role:
-                add_unexisting_digitizer(ds["id_digitizer"])
-            else:
-                add_unexisting_digitizer(id_role)
-        if level_log_mtd_sync == "DEBUG":
-            ds_already_exists = db.session.scalar(
-                exists()
-                .where(
-                    TDatasets.unique_dataset_id == ds["unique_dataset_id"],
-                )
-                .select()
-            )
-        ds = sync_ds(ds, list_cd_nomenclature)
+        return af
+
+    remaining = []
+    counts = process_in_batches(
+        [(af, af.pop("actors")) for af in af_list],
+        process_af,
+        "AF",
+        "unique_acquisition_framework_id",
+        written_uuids=context.written_uuids["AF"],
+        failed_uuids=context.failed_uuids["AF"],
+        deadline=context.deadline,
+        remaining=remaining,
+    )
+    # Left for later with their actors, as they have been popped
+    for af, actors in remaining:
+        af["actors"] = actors
+        context.remaining["AF"].append(af)
+    logger.info(
+        f"MTD - {len(af_list)} AF processed : {counts['synchronized']} AF retrieved or updated + {counts['skipped']} AF skipped + {counts['failed']} AF failed"
+    )
+
+
+def process_ds_list_batched(ds_list, context, id_role=None):
+    """
+    Synchronize a list of datasets (DS) and associate their actors, committing by batches - see
+    `process_in_batches`.
+
+    Parameters
+    ----------
+    ds_list : list
+        list of DS
+    context : SyncContext
+        resolvers of the nomenclatures, organisms and users, and report of the synchronization
+    id_role : int, optional
+        use role id pass on user authent only
+    """
+    add_unexisting_digitizers(ds_list, id_role)
+
+    def process_ds(ds_with_actors):
+        ds, actors = ds_with_actors
+        # Synchronize a copy, as the DS may be replayed
+        ds = sync_ds(dict(ds), context.nomenclatures, context.report, context.id_dataset_modules)
         if ds is not None:
-            if level_log_mtd_sync == "DEBUG":
-                if ds_already_exists:
-                    nb_updated_ds += 1
-                else:
-                    nb_retrieved_new_ds += 1
             associate_actors(
                 actors,
                 CorDatasetActor,
                 "id_dataset",
                 ds.id_dataset,
                 ds.unique_dataset_id,
+                context,
+            )
+        return ds
+
+    remaining = []
+    counts = process_in_batches(
+        [(ds, ds.pop("actors")) for ds in ds_list],
+        process_ds,
+        "DS",
+        "unique_dataset_id",
+        written_uuids=context.written_uuids["DS"],
+        failed_uuids=context.failed_uuids["DS"],
+        deadline=context.deadline,
+        remaining=remaining,
+    )
+    # Left for later with their actors, as they have been popped
+    for ds, actors in remaining:
+        ds["actors"] = actors
+        context.remaining["DS"].append(ds)
+    logger.info(
+        f"MTD - {len(ds_list)} DS processed : {counts['synchronized']} DS retrieved or updated + {counts['skipped']} DS skipped + {counts['failed']} DS failed"
+    )
+
+
+def process_af_list_bulk(af_list, context, id_role=None):
+    """
+    Synchronize a list of acquisition frameworks (AF) with set-based statements, then associate
+    their actors.
+
+    The digitizers are checked once per distinct digitizer, and the AFs are upserted by chunks of
+    `SYNC_BULK_CHUNK_SIZE` AFs - see `sync_af_list`.
+
+    Parameters
+    ----------
+    af_list : list
+        list of AF
+    context : SyncContext
+        resolvers of the nomenclatures, organisms and users, and report of the synchronization
+    id_role : int, optional
+        use role id pass on user authent only
+    """
+    actors_by_af = [(af, af.pop("actors")) for af in af_list]
+    add_unexisting_digitizers(af_list, id_role)
+    af_ids, counts = sync_af_list(af_list, chunk_size=configuration_mtd["SYNC_BULK_CHUNK_SIZE"])
+    # Commit here to retrieve the AFs even if the association of actors that follows is to fail
+    db.session.commit()
+    logger.info(
+        f"MTD - {len(af_list)} AF processed : {counts['inserted']} new AF retrieved + {counts['updated']} AF updated + {counts['unchanged']} AF unchanged + {counts['skipped']} AF skipped"
+    )
+    for outcome in ("inserted", "updated", "unchanged"):
+        context.report[f"af_{outcome}"] += counts[outcome]
+    context.written_uuids["AF"].update(map(to_uuid, af_ids))
+    context.organisms.prepare(actor for af, actors in actors_by_af for actor in actors)
+    context.roles.prepare(
+        actor["email"]
+        for af, actors in actors_by_af
+        for actor in actors
+        if not context.organisms.get_id(actor)
+    )
+    actor_rows = []
+    for af, actors in actors_by_af:
+        af_uuid = af["unique_acquisition_framework_id"]
+        if af_uuid in af_ids:
+            actor_rows.extend(
+                get_actor_rows(
+                    actors,
+                    "id_acquisition_framework",
+                    af_ids[af_uuid],
+                    af_uuid,
+                    context,
+                )
+            )
+    write_actor_rows(
+        CorAcquisitionFrameworkActor,
+        "id_acquisition_framework",
+        actor_rows,
+        chunk_size=configuration_mtd["SYNC_BULK_CHUNK_SIZE"],
+        failed_uuids=context.failed_uuids["AF"],
+    )
+
+
+def process_ds_list_bulk(ds_list, context, id_role=None):
+    """
+    Synchronize a list of datasets (DS) with set-based statements, then associate their actors.
+
+    The digitizers are checked once per distinct digitizer, and the DS are upserted by chunks of
+    `SYNC_BULK_CHUNK_SIZE` DS - see `sync_ds_list`. New DS are associated to the modules.
+
+    Parameters
+    ----------
+    ds_list : list
+        list of DS
+    context : SyncContext
+        resolvers of the nomenclatures, organisms and users, and report of the synchronization
+    id_role : int, optional
+        use role id pass on user authent only
+    """
+    actors_by_ds = [(ds, ds.pop("actors")) for ds in ds_list]
+    add_unexisting_digitizers(ds_list, id_role)
+    ds_ids, outcomes = sync_ds_list(
+        ds_list, context.nomenclatures, chunk_size=configuration_mtd["SYNC_BULK_CHUNK_SIZE"]
+    )
+    counts = Counter(outcomes)
+    logger.info(
+        f"MTD - {len(ds_list)} DS processed : {counts['inserted']} new DS retrieved + {counts['updated']} DS updated + {counts['unchanged']} DS unchanged + {counts['skipped']} DS skipped"
+    )
+    for outcome in ("inserted", "updated", "unchanged"):
+        context.report[f"ds_{outcome}"] += counts[outcome]
+    context.written_uuids["DS"].update(map(to_uuid, ds_ids))
+    # Associate new datasets to the modules
+    associate_datasets_modules(
+        {
+            ds_ids[ds["unique_dataset_id"]]
+            for ds, outcome in zip(ds_list, outcomes)
+            if outcome == "inserted"
+        },
+        context.id_dataset_modules,
+        chunk_size=configuration_mtd["SYNC_BULK_CHUNK_SIZE"],
+    )
+    context.organisms.prepare(actor for ds, actors in actors_by_ds for actor in actors)
+    context.roles.prepare(
+        actor["email"]
+        for ds, actors in actors_by_ds
+        for actor in actors
+        if not context.organisms.get_id(actor)
+    )
+    actor_rows = []
+    for ds, actors in actors_by_ds:
+        ds_uuid = ds["unique_dataset_id"]
+        if ds_uuid in ds_ids:
+            actor_rows.extend(
+                get_actor_rows(actors, "id_dataset", ds_ids[ds_uuid], ds_uuid, context)
+            )
+    write_actor_rows(
+        CorDatasetActor,
+        "id_dataset",
+        actor_rows,
+        chunk_size=configuration_mtd["SYNC_BULK_CHUNK_SIZE"],
+        failed_uuids=context.failed_uuids["DS"],
+    )
+
+
+def process_af_list_copy(af_list, context, id_role=None):
+    """
+    Synchronize a list of acquisition frameworks (AF), then associate their actors, loading them
+    into staging tables with `COPY` and merging them with set-based statements - see
+    `merge_af_list` and `merge_actor_links`.
+
+    Parameters
+    ----------
+    af_list : list
+        list of AF
+    context : SyncContext
+        resolvers of the nomenclatures, organisms and users, and report of the synchronization
+    id_role : int, optional
+        use role id pass on user authent only
+    """
+    actors_by_af = [(af, af.pop("actors")) for af in af_list]
+    add_unexisting_digitizers(af_list, id_role)
+    af_uuids, counts = merge_af_list(af_list)
+    # Commit here to retrieve the AFs even if the association of actors that follows is to fail
+    db.session.commit()
+    logger.info(
+        f"MTD - {len(af_list)} AF processed : {counts['inserted']} new AF retrieved + {counts['updated']} AF updated + {counts['unchanged']} AF unchanged + {counts['skipped']} AF skipped"
+    )
+    for outcome in ("inserted", "updated", "unchanged"):
+        context.report[f"af_{outcome}"] += counts[outcome]
+    context.written_uuids["AF"].update(af_uuids)
+    context.organisms.prepare(actor for af, actors in actors_by_af for actor in actors)
+    context.roles.prepare(
+        actor["email"]
+        for af, actors in actors_by_af
+        for actor in actors
+        if not context.organisms.get_id(actor)
+    )
+    actor_rows = []
+    for af, actors in actors_by_af:
+        af_uuid = to_uuid(af["unique_acquisition_framework_id"])
+        if af_uuid in af_uuids:
+            actor_rows.extend(
+                get_actor_rows(actors, "id_acquisition_framework", af_uuid, af_uuid, context)
             )
+    merge_actor_links(
+        CorAcquisitionFrameworkActor,
+        "id_acquisition_framework",
+        TAcquisitionFramework.unique_acquisition_framework_id,
+        actor_rows,
+        chunk_size=configuration_mtd["SYNC_BULK_CHUNK_SIZE"],
+        failed_uuids=context.failed_uuids["AF"],
+    )
+
+
+def process_ds_list_copy(ds_list, context, id_role=None):
+    """
+    Synchronize a list of datasets (DS), then associate their actors, loading them into staging
+    tables with `COPY` and merging them with set-based statements - see `merge_ds_list` and
+    `merge_actor_links`. New DS are associated to the modules.
+
+    Parameters
+    ----------
+    ds_list : list
+        list of DS
+    context : SyncContext
+        resolvers of the nomenclatures, organisms and users, and report of the synchronization
+    id_role : int, optional
+        use role id pass on user authent only
+    """
+    actors_by_ds = [(ds, ds.pop("actors")) for ds in ds_list]
+    add_unexisting_digitizers(ds_list, id_role)
+    ds_uuids, id_new_datasets, counts = merge_ds_list(ds_list)
+    logger.info(
+        f"MTD - {len(ds_list)} DS processed : {counts['inserted']} new DS retrieved + {counts['updated']} DS updated + {counts['unchanged']} DS unchanged + {counts['skipped']} DS skipped"
+    )
+    for outcome in ("inserted", "updated", "unchanged"):
+        context.report[f"ds_{outcome}"] += counts[outcome]
+    context.written_uuids["DS"].update(ds_uuids)
+    # Associate new datasets to the modules
+    associate_datasets_modules(
+        id_new_datasets,
+        context.id_dataset_modules,
+        chunk_size=configuration_mtd["SYNC_BULK_CHUNK_SIZE"],
+    )
+    context.organisms.prepare(actor for ds, actors in actors_by_ds for actor in actors)
+    context.roles.prepare(
+        actor["email"]
+        for ds, actors in actors_by_ds
+        for actor in actors
+        if not context.organisms.get_id(actor)
+    )
+    actor_rows = []
+    for ds, actors in actors_by_ds:
+        ds_uuid = to_uuid(ds["unique_dataset_id"])
+        if ds_uuid in ds_uuids:
+            actor_rows.extend(get_actor_rows(actors, "id_dataset", ds_uuid, ds_uuid, context))
+    merge_actor_links(
+        CorDatasetActor,
+        "id_dataset",
+        TDatasets.unique_dataset_id,
+        actor_rows,
+        chunk_size=configuration_mtd["SYNC_BULK_CHUNK_SIZE"],
+        failed_uuids=context.failed_uuids["DS"],
+    )
+
+
+def process_af_and_ds(af_list, ds_list, id_role=None, sync_engine=None, deadline=None):
+    """
+    Synchro AF<array>, Synchro DS<array>
+
+    :param af_list: list af
+    :param ds_list: list ds
+    :param id_role: use role id pass on user authent only
+    :param sync_engine: "record", "bulk" or "copy", `SYNC_ENGINE` by default
+    :param deadline: `time.monotonic()` past which the writes stop - between the AF and the DS, and between two records or batches with the "record" engine - and `SyncBudgetExceeded` is raised, resuming the records not processed
+    :return: <dict> AF and DS which failed - on a database error, or with actors failing to be associated - by object type ("AF", "DS"). The records skipped by validation, e.g. a DS whose AF is not in the database, are not returned.
+    """
+    cas_api = INPNCAS()
+    # Nomenclatures are resolved by mnemonique by the shared resolver, refreshed from the DB once per sync
+    context = SyncContext(chunk_size=configuration_mtd["SYNC_BULK_CHUNK_SIZE"], deadline=deadline)
+    if configuration_mtd["SYNC_FINGERPRINTS"]:
+        chunk_size = configuration_mtd["SYNC_BULK_CHUNK_SIZE"]
+        nb_parsed_af, nb_parsed_ds = len(af_list), len(ds_list)
+        af_list, af_fingerprints = filter_unchanged_fingerprints(
+            af_list,
+            TAcquisitionFramework.unique_acquisition_framework_id,
+            "unique_acquisition_framework_id",
+            "AF",
+            chunk_size,
+        )
+        ds_list, ds_fingerprints = filter_unchanged_fingerprints(
+            ds_list, TDatasets.unique_dataset_id, "unique_dataset_id", "DS", chunk_size
+        )
+        context.report["fingerprint_hits"] += (
+            nb_parsed_af - len(af_list) + nb_parsed_ds - len(ds_list)
+        )
+        context.report["fingerprint_misses"] += len(af_list) + len(ds_list)
+    if af_list:
+        # Ensured here as the user is committed on creation: actor associations do not commit
+        context.id_orphan_contact = get_or_create_orphan_contact_user()
+    if ds_list:
+        context.id_dataset_modules = get_dataset_module_ids()
+    sync_engine = sync_engine or configuration_mtd["SYNC_ENGINE"]
+    # Transaction batching only applies to the "record" engine
+    is_batched = sync_engine == "record" and configuration_mtd["SYNC_COMMIT_BATCH_SIZE"] > 0
+    nb_af = len(af_list)
+    nb_ds = len(ds_list)
+    logger.info(f"Number of AF to process : {nb_af}")
+    logger.info(f"Number of DS to process : {nb_ds}")
+    if level_log_mtd_sync == "DEBUG":
+        nb_updated_af = 0
+        nb_updated_ds = 0
+        nb_retrieved_new_af = 0
+        nb_retrieved_new_ds = 0
+    logger.debug("MTD - PROCESS AF LIST")
+    if sync_engine == "bulk":
+        process_af_list_bulk(af_list, context, id_role)
+    elif sync_engine == "copy":
+        process_af_list_copy(af_list, context, id_role)
+    elif is_batched:
+        process_af_list_batched(af_list, context, id_role)
+    else:
+        for i, af in enumerate(af_list):
+            if context.is_past_deadline():
+                context.remaining["AF"].extend(af_list[i:])
+                break
+            actors = af.pop("actors")
+            with db.session.begin_nested():
+                add_unexisting_digitizer(af["id_digitizer"] if not id_role else id_role)
+            if level_log_mtd_sync == "DEBUG":
+                af_already_exists = db.session.scalar(
+                    exists()
+                    .where(
+                        TAcquisitionFramework.unique_acquisition_framework_id
+                        == af["unique_acquisition_framework_id"]
+                    )
+                    .select()
+                )
+            af = sync_af(af, context.report)
+            # TODO: choose whether or not to commit retrieval of the AF before association of actors
+            #   and possibly retrieve an AF without any actor associated to it
+            # Commit here to retrieve the AF even if the association of actors that follows is to fail
+            db.session.commit()
+            # If the AF has not been retrieved, associated actors cannot be retrieved either
+            #   and thus we continue to the next AF
+            if af is not None:
+                context.written_uuids["AF"].add(to_uuid(af.unique_acquisition_framework_id))
+                if level_log_mtd_sync == "DEBUG":
+                    if af_already_exists:
+                        nb_updated_af += 1
+                    else:
+                        nb_retrieved_new_af += 1
+                associate_actors(
+                    actors,
+                    CorAcquisitionFrameworkActor,
+                    "id_acquisition_framework",
+                    af.id_acquisition_framework,
+                    af.unique_acquisition_framework_id,
+                    context,
+                )
+            # TODO: remove actors removed from MTD
+    db.session.commit()
+    logger.debug("MTD - PROCESS DS LIST")
+    if context.remaining["AF"] or context.is_past_deadline():
+        # The DS are left for later along with - or after - their AF
+        context.remaining["DS"].extend(ds_list)
+    elif sync_engine == "bulk":
+        process_ds_list_bulk(ds_list, context, id_role)
+    elif sync_engine == "copy":
+        process_ds_list_copy(ds_list, context, id_role)
+    elif is_batched:
+        process_ds_list_batched(ds_list, context, id_role)
+    else:
+        for i, ds in enumerate(ds_list):
+            if context.is_past_deadline():
+                context.remaining["DS"].extend(ds_list[i:])
+                break
+            actors = ds.pop("actors")
+            # CREATE DIGITIZER
+            with db.session.begin_nested():
+                if not id_role:
+                    add_unexisting_digitizer(ds["id_digitizer"])
+                else:
+                    add_unexisting_digitizer(id_role)
+            if level_log_mtd_sync == "DEBUG":
+                ds_already_exists = db.session.scalar(
+                    exists()
+                    .where(
+                        TDatasets.unique_dataset_id == ds["unique_dataset_id"],
+                    )
+                    .select()
+                )
+            ds = sync_ds(ds, context.nomenclatures, context.report, context.id_dataset_modules)
+            if ds is not None:
+                context.written_uuids["DS"].add(to_uuid(ds.unique_dataset_id))
+                if level_log_mtd_sync == "DEBUG":
+                    if ds_already_exists:
+                        nb_updated_ds += 1
+                    else:
+                        nb_retrieved_new_ds += 1
+                associate_actors(
+                    actors,
+                    CorDatasetActor,
+                    "id_dataset",
+                    ds.id_dataset,
+                    ds.unique_dataset_id,
+                    context,
+                )
     db.session.commit()
+    written_af_uuids = context.get_written_uuids("AF")
+    written_ds_uuids = context.get_written_uuids("DS")
+    if configuration_mtd["SYNC_FINGERPRINTS"]:
+        # Only for the records written, so that the others are retried by the next sync
+        store_fingerprints(
+            {
+                af_uuid: fingerprint
+                for af_uuid, fingerprint in af_fingerprints.items()
+                if af_uuid in written_af_uuids
+            },
+            TAcquisitionFramework.unique_acquisition_framework_id,
+            "AF",
+            chunk_size,
+        )
+        store_fingerprints(
+            {
+                ds_uuid: fingerprint
+                for ds_uuid, fingerprint in ds_fingerprints.items()
+                if ds_uuid in written_ds_uuids
+            },
+            TDatasets.unique_dataset_id,
+            "DS",
+            chunk_size,
+        )
+        db.session.commit()
+    context.log_report()
 
     if level_log_mtd_sync == "DEBUG":
-        nb_ds_not_retrieved_or_not_updated = nb_ds - nb_updated_ds - nb_retrieved_new_ds
-        logger.debug(
-            f"{nb_ds} DS processed : {nb_updated_ds} DS updated (including no change made) + {nb_retrieved_new_ds} new DS retrieved + {nb_ds_not_retrieved_or_not_updated} DS not retrieved or not updated"
+        if sync_engine == "record" and not is_batched:
+            nb_ds_not_retrieved_or_not_updated = nb_ds - nb_updated_ds - nb_retrieved_new_ds
+            logger.debug(
+                f"{nb_ds} DS processed : {nb_updated_ds} DS updated (including no change made) + {nb_retrieved_new_ds} new DS retrieved + {nb_ds_not_retrieved_or_not_updated} DS not retrieved or not updated"
+            )
+            nb_af_not_retrieved_or_not_updated = nb_af - nb_updated_af - nb_retrieved_new_af
+            logger.debug(
+                f"{nb_af} AF processed : {nb_updated_af} AF updated (including no change made) + {nb_retrieved_new_af} new AF retrieved + {nb_af_not_retrieved_or_not_updated} AF not retrieved or not updated"
+            )
+
+    if context.remaining["AF"] or context.remaining["DS"]:
+        # The records written are committed, along with their fingerprints: only the others are resumed
+        logger.info(
+            f"MTD - TIME BUDGET EXCEEDED : {len(context.remaining['AF'])} AF and"
+            f" {len(context.remaining['DS'])} DS LEFT FOR LATER"
         )
-        nb_af_not_retrieved_or_not_updated = nb_af - nb_updated_af - nb_retrieved_new_af
-        logger.debug(
-            f"{nb_af} AF processed : {nb_updated_af} AF updated (including no change made) + {nb_retrieved_new_af} new AF retrieved + {nb_af_not_retrieved_or_not_updated} AF not retrieved or not updated"
+        raise SyncBudgetExceeded(
+            "write",
+            {},
+            resume=partial(
+                process_af_and_ds,
+                context.remaining["AF"],
+                context.remaining["DS"],
+                id_role,
+                sync_engine=sync_engine,
+            ),
         )
 
+    return {
+        "AF": [
+            af
+            for af in af_list
+            if to_uuid(af["unique_acquisition_framework_id"]) in context.failed_uuids["AF"]
+        ],
+        "DS": [
+            ds for ds in ds_list if to_uuid(ds["unique_dataset_id"]) in context.failed_uuids["DS"]
+        ],
+    }
+
+
+class SyncBudgetExceeded(Exception):
+    """
+    Raised when a synchronization runs over its time budget, before or during a stage.
+
+    Attributes
+    ----------
+    stage : str
+        the stage not completed: "fetch" (which includes the parsing) or "write"
+    timings : dict
+        duration, in seconds, of the stages run, by stage
+    resume : callable or None
+        callable without argument running the stages not completed, if they can be resumed
+    """
+
+    def __init__(self, stage, timings, resume=None):
+        super().__init__(f"Time budget of the synchronization exceeded at stage '{stage}'")
+        self.stage = stage
+        self.timings = timings
+        self.resume = resume
+
 
-def sync_af_and_ds():
+def fetch_concurrently(*fetchers, timeout=None, cancel_event=None):
+    """
+    Call the given fetchers and return their results, in the same order.
+
+    If `SYNC_CONCURRENT_FETCH` is enabled, the fetchers are called concurrently in a thread pool,
+    each within the application context. As soon as a fetcher fails, the fetchers not yet started
+    are cancelled and the exception is raised ; the results of those still running are discarded.
+
+    With a `timeout`, the fetchers are called in a thread pool even if `SYNC_CONCURRENT_FETCH` is
+    disabled - then one after the other, in a single thread. Past the timeout, the fetchers not
+    yet started are cancelled the same way, and `concurrent.futures.TimeoutError` is raised.
+
+    The fetchers still running are stopped through `cancel_event`, set in both cases: it is to be
+    the cancellation event of the `MTDInstanceApi` they use.
+
+    Parameters
+    ----------
+    *fetchers : callable
+        callables without argument, e.g. `MTDInstanceApi.get_af_list`
+    timeout : float, optional
+        maximum time, in seconds, to wait for the results
+    cancel_event : threading.Event, optional
+        event set to stop the fetchers still running, once their results are discarded
+
+    Returns
+    -------
+    list
+        the results of the fetchers
+    """
+    concurrent = configuration_mtd["SYNC_CONCURRENT_FETCH"] and len(fetchers) > 1
+    if not concurrent and timeout is None:
+        return [fetcher() for fetcher in fetchers]
+    if not concurrent:
+        fetchers = [partial(fetch_concurrently, *fetchers)]
+
+    app = current_app._get_current_object()
+
+    def run_in_app_context(fetcher):
+        with app.app_context():
+            return fetcher()
+
+    executor = ThreadPoolExecutor(max_workers=len(fetchers), thread_name_prefix="mtd_sync_fetch")
+    try:
+        futures = [executor.submit(run_in_app_context, fetcher) for fetcher in fetchers]
+        wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+        for future in futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        if not all(future.done() for future in futures):
+            raise FuturesTimeoutError()
+        results = [future.result() for future in futures]
+        return results if concurrent else results[0]
+    except BaseException:
+        if cancel_event is not None:
+            cancel_event.set()
+        raise
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def filter_unchanged_af_and_ds(af_list, ds_list, id_instance: int):
+    """
+    Leave out the acquisition frameworks (AF) and datasets (DS) unchanged since the last global
+    synchronization of an instance, according to their update date (see `filter_changed_records`).
+
+    Parameters
+    ----------
+    af_list : list[AcquisitionFrameworkRecord]
+        parsed AFs
+    ds_list : list[DatasetRecord]
+        parsed DS
+    id_instance : int
+        ID of the instance of 'INPN Métadonnées', 0 if the synchronization is not filtered
+
+    Returns
+    -------
+    tuple
+        the new or changed AFs and DS
+    """
+    watermarks = get_watermarks(id_instance)
+    chunk_size = configuration_mtd["SYNC_BULK_CHUNK_SIZE"]
+    af_list, nb_unchanged_af = filter_changed_records(
+        af_list,
+        TAcquisitionFramework.unique_acquisition_framework_id,
+        "unique_acquisition_framework_id",
+        watermarks.get("AF"),
+        chunk_size,
+    )
+    ds_list, nb_unchanged_ds = filter_changed_records(
+        ds_list, TDatasets.unique_dataset_id, "unique_dataset_id", watermarks.get("DS"), chunk_size
+    )
+    logger.info(
+        f"MTD - SYNC INCREMENTAL : {nb_unchanged_af} AF and {nb_unchanged_ds} DS unchanged since last sync - SKIPPED"
+    )
+    return af_list, ds_list
+
+
+def sync_af_and_ds(sync_engine=None):
     """
     Method to trigger global MTD sync.
+
+    With `SYNC_SINGLE_FLIGHT`, it does not overlap the per-user syncs of any process.
+
+    Parameters
+    -----------
+    sync_engine : str, optional
+        "record", "bulk" or "copy", `SYNC_ENGINE` by default
     """
+    with global_sync_lock() if configuration_mtd["SYNC_SINGLE_FLIGHT"] else nullcontext():
+        _sync_af_and_ds(sync_engine=sync_engine)
+
+
+def _sync_af_and_ds(sync_engine=None):
     logger.info("MTD - SYNC GLOBAL : START")
     mtd_api = MTDInstanceApi(
-        configuration_mtd["MTD_API_ENDPOINT"], configuration_mtd["ID_INSTANCE_FILTER"]
+        configuration_mtd["MTD_API_ENDPOINT"],
+        configuration_mtd["ID_INSTANCE_FILTER"],
+        xml_cache=get_xml_cache(configuration_mtd),
     )
 
-    af_list = mtd_api.get_af_list()
-
-    ds_list = mtd_api.get_ds_list()
+    af_list, ds_list = fetch_concurrently(
+        mtd_api.get_af_list, mtd_api.get_ds_list, cancel_event=mtd_api.cancel_event
+    )
 
-    # synchro a partir des listes
-    process_af_and_ds(af_list, ds_list)
+    if af_list is None and ds_list is None:
+        logger.info("MTD - SYNC GLOBAL : NO CHANGE SINCE LAST SYNC")
+    else:
+        af_list, ds_list = af_list or [], ds_list or []
+        if configuration_mtd["SYNC_INCREMENTAL"]:
+            id_instance = configuration_mtd["ID_INSTANCE_FILTER"] or 0
+            new_watermarks = {
+                "AF": get_max_update_date(af_list),
+                "DS": get_max_update_date(ds_list),
+            }
+            af_list, ds_list = filter_unchanged_af_and_ds(af_list, ds_list, id_instance)
+        # synchro a partir des listes
+        failed = process_af_and_ds(af_list, ds_list, sync_engine=sync_engine)
+        if configuration_mtd["SYNC_INCREMENTAL"]:
+            # Only moved forward once the synchronization completed, and not past the records
+            #   which failed, so that the next synchronization retries them. The records skipped by
+            #   validation would be skipped again: they do not hold the watermark back
+            for object_type, watermark in new_watermarks.items():
+                new_watermarks[object_type] = cap_watermark(watermark, failed[object_type])
+                if failed[object_type]:
+                    logger.info(
+                        f"MTD - SYNC GLOBAL : {len(failed[object_type])} {object_type} FAILED"
+                        f" - WATERMARK KEPT AT {new_watermarks[object_type]}"
+                    )
+            set_watermarks(id_instance, new_watermarks)
+            db.session.commit()
+        # Neither are the unchanged exports skipped by the next synchronization
+        if not any(failed.values()):
+            mtd_api.commit_xml_cache()
+    mtd_api.log_parse_stats()
+    get_http_client().log_pool_stats()
     logger.info("MTD - SYNC GLOBAL : FINISH")
 
 
-def sync_af_and_ds_by_user(id_role, id_af=None):
+def sync_af_and_ds_by_user(id_role, id_af=None, sync_engine=None, time_budget=None):
     """
     Method to trigger MTD sync on user authentication.
 
+    With `SYNC_SINGLE_FLIGHT`, only one sync of a given user runs at a time, across processes:
+    the others wait at most `SYNC_SINGLE_FLIGHT_WAIT` seconds for it to finish, and are skipped.
+
     Parameters
     -----------
     id_role : int
         The ID of the role (group or user).
     id_af : str, optional
         The ID of an AF (Acquisition Framework).
+    sync_engine : str, optional
+        "record", "bulk" or "copy", `SYNC_ENGINE` by default
+    time_budget : float, optional
+        Maximum duration of the sync, in seconds: past it, `SyncBudgetExceeded` is raised, once
+        the fetches are cancelled, before the writes, or once the writes are stopped - see
+        `process_af_and_ds`.
+    """
+    _sync_af_and_ds_by_user_with_lock(
+        id_role,
+        partial(
+            _sync_af_and_ds_by_user,
+            id_role,
+            id_afs=[id_af] if id_af else None,
+            sync_engine=sync_engine,
+        ),
+        time_budget=time_budget,
+    )
+
+
+def sync_af_and_ds_by_user_afs(id_role, id_afs, sync_engine=None, time_budget=None):
     """
+    Method to trigger MTD sync of several AFs (Acquisition Frameworks) of a user at once.
 
+    The datasets of the user are retrieved once for all the AFs, and the AFs concurrently (see
+    `SYNC_CONCURRENT_FETCH`), then processed in a single pass. Single-flight as
+    `sync_af_and_ds_by_user`.
+
+    Parameters
+    -----------
+    id_role : int
+        The ID of the role (group or user).
+    id_afs : Iterable[int]
+        The IDs of the AFs.
+    sync_engine : str, optional
+        "record", "bulk" or "copy", `SYNC_ENGINE` by default
+    time_budget : float, optional
+        Maximum duration of the sync, in seconds, see `sync_af_and_ds_by_user`.
+    """
+    _sync_af_and_ds_by_user_with_lock(
+        id_role,
+        partial(_sync_af_and_ds_by_user, id_role, id_afs=list(id_afs), sync_engine=sync_engine),
+        time_budget=time_budget,
+    )
+
+
+def resume_sync_af_and_ds_by_user(id_role, resume):
+    """
+    Run the stages of a user sync not completed within its time budget (see
+    `SyncBudgetExceeded.resume`), single-flight as `sync_af_and_ds_by_user`.
+
+    Parameters
+    -----------
+    id_role : int
+        The ID of the role (group or user).
+    resume : callable
+        The stages not completed.
+    """
+    _sync_af_and_ds_by_user_with_lock(id_role, lambda deadline: resume())
+
+
+def _sync_af_and_ds_by_user_with_lock(id_role, sync, time_budget=None):
+    # The time spent waiting for the lock counts in the budget
+    deadline = time.monotonic() + time_budget if time_budget else None
+    if configuration_mtd["SYNC_SINGLE_FLIGHT"]:
+        wait = configuration_mtd["SYNC_SINGLE_FLIGHT_WAIT"]
+        if deadline is not None:
+            wait = max(min(wait, deadline - time.monotonic()), 0)
+        lock = user_sync_lock(id_role, wait=wait)
+    else:
+        lock = nullcontext(True)
+    with lock as leader:
+        if leader:
+            sync(deadline=deadline)
+
+
+def _sync_af_and_ds_by_user(id_role, id_afs=None, sync_engine=None, deadline=None):
     logger.info("MTD - SYNC USER : START")
+    start = time.monotonic()
+    timings = {}
 
     # Create an instance of MTDInstanceApi
     mtd_api = MTDInstanceApi(
@@ -335,9 +1329,8 @@ def sync_af_and_ds_by_user(id_role, id_af=None):
 
     # Get the list of datasets (ds) for the user
     # NOTE: `mtd_api.get_ds_user_list()` tested and timed to about 7 seconds on the PROD instance 'GINCO Occtax' with id_role = 13829 > a user with a lot of metadata to be retrieved from 'INPN Métadonnées' to 'GINCO Occtax'
-    ds_list = mtd_api.get_ds_user_list()
-
-    if not id_af:
+    #   It is independent from the retrieval of the AFs, so both are possibly fetched concurrently (see `SYNC_CONCURRENT_FETCH`)
+    if not id_afs:
         # TODO - voir avec INPN pourquoi les AF par user ne sont pas dans l'appel global des AF
         # Ce code ne fonctionne pas pour cette raison -> AF manquants
         # af_list = mtd_api.get_af_list()
@@ -345,21 +1338,98 @@ def sync_af_and_ds_by_user(id_role, id_af=None):
 
         # Get the list of acquisition frameworks for the user
         # call INPN API for each AF to retrieve info
-        af_list = mtd_api.get_list_af_for_user()
+        fetchers = [mtd_api.get_ds_user_list, mtd_api.get_list_af_for_user]
     else:
-        # TODO: handle case where the AF ; corresponding to the provided `id_af` ; does not exist yet in the database
-        #   this case should not happend from a user action because the only case where `id_af` is provided is for when the user click to unroll an AF in the module Metadata, in which case the AF already exists in the database.
-        #   It would still be better to handle case where the AF does not exist in the database, and to first retrieve the AF from 'INPN Métadonnées' in this case
-        uuid_af = TAcquisitionFramework.query.get(id_af).unique_acquisition_framework_id
-        uuid_af = str(uuid_af).upper()
+        # TODO: handle case where an AF ; corresponding to one of the provided `id_afs` ; does not exist yet in the database
+        #   this case should not happend from a user action because the only case where `id_afs` are provided is for when the user click to unroll AFs in the module Metadata, in which case the AFs already exist in the database.
+        #   It would still be better to handle case where an AF does not exist in the database, and to first retrieve the AF from 'INPN Métadonnées' in this case
+        uuid_by_id_af = dict(
+            db.session.execute(
+                select(
+                    TAcquisitionFramework.id_acquisition_framework,
+                    TAcquisitionFramework.unique_acquisition_framework_id,
+                ).where(
+                    TAcquisitionFramework.id_acquisition_framework.in_(
+                        {int(id_af) for id_af in id_afs}
+                    )
+                )
+            ).all()
+        )
+        if not uuid_by_id_af:
+            logger.warning(
+                f"MTD - SYNC USER : NONE OF THE AF WITH ID {list(id_afs)} FOUND IN DATABASE - SKIPPING"
+            )
+            return
+        missing_id_afs = {int(id_af) for id_af in id_afs} - set(uuid_by_id_af)
+        if missing_id_afs:
+            logger.warning(
+                f"MTD - SYNC USER : AF WITH ID {sorted(missing_id_afs)} NOT FOUND IN DATABASE - SKIPPING THEM"
+            )
+        # Only the AFs found are synchronized, and recorded as such
+        id_afs = list(uuid_by_id_af)
+        uuid_afs = [str(uuid_af).upper() for uuid_af in uuid_by_id_af.values()]
 
-        # Get the acquisition framework for the specified UUID, thus a list of one element
-        af_list = [mtd_api.get_single_af(uuid_af)]
+        # Get the user datasets once, and each acquisition framework for its UUID
+        fetchers = [
+            mtd_api.get_ds_user_list,
+            *(partial(mtd_api.get_single_af, uuid_af) for uuid_af in uuid_afs),
+        ]
 
-        # Filter the datasets based on the specified UUID
-        ds_list = [ds for ds in ds_list if ds["uuid_acquisition_framework"] == uuid_af]
+    timeout = None
+    if deadline is not None:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise SyncBudgetExceeded("fetch", timings)
+    try:
+        ds_list, *af_list = fetch_concurrently(
+            *fetchers, timeout=timeout, cancel_event=mtd_api.cancel_event
+        )
+    except FuturesTimeoutError:
+        timings["fetch"] = time.monotonic() - start
+        raise SyncBudgetExceeded("fetch", timings) from None
+    timings["fetch"] = time.monotonic() - start
+    mtd_api.log_parse_stats()
+
+    if not id_afs:
+        af_list = af_list[0]
+    else:
+        # Filter the datasets based on the specified UUIDs
+        uuid_afs = set(uuid_afs)
+        ds_list = [ds for ds in ds_list if ds["uuid_acquisition_framework"] in uuid_afs]
+
+    process = partial(process_af_and_ds, af_list, ds_list, id_role, sync_engine=sync_engine)
+    write = partial(_write_af_and_ds_by_user, id_role, id_afs, process)
+    if deadline is not None and time.monotonic() >= deadline:
+        raise SyncBudgetExceeded("write", timings, resume=write)
+    write_start = time.monotonic()
+    try:
+        write(deadline=deadline)
+    except SyncBudgetExceeded as error:
+        timings["write"] = time.monotonic() - write_start
+        error.timings = timings
+        raise
+    timings["write"] = time.monotonic() - write_start
 
+    get_http_client().log_pool_stats(logging.DEBUG)
+    logger.info(
+        "MTD - SYNC USER : FINISH ("
+        + ", ".join(f"{stage}={duration:.2f}s" for stage, duration in timings.items())
+        + ")"
+    )
+
+
+def _write_af_and_ds_by_user(id_role, id_afs, process, deadline=None):
     # Process the acquisition frameworks and datasets
-    process_af_and_ds(af_list, ds_list, id_role)
+    try:
+        failed = process(deadline=deadline)
+    except SyncBudgetExceeded as error:
+        # Then the records not processed are resumed, and the sync recorded once they are
+        error.resume = partial(_write_af_and_ds_by_user, id_role, id_afs, error.resume)
+        raise
 
-    logger.info("MTD - SYNC USER : FINISH")
+    # Record the successful sync, so that the next requests of the user within the TTL skip it
+    #   A sync with records failing is not, so that the next request retries them
+    if configuration_mtd["SYNC_USER_FRESHNESS_TTL"] and not any(failed.values()):
+        for id_af in id_afs or [None]:
+            set_user_sync_fresh(id_role, id_af)
+        db.session.commit()
@@ -1,14 +1,14 @@
 import logging
 import json
+from collections import Counter
 from copy import copy
 import pprint
 from typing import Literal, Union
-import uuid
 from flask import current_app
 
-from sqlalchemy import select, exists
-from sqlalchemy.exc import SQLAlchemyError, IntegrityError
-from sqlalchemy.sql import func, update
+from sqlalchemy import Boolean, select, exists, false, literal_column, or_, true
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import update
 
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
@@ -20,7 +20,7 @@ from geonature.core.gn_meta.models import (
     CorAcquisitionFrameworkActor,
 )
 from geonature.core.gn_commons.models import TModules
-from pypnusershub.db.models import Organisme as BibOrganismes, User
+from pypnusershub.db.models import User
 from geonature.utils.errors import GeonatureApiError
 from pypnusershub.routes import insert_or_update_organism
 from pypnusershub.auth.providers.cas_inpn_provider import AuthenficationCASINPN
@@ -30,25 +30,61 @@ from pypnusershub.auth.auth_manager import auth_manager
 #   The following import is actually used,
 #    but from outside of the current file : https://github.com/PnX-SI/GeoNature/blob/c557d1d275c406805d44da1a6880006d5d452eef/backend/geonature/core/gn_meta/routes.py#L933
 from .mtd_webservice import get_acquisition_framework
-
-NOMENCLATURE_MAPPING = {
-    "cd_nomenclature_data_type": "DATA_TYP",
-    "cd_nomenclature_dataset_objectif": "JDD_OBJECTIFS",
-    "cd_nomenclature_data_origin": "DS_PUBLIQUE",
-    "cd_nomenclature_source_status": "STATUT_SOURCE",
-}
+from .resolvers import (
+    NOMENCLATURE_MAPPING,
+    NomenclatureResolver,
+    SyncContext,
+    execute_isolated,
+    iter_chunks,
+    to_uuid,
+)
 
 # Get the logger instance "MTD_SYNC"
 logger = logging.getLogger("MTD_SYNC")
 
+# Columns set by the triggers of gn_meta on each write: a difference on them alone is no change
+NO_CHANGE_IGNORED_COLUMNS = ("meta_create_date", "meta_update_date")
+
+
+def is_distinct_from(Model, values: dict):
+    """
+    Build the condition for a row to be actually changed by an update: at least one column
+    `IS DISTINCT FROM` its new value, metadata dates aside (see `NO_CHANGE_IGNORED_COLUMNS`).
+    Updates are then skipped for unchanged rows, which avoids dead tuples, WAL, and the triggers.
+
+    Parameters
+    ----------
+    Model : DB.Model
+        the SQLAlchemy model of the table
+    values : dict
+        new values - or SQL expressions such as `excluded.<column>` - by column name
+
+    Returns
+    -------
+    sqlalchemy.sql.elements.BooleanClauseList
+        the condition
+    """
+    return or_(
+        *(
+            Model.__table__.c[column].is_distinct_from(value)
+            for column, value in values.items()
+            if column not in NO_CHANGE_IGNORED_COLUMNS
+        )
+    )
+
 
-def sync_ds(ds, cd_nomenclatures):
+def sync_ds(
+    ds, nomenclatures: NomenclatureResolver, report: Counter = None, id_modules: list = None
+):
     """
     Will create or update a given DS according to UUID.
-    Only process DS if dataset's cd_nomenclatures exists in ref_normenclatures.t_nomenclatures.
+    Only process DS if dataset's data origin nomenclature exists in ref_normenclatures.t_nomenclatures.
+    An existing DS is updated only if at least one of its values changed.
 
     :param ds: <dict> DS infos
-    :param cd_nomenclatures: <array> cd_nomenclature from ref_normenclatures.t_nomenclatures
+    :param nomenclatures: <NomenclatureResolver> IDs of the nomenclatures of ref_normenclatures.t_nomenclatures
+    :param report: <Counter> if provided, incremented for the DS as `ds_inserted`, `ds_updated` or `ds_unchanged`
+    :param id_modules: <list> IDs of the modules a new DS is associated to, see `get_dataset_module_ids` - retrieved if not provided
     """
 
     uuid_ds = ds["unique_dataset_id"]
@@ -62,7 +98,12 @@ def sync_ds(ds, cd_nomenclatures):
     # FIXME: the following temporary fix was added due to possible differences in referential of nomenclatures values between INPN and GeoNature
     #     should be fixed by ensuring that the two referentials are identical, at least for instances that integrates with INPN and thus rely on MTD synchronization from INPN Métadonnées: GINCO and DEPOBIO instances.
     ds_cd_nomenclature_data_origin = ds["cd_nomenclature_data_origin"]
-    if ds_cd_nomenclature_data_origin not in cd_nomenclatures:
+    if (
+        nomenclatures.get_id(
+            NOMENCLATURE_MAPPING["cd_nomenclature_data_origin"], ds_cd_nomenclature_data_origin
+        )
+        is None
+    ):
         logger.warning(
             f"MTD - Nomenclature with code '{ds_cd_nomenclature_data_origin}' not found in database - SKIPPING SYNCHRONIZATION OF DATASET WITH UUID '{uuid_ds}' AND NAME '{name_ds}'"
         )
@@ -87,7 +128,7 @@ def sync_ds(ds, cd_nomenclatures):
     ds["id_acquisition_framework"] = af.id_acquisition_framework
     ds = {
         field.replace("cd_nomenclature", "id_nomenclature"): (
-            func.ref_nomenclatures.get_id_nomenclature(NOMENCLATURE_MAPPING[field], value)
+            nomenclatures.get_id(NOMENCLATURE_MAPPING[field], value)
             if field.startswith("cd_nomenclature")
             else value
         )
@@ -111,30 +152,40 @@ def sync_ds(ds, cd_nomenclatures):
     if ds_exists:
         statement = (
             update(TDatasets)
-            .where(TDatasets.unique_dataset_id == ds["unique_dataset_id"])
+            .where(
+                TDatasets.unique_dataset_id == ds["unique_dataset_id"],
+                is_distinct_from(TDatasets, ds),
+            )
             .values(**ds)
         )
-    DB.session.execute(statement)
+    result = DB.session.execute(statement)
+    if report is not None:
+        report[f"ds_{get_write_outcome(ds_exists, result)}"] += 1
 
     dataset = DB.session.scalars(
         select(TDatasets).filter_by(unique_dataset_id=ds["unique_dataset_id"])
     ).first()
 
     # Associate dataset to the modules if new dataset
-    if not ds_exists:
-        associate_dataset_modules(dataset)
+    if not ds_exists and dataset is not None:
+        if id_modules is None:
+            id_modules = get_dataset_module_ids()
+        associate_datasets_modules([dataset.id_dataset], id_modules)
 
     return dataset
 
 
-def sync_af(af):
+def sync_af(af, report: Counter = None):
     """
     Will update a given AF (Acquisition Framework) if already exists in database according to UUID, else update the AF.
+    An existing AF is updated only if at least one of its values changed.
 
     Parameters
     ----------
     af : dict
         AF infos.
+    report : Counter, optional
+        if provided, incremented for the AF as `af_inserted`, `af_updated` or `af_unchanged`
 
     Returns
     -------
@@ -167,7 +218,10 @@ def sync_af(af):
     # Update statement if AF already exists in DB else insert statement
     statement = (
         update(TAcquisitionFramework)
-        .where(TAcquisitionFramework.unique_acquisition_framework_id == af_uuid)
+        .where(
+            TAcquisitionFramework.unique_acquisition_framework_id == af_uuid,
+            is_distinct_from(TAcquisitionFramework, af),
+        )
         .values(**af)
     )
     if not af_exists:
@@ -176,7 +230,9 @@ def sync_af(af):
             .values(**af)
             .on_conflict_do_nothing(index_elements=["unique_acquisition_framework_id"])
         )
-    DB.session.execute(statement)
+    result = DB.session.execute(statement)
+    if report is not None:
+        report[f"af_{get_write_outcome(af_exists, result)}"] += 1
 
     acquisition_framework = DB.session.scalars(
         select(TAcquisitionFramework).filter_by(unique_acquisition_framework_id=af_uuid)
@@ -185,62 +241,328 @@ def sync_af(af):
     return acquisition_framework
 
 
-def add_or_update_organism(uuid, nom, email):
+def get_write_outcome(row_exists: bool, result) -> str:
+    """
+    Return the outcome of the insert or update of a row, for the report of the synchronization.
+
+    Parameters
+    ----------
+    row_exists : bool
+        whether the row existed, i.e. whether `result` is the one of an update
+    result : sqlalchemy.engine.CursorResult
+        result of the insert or update statement
+
+    Returns
+    -------
+    str
+        "inserted", "updated", or "unchanged" if the update has been skipped
     """
-    Create or update organism if UUID not exists in DB.
+    if not row_exists:
+        return "inserted"
+    return "updated" if result.rowcount else "unchanged"
+
 
-    :param uuid: uniq organism uuid
-    :param nom: org name
-    :param email: org email
+def bulk_upsert(Model, rows, index_element: str, returning, chunk_size: int = 1000) -> list:
     """
-    # Test if actor already exists to avoid nextVal increase
-    org_exist = DB.session.scalar(exists().where(BibOrganismes.uuid_organisme == uuid).select())
+    Insert or update rows of a table with `INSERT ... ON CONFLICT DO UPDATE ... RETURNING`,
+    one statement per chunk of rows.
 
-    if org_exist:
-        statement = (
-            update(BibOrganismes)
-            .where(BibOrganismes.uuid_organisme == uuid)
-            .values(
-                dict(
-                    nom_organisme=nom,
-                    email_organisme=email,
+    A multi-row INSERT sets the same columns for every row: rows are thus grouped by set of columns
+    before being split in chunks.
+    Rows must be unique on `index_element`, as a single statement cannot update a row twice.
+    Existing rows are updated only if at least one of their values changed (see
+    `is_distinct_from`): the unchanged rows, which are not returned by the upsert, are then
+    retrieved with one `IN` query by chunk.
+
+    Parameters
+    ----------
+    Model : DB.Model
+        the SQLAlchemy model of the table
+    rows : Iterable[dict]
+        values of the rows, by column name
+    index_element : str
+        name of the UUID column with an unique constraint on which conflicts are detected
+    returning : list
+        columns to be returned for each row, including `index_element`
+    chunk_size : int
+        maximum number of rows by statement
+
+    Returns
+    -------
+    list
+        for each row, the `returning` columns, `inserted`: True if the row has been inserted,
+        and `changed`: False if the update of the row has been skipped
+    """
+    rows_by_columns = {}
+    for row in rows:
+        rows_by_columns.setdefault(tuple(row.keys()), []).append(row)
+    upserted_rows = []
+    for columns, rows_with_columns in rows_by_columns.items():
+        for chunk in iter_chunks(rows_with_columns, chunk_size):
+            statement = pg_insert(Model).values(chunk)
+            new_values = {
+                column: statement.excluded[column] for column in columns if column != index_element
+            }
+            statement = statement.on_conflict_do_update(
+                index_elements=[index_element],
+                set_=new_values,
+                where=is_distinct_from(Model, new_values),
+            ).returning(
+                *returning,
+                # `xmax` is zero for a row version created by an INSERT
+                literal_column("(xmax = 0)", Boolean).label("inserted"),
+                true().label("changed"),
+            )
+            chunk_rows = DB.session.execute(statement).all()
+            upserted_rows.extend(chunk_rows)
+            if len(chunk_rows) < len(chunk):
+                upserted_keys = {to_uuid(row._mapping[index_element]) for row in chunk_rows}
+                index_column = Model.__table__.c[index_element]
+                upserted_rows.extend(
+                    DB.session.execute(
+                        select(
+                            *returning, false().label("inserted"), false().label("changed")
+                        ).where(
+                            index_column.in_(
+                                [
+                                    row[index_element]
+                                    for row in chunk
+                                    if to_uuid(row[index_element]) not in upserted_keys
+                                ]
+                            )
+                        )
+                    ).all()
                 )
+    return upserted_rows
+
+
+def get_upsert_outcome(row) -> str:
+    """
+    Return the outcome of a row returned by `bulk_upsert`, for the report of the synchronization.
+
+    Parameters
+    ----------
+    row : sqlalchemy.engine.Row
+        row returned by `bulk_upsert`
+
+    Returns
+    -------
+    str
+        "inserted", "updated", or "unchanged" if the update has been skipped
+    """
+    if row.inserted:
+        return "inserted"
+    return "updated" if row.changed else "unchanged"
+
+
+def sync_af_list(af_list, chunk_size: int = 1000):
+    """
+    Create or update acquisition frameworks (AF) according to their UUID, in bulk.
+
+    Whereas `sync_af` runs several statements for each AF, the AFs are here upserted by chunks of
+    `chunk_size` AFs with `INSERT ... ON CONFLICT (unique_acquisition_framework_id) DO UPDATE`.
+    AFs without a valid UUID are skipped. If several AFs have the same UUID, the last one is kept.
+
+    Parameters
+    ----------
+    af_list : list
+        AF infos, without their actors
+    chunk_size : int
+        maximum number of AFs upserted by statement
+
+    Returns
+    -------
+    dict
+        ID of the synchronized AFs, by UUID as found in `af_list`
+    Counter
+        number of AFs `inserted`, `updated`, `unchanged` and `skipped`
+    """
+    counts = Counter()
+    af_by_uuid = {}
+    uuid_by_af_uuid = {}
+    for af in af_list:
+        af_uuid = af["unique_acquisition_framework_id"]
+        name_af = af["acquisition_framework_name"]
+        uuid_by_af_uuid[af_uuid] = to_uuid(af_uuid)
+        if uuid_by_af_uuid[af_uuid] is None:
+            logger.warning(
+                f"No valid UUID provided for the AF with UUID '{af_uuid}' and name '{name_af}' - SKIPPING SYNCHRONIZATION FOR THIS AF."
             )
-            .returning(BibOrganismes.id_organisme)
-        )
-    else:
-        statement = (
-            pg_insert(BibOrganismes)
-            .values(
-                uuid_organisme=uuid,
-                nom_organisme=nom,
-                email_organisme=email,
+            counts["skipped"] += 1
+            continue
+        af_by_uuid[uuid_by_af_uuid[af_uuid]] = dict(af)
+
+    logger.debug("MTD - UPSERTING %s AF" % len(af_by_uuid))
+    id_af_by_uuid = {}
+    for row in bulk_upsert(
+        TAcquisitionFramework,
+        af_by_uuid.values(),
+        "unique_acquisition_framework_id",
+        [
+            TAcquisitionFramework.id_acquisition_framework,
+            TAcquisitionFramework.unique_acquisition_framework_id,
+        ],
+        chunk_size=chunk_size,
+    ):
+        id_af_by_uuid[to_uuid(row.unique_acquisition_framework_id)] = row.id_acquisition_framework
+        counts[get_upsert_outcome(row)] += 1
+
+    af_ids = {
+        af_uuid: id_af_by_uuid[af_uuid_normalized]
+        for af_uuid, af_uuid_normalized in uuid_by_af_uuid.items()
+        if af_uuid_normalized is not None
+    }
+    return af_ids, counts
+
+
+def get_af_ids_by_uuid(af_uuids, chunk_size: int = 1000) -> dict:
+    """
+    Retrieve the ID of acquisition frameworks (AF) from their UUID, with one `IN` query by chunk
+    of `chunk_size` UUIDs.
+
+    Parameters
+    ----------
+    af_uuids : Iterable[uuid.UUID]
+        UUID of the AFs
+    chunk_size : int
+        maximum number of UUIDs by query
+
+    Returns
+    -------
+    dict
+        ID of the AFs found in the database, by UUID
+    """
+    id_af_by_uuid = {}
+    for chunk in iter_chunks(set(af_uuids), chunk_size):
+        for id_af, af_uuid in DB.session.execute(
+            select(
+                TAcquisitionFramework.id_acquisition_framework,
+                TAcquisitionFramework.unique_acquisition_framework_id,
+            ).where(TAcquisitionFramework.unique_acquisition_framework_id.in_(chunk))
+        ):
+            id_af_by_uuid[to_uuid(af_uuid)] = id_af
+    return id_af_by_uuid
+
+
+def sync_ds_list(ds_list, nomenclatures: NomenclatureResolver, chunk_size: int = 1000):
+    """
+    Create or update datasets (DS) according to their UUID, in bulk.
+
+    The AFs of all the DS are retrieved at once, then the DS are filtered in memory - as `sync_ds`
+    does, a DS is skipped with a warning if its AF is not found in the database or if the code of
+    its data origin nomenclature is not found in `nomenclatures`. The remaining DS are upserted by
+    chunks of `chunk_size` DS with `INSERT ... ON CONFLICT (unique_dataset_id) DO UPDATE`.
+    If several DS have the same UUID, the last one is kept.
+
+    Parameters
+    ----------
+    ds_list : list
+        DS infos, without their actors
+    nomenclatures : NomenclatureResolver
+        IDs of the nomenclatures of ref_nomenclatures.t_nomenclatures
+    chunk_size : int
+        maximum number of DS upserted by statement
+
+    Returns
+    -------
+    dict
+        ID of the synchronized DS, by UUID as found in `ds_list`
+    list
+        outcome for each DS of `ds_list`: "inserted", "updated", "unchanged" or "skipped"
+    """
+    id_af_by_uuid = get_af_ids_by_uuid(
+        filter(None, (to_uuid(ds["uuid_acquisition_framework"]) for ds in ds_list)),
+        chunk_size=chunk_size,
+    )
+
+    ds_by_uuid = {}
+    uuid_by_ds = []
+    for ds in ds_list:
+        uuid_ds = ds["unique_dataset_id"]
+        name_ds = ds["dataset_name"]
+        uuid_by_ds.append(None)
+
+        if to_uuid(uuid_ds) is None:
+            logger.warning(
+                f"No valid UUID provided for the DS with UUID '{uuid_ds}' and name '{name_ds}' - SKIPPING SYNCHRONIZATION FOR THIS DS."
             )
-            .on_conflict_do_nothing(index_elements=["uuid_organisme"])
-            .returning(BibOrganismes.id_organisme)
-        )
-    return DB.session.execute(statement).scalar()
+            continue
+
+        if not ds["cd_nomenclature_data_origin"]:
+            ds["cd_nomenclature_data_origin"] = "NSP"
+        # FIXME: see `sync_ds` about differences in referential of nomenclatures values between INPN and GeoNature
+        ds_cd_nomenclature_data_origin = ds["cd_nomenclature_data_origin"]
+        if (
+            nomenclatures.get_id(
+                NOMENCLATURE_MAPPING["cd_nomenclature_data_origin"], ds_cd_nomenclature_data_origin
+            )
+            is None
+        ):
+            logger.warning(
+                f"MTD - Nomenclature with code '{ds_cd_nomenclature_data_origin}' not found in database - SKIPPING SYNCHRONIZATION OF DATASET WITH UUID '{uuid_ds}' AND NAME '{name_ds}'"
+            )
+            continue
 
+        af_uuid = ds["uuid_acquisition_framework"]
+        id_af = id_af_by_uuid.get(to_uuid(af_uuid))
+        if id_af is None:
+            logger.warning(
+                f"MTD - AF with UUID '{af_uuid}' not found in database - SKIPPING SYNCHRONIZATION OF DATASET WITH UUID '{uuid_ds}' AND NAME '{name_ds}'"
+            )
+            continue
 
-def associate_actors(
+        values = {
+            field.replace("cd_nomenclature", "id_nomenclature"): (
+                nomenclatures.get_id(NOMENCLATURE_MAPPING[field], value)
+                if field.startswith("cd_nomenclature")
+                else value
+            )
+            for field, value in ds.items()
+            if value is not None and field != "uuid_acquisition_framework"
+        }
+        values["id_acquisition_framework"] = id_af
+        uuid_by_ds[-1] = to_uuid(uuid_ds)
+        ds_by_uuid[uuid_by_ds[-1]] = values
+
+    logger.debug("MTD - UPSERTING %s DS" % len(ds_by_uuid))
+    id_ds_by_uuid = {}
+    outcome_by_uuid = {}
+    for row in bulk_upsert(
+        TDatasets,
+        ds_by_uuid.values(),
+        "unique_dataset_id",
+        [TDatasets.id_dataset, TDatasets.unique_dataset_id],
+        chunk_size=chunk_size,
+    ):
+        id_ds_by_uuid[to_uuid(row.unique_dataset_id)] = row.id_dataset
+        outcome_by_uuid[to_uuid(row.unique_dataset_id)] = get_upsert_outcome(row)
+
+    ds_ids = {}
+    outcomes = []
+    for ds, ds_uuid in zip(ds_list, uuid_by_ds):
+        if ds_uuid is None:
+            outcomes.append("skipped")
+            continue
+        ds_ids[ds["unique_dataset_id"]] = id_ds_by_uuid[ds_uuid]
+        outcomes.append(outcome_by_uuid[ds_uuid])
+    return ds_ids, outcomes
+
+
+def get_actor_rows(
     actors,
-    CorActor: Union[CorAcquisitionFrameworkActor, CorDatasetActor],
     pk_name: Literal["id_acquisition_framework", "id_dataset"],
     pk_value: str,
     uuid_mtd: str,
-):
+    context: SyncContext,
+) -> list:
     """
-    Associate actors with either a given :
-    - Acquisition framework - writing to the table `gn_meta.cor_acquisition_framework_actor`.
-    - Dataset - writing to the table `gn_meta.cor_dataset_actor`.
+    Build the rows associating actors with either a given acquisition framework or dataset,
+    to be written by `write_actor_rows`.
 
     Parameters
     ----------
     actors : list
         list of actors
-    CorActor : Union[CorAcquisitionFrameworkActor, CorDatasetActor]
-        the SQLAlchemy model corresponding to the destination table
-        effectively CorAcquisitionFrameworkActor or CorDatasetActor
     pk_name : Literal['id_acquisition_framework', 'id_dataset']
         pk attribute name:
         - 'id_acquisition_framework' for AF
@@ -249,8 +571,21 @@ def associate_actors(
         pk value: ID of the AF or DS
     uuid_mtd : str
         UUID of the AF or DS
+    context : SyncContext
+        resolvers of the nomenclatures, organisms and users, and report of the synchronization
+
+    Returns
+    -------
+    list
+        for each actor that can be associated, a tuple of the values of the row, the actor and
+        `uuid_mtd`
     """
     type_mtd = "AF" if pk_name == "id_acquisition_framework" else "DS"
+    actor_rows = []
+    organisms = context.organisms
+    # Resolve the organisms of all the actors at once, then the users of those without organism
+    organisms.prepare(actors)
+    context.roles.prepare(actor["email"] for actor in actors if not organisms.get_id(actor))
     for actor in actors:
         id_organism = None
         uuid_organism = actor["uuid_organism"]
@@ -264,47 +599,30 @@ def associate_actors(
                     f" - with the following actor information:"
                     f"\n" + format_str_dict_actor_for_logging(actor)
                 )
+                context.report["actors_not_associated"] += 1
                 continue
-            with DB.session.begin_nested():
-                # create or update organisme
-                # FIXME: prevent update of organism email from actor email ! Several actors may be associated to the same organism and still have different mails !
-                id_organism = add_or_update_organism(
-                    uuid=uuid_organism,
-                    nom=organism_name if organism_name else None,
-                    email=email_actor,
-                )
-        else:
+            # create or update organisme
+            # FIXME: prevent update of organism email from actor email ! Several actors may be associated to the same organism and still have different mails !
+            id_organism = organisms.get_id(actor)
+        elif organism_name:
             # Retrieve or create an organism in database with `organism_name` as the organism name
             # /!\ Handle case where there is also an organism with the name equals to the value of `name_organism`
-            #   - check if there already is an organism with the name `organism_name`
-            #       - if there is one:
-            #           - set `id_organism` with the ID of the existing organism
-            #       - if there is not:
-            #           - set `id_organism` with the ID of a newly created organism
-            if organism_name:
-                is_exists_organism = DB.session.scalar(
-                    exists().where(BibOrganismes.nom_organisme == organism_name).select()
-                )
-                if is_exists_organism:
-                    id_organism = DB.session.scalar(
-                        select(BibOrganismes.id_organisme)
-                        .where(BibOrganismes.nom_organisme == organism_name)
-                        .limit(1)
-                    )
-                else:
-                    with DB.session.begin_nested():
-                        # Create a new organism with the provided name
-                        #   /!\ We do not use the actor email as the organism email - field `bib_organismes.email_organisme` will be empty
-                        #   Only the three non-null fields will be written: `id_organisme`, `uuid_organisme`, `nom_organisme`.
-                        id_organism = add_or_update_organism(
-                            uuid=str(uuid.uuid4()),
-                            nom=organism_name,
-                            email=None,
-                        )
+            #   - if there already is an organism with the name `organism_name`, set `id_organism` with its ID
+            #   - else, set `id_organism` with the ID of a newly created organism
+            id_organism = organisms.get_id(actor)
         cd_nomenclature_actor_role = actor["actor_role"]
-        id_nomenclature_actor_role = func.ref_nomenclatures.get_id_nomenclature(
+        id_nomenclature_actor_role = context.nomenclatures.get_id(
             "ROLE_ACTEUR", cd_nomenclature_actor_role
         )
+        if id_nomenclature_actor_role is None:
+            logger.warning(
+                f"MTD - actor association impossible for {type_mtd} with UUID '{uuid_mtd}'"
+                f" because the actor role '{cd_nomenclature_actor_role}' is not found in database"
+                f" - with the following actor information:"
+                f"\n" + format_str_dict_actor_for_logging(actor)
+            )
+            context.report["actors_not_associated"] += 1
+            continue
         values = dict(
             id_nomenclature_actor_role=id_nomenclature_actor_role,
             **{pk_name: pk_value},
@@ -315,114 +633,241 @@ def associate_actors(
         # Try to associate to an organism first, and if that is impossible, to a user
         if id_organism:
             values["id_organism"] = id_organism
+            context.report["actors_by_organism"] += 1
         # TODO: handle case where no user is retrieved for the actor email:
         #   - (retained) If the actor role is "Contact Principal" associate to a new user with only a UUID and an ID, else just do not try to associate the actor with the metadata
         #   - Try to retrieve an id_organism from the organism name - field `organism`
         #   - Try to retrieve an id_organism from the actor email considered as an organism email - field `email`
         #   - Try to insert a new user from the actor name - field `name` - and possibly also email - field `email`
         else:
-            id_user_from_email = DB.session.scalar(
-                select(User.id_role).filter_by(email=email_actor).where(User.groupe.is_(False))
-            )
+            id_user_from_email = context.roles.get_id(email_actor)
             if id_user_from_email:
                 values["id_role"] = id_user_from_email
+                context.report["actors_by_email"] += 1
             else:
                 # If actor role is "Contact Principal", i.e. cd_nomenclature_actor_role = '1' ,
                 #   then we use a dedicated user for 'orphan' metadata - metadata with no associated "Contact principal" actor that could be retrieved
-                #   the three non-null fields for `utilisateurs.t_roles` will be set to default:
-                #       - `groupe`: False - the role is a user and not a group
-                #       - `id_role`: generated by the nextval sequence
-                #       - `uuid_role`: generated by uuid_generate_v4()
-                #   in particular:
-                #       - we do not specify field `email` even if `email_actor` is to be set
-                #       - only the field `dec_role` will be written to a non-default value, so as to identify this particular "Contact principal"-for-orphan-metadata user
+                #   see `get_or_create_orphan_contact_user`
                 cd_nomenclature_actor_role_for_contact_principal_af = "1"
                 if (
                     type_mtd == "AF"
                     and cd_nomenclature_actor_role
                     == cd_nomenclature_actor_role_for_contact_principal_af
                 ):
-                    # Retrieve the "Contact principal"-for-orphan-metadata user
-                    desc_role_for_user_contact_principal_for_orphan_metadata = "Contact principal for 'orphan' metadata - i.e. with no 'Contact Principal' that could be retrieved during INPN MTD synchronisation"
-                    id_user_contact_principal_for_orphan_metadata = 0
-                    user_contact_principal_for_orphan_metadata = DB.session.get(
-                        User, id_user_contact_principal_for_orphan_metadata
-                    )
-                    # /!\ Assert that the user with ID 0 retrieved is actually the "Contact principal"-for-orphan-metadata user with the right "desc_role"
-                    #   If an error is raised, one must choose how to handle this situation:
-                    #       - Check for the current user with ID 0
-                    #       - Possibly change the ID of this user to an ID other than 0
-                    #           /!\ Be careful to the other entries associated to this user
-                    #           /!\ Be careful when choosing a new ID : positive integer should be reserved for users retrieved from the INPN
-                    #       - Eventually change the code to:
-                    #           - set an ID other than 0 for the "Contact principal"-for-orphan-metadata user
-                    #           - possibly allow to configure a different ID for different GN instances
-                    if user_contact_principal_for_orphan_metadata:
-                        assert (
-                            user_contact_principal_for_orphan_metadata.desc_role
-                            == desc_role_for_user_contact_principal_for_orphan_metadata
-                        )
-                    # If the user does not yet exist, create it
-                    else:
-                        dict_data_generated_user = {
-                            "id_role": id_user_contact_principal_for_orphan_metadata,
-                            "desc_role": desc_role_for_user_contact_principal_for_orphan_metadata,
-                        }
-                        id_provider_inpn = current_app.config["MTD_SYNC"]["ID_PROVIDER_INPN"]
-                        idprov = AuthenficationCASINPN()
-                        idprov.id_provider = id_provider_inpn
-                        dict_data_generated_user = idprov.insert_or_update_role(
-                            user_dict=dict_data_generated_user,
-                            reconciliate_attr="desc_role",
-                        )
-                    # Commit to ensure that the insert from previous statement is actually committed
-                    DB.session.commit()
-                    values["id_role"] = id_user_contact_principal_for_orphan_metadata
+                    # The "Contact principal"-for-orphan-metadata user is ensured once for the whole synchronization
+                    if context.id_orphan_contact is None:
+                        context.id_orphan_contact = get_or_create_orphan_contact_user()
+                    values["id_role"] = context.id_orphan_contact
+                    context.report["actors_orphan_contact"] += 1
                 else:
                     logger.warning(
                         f"MTD - actor association impossible for {type_mtd} with UUID '{uuid_mtd}' because no id_organism nor id_role could be retrieved - with the following actor information:\n"
                         + format_str_dict_actor_for_logging(actor)
                     )
+                    context.report["actors_not_associated"] += 1
                     continue
-        try:
-            statement = (
+        actor_rows.append((values, actor, uuid_mtd))
+    return actor_rows
+
+
+def get_or_create_orphan_contact_user() -> int:
+    """
+    Retrieve, or create if it does not exist yet, the dedicated user associated as "Contact principal"
+    to the 'orphan' metadata - AF with no associated "Contact principal" actor that could be retrieved.
+
+    The three non-null fields for `utilisateurs.t_roles` are set to default:
+        - `groupe`: False - the role is a user and not a group
+        - `id_role`: generated by the nextval sequence
+        - `uuid_role`: generated by uuid_generate_v4()
+    In particular, the field `email` is not specified, and only the field `desc_role` is written
+    to a non-default value, so as to identify this particular user.
+    The user is created - and committed - by the identity provider.
+
+    Returns
+    -------
+    int
+        ID of the "Contact principal"-for-orphan-metadata user
+    """
+    # Retrieve the "Contact principal"-for-orphan-metadata user
+    desc_role_for_user_contact_principal_for_orphan_metadata = "Contact principal for 'orphan' metadata - i.e. with no 'Contact Principal' that could be retrieved during INPN MTD synchronisation"
+    id_user_contact_principal_for_orphan_metadata = 0
+    user_contact_principal_for_orphan_metadata = DB.session.get(
+        User, id_user_contact_principal_for_orphan_metadata
+    )
+    # /!\ Assert that the user with ID 0 retrieved is actually the "Contact principal"-for-orphan-metadata user with the right "desc_role"
+    #   If an error is raised, one must choose how to handle this situation:
+    #       - Check for the current user with ID 0
+    #       - Possibly change the ID of this user to an ID other than 0
+    #           /!\ Be careful to the other entries associated to this user
+    #           /!\ Be careful when choosing a new ID : positive integer should be reserved for users retrieved from the INPN
+    #       - Eventually change the code to:
+    #           - set an ID other than 0 for the "Contact principal"-for-orphan-metadata user
+    #           - possibly allow to configure a different ID for different GN instances
+    if user_contact_principal_for_orphan_metadata:
+        assert (
+            user_contact_principal_for_orphan_metadata.desc_role
+            == desc_role_for_user_contact_principal_for_orphan_metadata
+        )
+    # If the user does not yet exist, create it
+    else:
+        dict_data_generated_user = {
+            "id_role": id_user_contact_principal_for_orphan_metadata,
+            "desc_role": desc_role_for_user_contact_principal_for_orphan_metadata,
+        }
+        id_provider_inpn = current_app.config["MTD_SYNC"]["ID_PROVIDER_INPN"]
+        idprov = AuthenficationCASINPN()
+        idprov.id_provider = id_provider_inpn
+        dict_data_generated_user = idprov.insert_or_update_role(
+            user_dict=dict_data_generated_user,
+            reconciliate_attr="desc_role",
+        )
+    return id_user_contact_principal_for_orphan_metadata
+
+
+def write_actor_rows(
+    CorActor: Union[CorAcquisitionFrameworkActor, CorDatasetActor],
+    pk_name: Literal["id_acquisition_framework", "id_dataset"],
+    actor_rows,
+    chunk_size: int = 1000,
+    failed_uuids: set = None,
+):
+    """
+    Write rows associating actors with acquisition frameworks or datasets, with multi-row inserts.
+
+    Rows are deduplicated on the keys of the unique constraints beforehand. A chunk of rows is
+    written in a savepoint: if it fails, its rows are written one by one so that only the failing
+    rows are left out, without rolling back the session.
+
+    Parameters
+    ----------
+    CorActor : Union[CorAcquisitionFrameworkActor, CorDatasetActor]
+        the SQLAlchemy model corresponding to the destination table
+    pk_name : Literal['id_acquisition_framework', 'id_dataset']
+        pk attribute name
+    actor_rows : Iterable[tuple]
+        rows built by `get_actor_rows`
+    chunk_size : int
+        maximum number of rows by statement
+    failed_uuids : set, optional
+        if provided, the UUIDs of the AFs or DS whose rows fail to be written are added to it
+    """
+    type_mtd = "AF" if pk_name == "id_acquisition_framework" else "DS"
+    actor_rows_by_key = {"id_organism": {}, "id_role": {}}
+    for values, actor, uuid_mtd in actor_rows:
+        actor_key = "id_organism" if "id_organism" in values else "id_role"
+        conflict_key = (values[pk_name], values[actor_key], values["id_nomenclature_actor_role"])
+        actor_rows_by_key[actor_key].setdefault(conflict_key, (values, actor, uuid_mtd))
+
+    def log_error(actor_row, error):
+        values, actor, uuid_mtd = actor_row
+        logger.error(
+            f"MTD - DB INTEGRITY ERROR - actor association failed for {type_mtd} with UUID '{uuid_mtd}' and following actor information:\n"
+            + format_sqlalchemy_error_for_logging(error)
+            + format_str_dict_actor_for_logging(actor)
+        )
+        if failed_uuids is not None:
+            failed_uuids.add(to_uuid(uuid_mtd))
+
+    for actor_key, actor_rows_with_key in actor_rows_by_key.items():
+
+        def build_insert(chunk):
+            return (
                 pg_insert(CorActor)
-                .values(**values)
+                .values([values for values, _, _ in chunk])
                 .on_conflict_do_nothing(
-                    index_elements=[
-                        pk_name,
-                        "id_organism" if id_organism else "id_role",
-                        "id_nomenclature_actor_role",
-                    ],
+                    index_elements=[pk_name, actor_key, "id_nomenclature_actor_role"],
                 )
             )
-            DB.session.execute(statement)
-        except IntegrityError as I:
-            DB.session.rollback()
-            logger.error(
-                f"MTD - DB INTEGRITY ERROR - actor association failed for {type_mtd} with UUID '{uuid_mtd}' and following actor information:\n"
-                + format_sqlalchemy_error_for_logging(I)
-                + format_str_dict_actor_for_logging(actor)
-            )
 
+        for chunk in iter_chunks(actor_rows_with_key.values(), chunk_size):
+            execute_isolated(build_insert, chunk, log_error)
 
-def associate_dataset_modules(dataset):
+
+def associate_actors(
+    actors,
+    CorActor: Union[CorAcquisitionFrameworkActor, CorDatasetActor],
+    pk_name: Literal["id_acquisition_framework", "id_dataset"],
+    pk_value: str,
+    uuid_mtd: str,
+    context: SyncContext,
+):
     """
-    Associate a dataset to modules specified in [MTD][JDD_MODULE_CODE_ASSOCIATION] parameter (geonature config)
+    Associate actors with either a given :
+    - Acquisition framework - writing to the table `gn_meta.cor_acquisition_framework_actor`.
+    - Dataset - writing to the table `gn_meta.cor_dataset_actor`.
 
-    :param dataset: <geonature.core.gn_meta.models.TDatasets> dataset (SQLAlchemy model object)
+    Parameters
+    ----------
+    actors : list
+        list of actors
+    CorActor : Union[CorAcquisitionFrameworkActor, CorDatasetActor]
+        the SQLAlchemy model corresponding to the destination table
+        effectively CorAcquisitionFrameworkActor or CorDatasetActor
+    pk_name : Literal['id_acquisition_framework', 'id_dataset']
+        pk attribute name:
+        - 'id_acquisition_framework' for AF
+        - 'id_dataset' for DS
+    pk_value : str
+        pk value: ID of the AF or DS
+    uuid_mtd : str
+        UUID of the AF or DS
+    context : SyncContext
+        resolvers of the nomenclatures, organisms and users, and report of the synchronization
     """
-    dataset.modules.extend(
-        DB.session.scalars(
-            select(TModules).where(
-                TModules.module_code.in_(
-                    current_app.config["MTD_SYNC"]["JDD_MODULE_CODE_ASSOCIATION"]
-                )
-            )
-        ).all()
+    write_actor_rows(
+        CorActor,
+        pk_name,
+        get_actor_rows(actors, pk_name, pk_value, uuid_mtd, context),
+        failed_uuids=context.failed_uuids["AF" if pk_name == "id_acquisition_framework" else "DS"],
     )
 
 
+def get_dataset_module_ids() -> list:
+    """
+    Retrieve the IDs of the modules specified in [MTD][JDD_MODULE_CODE_ASSOCIATION] parameter
+    (geonature config), which new datasets are associated to.
+
+    Returns
+    -------
+    list
+        IDs of the modules
+    """
+    return DB.session.scalars(
+        select(TModules.id_module).where(
+            TModules.module_code.in_(current_app.config["MTD_SYNC"]["JDD_MODULE_CODE_ASSOCIATION"])
+        )
+    ).all()
+
+
+def associate_datasets_modules(id_datasets, id_modules, chunk_size: int = 1000):
+    """
+    Associate datasets to modules, inserting the links into the association table of
+    `TDatasets.modules` with multi-row inserts. Existing links are left as is, and the
+    relationship is not loaded.
+
+    Parameters
+    ----------
+    id_datasets : Iterable[int]
+        IDs of the datasets
+    id_modules : list
+        IDs of the modules, see `get_dataset_module_ids`
+    chunk_size : int
+        maximum number of links by statement
+    """
+    if not id_modules:
+        return
+    cor_module_dataset = TDatasets.modules.property.secondary
+    for chunk in iter_chunks(
+        (
+            {"id_module": id_module, "id_dataset": id_dataset}
+            for id_dataset in id_datasets
+            for id_module in id_modules
+        ),
+        chunk_size,
+    ):
+        DB.session.execute(pg_insert(cor_module_dataset).values(chunk).on_conflict_do_nothing())
+
+
 def format_sqlalchemy_error_for_logging(error: SQLAlchemyError):
     """
     Format SQLAlchemy error information in a nice way for MTD logging
@@ -456,7 +901,7 @@ def format_str_dict_actor_for_logging(actor: dict):
 
     Parameters
     ----------
-    actor : dict
+    actor : Mapping
         actor information: actor_role, email, name, organism, uuid_organism, ...
 
     Returns
@@ -464,7 +909,7 @@ def format_str_dict_actor_for_logging(actor: dict):
     str
         formatted actor information
     """
-    formatted_str_dict_actor = "\tACTOR:\n\t\t" + pprint.pformat(actor).replace(
+    formatted_str_dict_actor = "\tACTOR:\n\t\t" + pprint.pformat(dict(actor)).replace(
         "\n", "\n\t\t"
     ).rstrip("\t")
 
@@ -1,10 +1,31 @@
-from geonature.utils import utilsrequests
+import requests
+
 from geonature.utils.errors import GeonatureApiError
 from geonature.utils.config import config
 
+from .http_client import get_http_client
+
 api_endpoint = config["MTD_SYNC"]["MTD_API_ENDPOINT"]
 
 
+def _get(url):
+    """
+    GET an URL of the MTD WS through the shared HTTP client
+
+    Parameters:
+        - url (str): the URL to request
+    Returns:
+        requests.Response: the response
+    """
+    try:
+        return get_http_client().get(url)
+    except requests.ConnectionError:
+        raise GeonatureApiError(message="URL {} is not reachable".format(url))
+    except requests.RequestException as error:
+        # e.g. a read timeout, as the shared client sets a default timeout
+        raise GeonatureApiError(message="Error while requesting URL {}: {}".format(url, error))
+
+
 def get_acquisition_framework(uuid_af):
     """
     Fetch a AF from the MTD WS with the uuid of the AD
@@ -16,7 +37,7 @@ def get_acquisition_framework(uuid_af):
     """
     url = "{}/cadre/export/xml/GetRecordById?id={}"
     try:
-        r = utilsrequests.get(url.format(api_endpoint, uuid_af))
+        r = _get(url.format(api_endpoint, uuid_af))
     except AssertionError:
         raise GeonatureApiError(
             message="Error with the MTD Web Service while getting Acquisition Framwork"
@@ -33,7 +54,7 @@ def get_jdd_by_user_id(id_user):
     """
     url = "{}/cadre/jdd/export/xml/GetRecordsByUserId?id={}"
     try:
-        r = utilsrequests.get(url.format(api_endpoint, str(id_user)))
+        r = _get(url.format(api_endpoint, str(id_user)))
         assert r.status_code == 200
     except AssertionError:
         raise GeonatureApiError(
@@ -45,7 +66,7 @@ def get_jdd_by_user_id(id_user):
 def get_jdd_by_uuid(uuid):
     ds_URL = f"{api_endpoint}/cadre/jdd/export/xml/GetRecordById?id={uuid.upper()}"
     try:
-        r = utilsrequests.get(ds_URL)
+        r = _get(ds_URL)
         assert r.status_code == 200
     except AssertionError:
         print(f"NO JDD FOUND FOR UUID {uuid}")
@@ -0,0 +1,125 @@
+import sys
+from collections.abc import MutableMapping
+
+
+def intern_str(value):
+    """
+    Intern a string parsed from the XML, so that repeated values (organisms, roles, ...) are
+    stored only once in memory.
+
+    Parameters
+    ----------
+    value : str or None
+        the parsed value
+
+    Returns
+    -------
+    str or None
+        the interned string, or the value itself if it is not a string
+    """
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+class Record(MutableMapping):
+    """
+    Compact record parsed from an XML export of 'INPN Métadonnées'.
+
+    Fields are stored in `__slots__`, which avoids a per-record `__dict__`. The record is also a
+    mutable mapping whose keys are the fields that are set, in the order of `__slots__`: it can be
+    used wherever the parsed dict used to be (`record["field"]`, `record.pop("field")`,
+    `**record`, ...). Deleting a key unsets the field.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for field, value in fields.items():
+            self[field] = value
+
+    def __getitem__(self, field):
+        if field in self.__slots__:
+            try:
+                return getattr(self, field)
+            except AttributeError:
+                pass
+        raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def __delitem__(self, field):
+        if field in self.__slots__:
+            try:
+                delattr(self, field)
+                return
+            except AttributeError:
+                pass
+        raise KeyError(field)
+
+    def __iter__(self):
+        for field in self.__slots__:
+            if hasattr(self, field):
+                yield field
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class ActorRecord(Record):
+    """
+    Actor of an acquisition framework or of a dataset.
+    """
+
+    __slots__ = ("name", "uuid_organism", "organism", "actor_role", "email")
+
+
+class AcquisitionFrameworkRecord(Record):
+    """
+    Acquisition framework, with its actors.
+    """
+
+    __slots__ = (
+        "unique_acquisition_framework_id",
+        "acquisition_framework_name",
+        "acquisition_framework_desc",
+        "acquisition_framework_start_date",
+        "acquisition_framework_end_date",
+        "meta_create_date",
+        "meta_update_date",
+        "id_digitizer",
+        "actors",
+    )
+
+
+class DatasetRecord(Record):
+    """
+    Dataset, with its actors.
+
+    `id_acquisition_framework` is not parsed: it is set once the acquisition framework of the
+    dataset is resolved in the database.
+    """
+
+    __slots__ = (
+        "unique_dataset_id",
+        "uuid_acquisition_framework",
+        "dataset_name",
+        "dataset_shortname",
+        "dataset_desc",
+        "keywords",
+        "terrestrial_domain",
+        "marine_domain",
+        "cd_nomenclature_data_type",
+        "id_digitizer",
+        "cd_nomenclature_data_origin",
+        "actors",
+        "meta_create_date",
+        "meta_update_date",
+        "id_acquisition_framework",
+    )
@@ -0,0 +1,547 @@
+from collections import Counter
+from itertools import islice
+import logging
+import threading
+import time
+import uuid
+
+from sqlalchemy import Unicode, cast, column, func, select, update, values
+from sqlalchemy.dialects.postgresql import UUID, insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+
+from geonature.utils.env import DB
+from pypnnomenclature.models import BibNomenclaturesTypes, TNomenclatures
+from pypnusershub.db.models import Organisme as BibOrganismes, User
+
+# Get the logger instance "MTD_SYNC"
+logger = logging.getLogger("MTD_SYNC")
+
+NOMENCLATURE_MAPPING = {
+    "cd_nomenclature_data_type": "DATA_TYP",
+    "cd_nomenclature_dataset_objectif": "JDD_OBJECTIFS",
+    "cd_nomenclature_data_origin": "DS_PUBLIQUE",
+    "cd_nomenclature_source_status": "STATUT_SOURCE",
+}
+NOMENCLATURE_TYPES = (*NOMENCLATURE_MAPPING.values(), "ROLE_ACTEUR")
+
+_nomenclature_resolver = None
+_nomenclature_resolver_lock = threading.Lock()
+
+
+def iter_chunks(items, chunk_size):
+    """
+    Split an iterable in lists of at most `chunk_size` items.
+
+    Parameters
+    ----------
+    items : Iterable
+        items to split
+    chunk_size : int
+        maximum number of items in a chunk
+
+    Yields
+    ------
+    list
+        the successive chunks
+    """
+    iterator = iter(items)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+def to_uuid(value):
+    """
+    Convert an UUID parsed from the XML, or retrieved from the database, to an `uuid.UUID`.
+
+    Parameters
+    ----------
+    value : str or uuid.UUID or None
+        the UUID
+
+    Returns
+    -------
+    uuid.UUID or None
+        the UUID, or None if `value` is empty or is not a valid UUID
+    """
+    if not value:
+        return None
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def execute_isolated(build_statement, rows, on_error) -> list:
+    """
+    Execute a statement built for rows in a savepoint. If it fails on a constraint, execute the
+    statement again row by row, so that only the failing rows are left out.
+
+    Parameters
+    ----------
+    build_statement : callable
+        function returning the statement for a list of rows
+    rows : list
+        the rows
+    on_error : callable
+        function called with a failing row and the `IntegrityError`
+
+    Returns
+    -------
+    list
+        the rows returned by the successful statements, if any
+    """
+    try:
+        with DB.session.begin_nested():
+            result = DB.session.execute(build_statement(rows))
+            return result.all() if result.returns_rows else []
+    except IntegrityError as error:
+        if len(rows) == 1:
+            on_error(rows[0], error)
+            return []
+    returned_rows = []
+    for row in rows:
+        returned_rows.extend(execute_isolated(build_statement, [row], on_error))
+    return returned_rows
+
+
+def log_organism_error(organism, error):
+    logger.warning(f"MTD - organism not written : {organism} - {error.orig}")
+
+
+class NomenclatureResolver:
+    """
+    In-memory map of the IDs of the nomenclatures used by the synchronization, by type mnemonic and
+    code.
+
+    It replaces calls to the SQL function `ref_nomenclatures.get_id_nomenclature` for each record.
+    The map is loaded once and only reloaded by `refresh` when the nomenclatures have changed.
+    """
+
+    def __init__(self, types=NOMENCLATURE_TYPES):
+        """
+        Parameters
+        ----------
+        types : Iterable[str]
+            mnemonics of the nomenclature types to load
+        """
+        self.types = tuple(types)
+        self._ids = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _get_version(self):
+        # Changes whenever a nomenclature is inserted, deleted or updated - as the update date is
+        #   set by a trigger on `ref_nomenclatures.t_nomenclatures`
+        return tuple(
+            DB.session.execute(
+                select(
+                    func.count(TNomenclatures.id_nomenclature),
+                    func.max(TNomenclatures.id_nomenclature),
+                    func.max(TNomenclatures.meta_update_date),
+                )
+            ).one()
+        )
+
+    def refresh(self):
+        """
+        Load the nomenclatures, unless they have not changed since they were last loaded.
+        """
+        version = self._get_version()
+        with self._lock:
+            if version == self._version:
+                return
+            self._ids = {
+                (mnemonique, cd_nomenclature): id_nomenclature
+                for mnemonique, cd_nomenclature, id_nomenclature in DB.session.execute(
+                    select(
+                        BibNomenclaturesTypes.mnemonique,
+                        TNomenclatures.cd_nomenclature,
+                        TNomenclatures.id_nomenclature,
+                    )
+                    .join(
+                        BibNomenclaturesTypes,
+                        BibNomenclaturesTypes.id_type == TNomenclatures.id_type,
+                    )
+                    .where(BibNomenclaturesTypes.mnemonique.in_(self.types))
+                )
+            }
+            self._version = version
+        logger.debug("MTD - NOMENCLATURES LOADED : %s" % len(self._ids))
+
+    def get_id(self, type_mnemonique, cd_nomenclature):
+        """
+        Return the ID of a nomenclature, as `ref_nomenclatures.get_id_nomenclature` does.
+
+        Parameters
+        ----------
+        type_mnemonique : str
+            mnemonic of the nomenclature type, e.g. "ROLE_ACTEUR"
+        cd_nomenclature : str
+            code of the nomenclature
+
+        Returns
+        -------
+        int or None
+            ID of the nomenclature, or None if there is no such nomenclature
+        """
+        if self._version is None:
+            self.refresh()
+        return self._ids.get((type_mnemonique, cd_nomenclature))
+
+
+def get_nomenclature_resolver() -> NomenclatureResolver:
+    """
+    Return the nomenclature resolver shared by the whole module.
+
+    Returns
+    -------
+    NomenclatureResolver
+        the shared nomenclature resolver
+    """
+    global _nomenclature_resolver
+    if _nomenclature_resolver is None:
+        with _nomenclature_resolver_lock:
+            if _nomenclature_resolver is None:
+                _nomenclature_resolver = NomenclatureResolver()
+    return _nomenclature_resolver
+
+
+class OrganismResolver:
+    """
+    IDs of the organisms of the actors, for the whole synchronization.
+
+    The organisms of a batch of actors are resolved - and created or updated - in
+    `utilisateurs.bib_organismes` with a few set-based statements, see `prepare`. Their IDs are
+    then served from memory: an organism shared by many actors costs no further query.
+    """
+
+    def __init__(self, chunk_size=1000):
+        """
+        Parameters
+        ----------
+        chunk_size : int
+            maximum number of organisms by statement
+        """
+        self.chunk_size = chunk_size
+        # ID of the organisms, or None if the organism could not be resolved
+        self._id_by_uuid = {}
+        self._id_by_name = {}
+
+    def prepare(self, actors):
+        """
+        Resolve the organisms of actors, unless already resolved.
+
+        An organism with an UUID is created, or updated with the name of the organism and the email
+        of the actor ; if several actors share an organism, the last one is retained.
+        An organism with only a name is retrieved by name, or created with a new UUID.
+
+        Parameters
+        ----------
+        actors : Iterable[Mapping]
+            actors, with keys `uuid_organism`, `organism` and `email`
+        """
+        organisms_by_uuid = {}
+        organism_names = {}
+        for actor in actors:
+            organism_name = actor.get("organism", None)
+            if actor["uuid_organism"]:
+                uuid_organism = to_uuid(actor["uuid_organism"])
+                if uuid_organism is None:
+                    logger.warning(
+                        f"MTD - invalid organism UUID '{actor['uuid_organism']}' for organism '{organism_name}'"
+                    )
+                elif organism_name and uuid_organism not in self._id_by_uuid:
+                    organisms_by_uuid[uuid_organism] = {
+                        "uuid_organisme": uuid_organism,
+                        "nom_organisme": organism_name,
+                        "email_organisme": actor["email"],
+                    }
+            elif organism_name and organism_name not in self._id_by_name:
+                organism_names[organism_name] = None
+        for chunk in iter_chunks(organisms_by_uuid.values(), self.chunk_size):
+            self._upsert_by_uuid(chunk)
+        for chunk in iter_chunks(organism_names, self.chunk_size):
+            self._get_or_create_by_name(chunk)
+
+    def get_id(self, actor):
+        """
+        Return the ID of the organism of an actor, resolving it if not done yet.
+
+        Parameters
+        ----------
+        actor : Mapping
+            actor, with keys `uuid_organism`, `organism` and `email`
+
+        Returns
+        -------
+        int or None
+            ID of the organism, or None if the actor has no organism or if it could not be resolved
+        """
+        self.prepare([actor])
+        if actor["uuid_organism"]:
+            return self._id_by_uuid.get(to_uuid(actor["uuid_organism"]))
+        return self._id_by_name.get(actor.get("organism", None))
+
+    def _upsert_by_uuid(self, organisms):
+        existing_organisms = {
+            to_uuid(organism.uuid_organisme): organism
+            for organism in DB.session.execute(
+                select(
+                    BibOrganismes.id_organisme,
+                    BibOrganismes.uuid_organisme,
+                    BibOrganismes.nom_organisme,
+                    BibOrganismes.email_organisme,
+                ).where(
+                    BibOrganismes.uuid_organisme.in_(
+                        [organism["uuid_organisme"] for organism in organisms]
+                    )
+                )
+            )
+        }
+        organisms_to_update = []
+        organisms_to_insert = []
+        for organism in organisms:
+            existing_organism = existing_organisms.get(organism["uuid_organisme"])
+            if existing_organism is None:
+                organisms_to_insert.append(organism)
+                continue
+            self._id_by_uuid[organism["uuid_organisme"]] = existing_organism.id_organisme
+            if (existing_organism.nom_organisme, existing_organism.email_organisme) != (
+                organism["nom_organisme"],
+                organism["email_organisme"],
+            ):
+                organisms_to_update.append(organism)
+
+        def build_update(rows):
+            organism_values = values(
+                column("uuid_organisme", UUID(as_uuid=True)),
+                column("nom_organisme", Unicode),
+                column("email_organisme", Unicode),
+                name="organism_values",
+            ).data(
+                [
+                    (row["uuid_organisme"], row["nom_organisme"], row["email_organisme"])
+                    for row in rows
+                ]
+            )
+            return (
+                update(BibOrganismes)
+                # Columns of a VALUES list are sent as text
+                .where(
+                    BibOrganismes.uuid_organisme
+                    == cast(organism_values.c.uuid_organisme, UUID(as_uuid=True))
+                )
+                .values(
+                    nom_organisme=organism_values.c.nom_organisme,
+                    email_organisme=organism_values.c.email_organisme,
+                )
+                .returning(BibOrganismes.id_organisme)
+            )
+
+        def build_insert(rows):
+            # Insert only new organisms, rather than upsert, to avoid increasing the sequence
+            return (
+                pg_insert(BibOrganismes)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=["uuid_organisme"])
+                .returning(BibOrganismes.id_organisme, BibOrganismes.uuid_organisme)
+            )
+
+        if organisms_to_update:
+            execute_isolated(build_update, organisms_to_update, log_organism_error)
+        if organisms_to_insert:
+            for organism in execute_isolated(
+                build_insert, organisms_to_insert, log_organism_error
+            ):
+                self._id_by_uuid[to_uuid(organism.uuid_organisme)] = organism.id_organisme
+            # Organisms inserted meanwhile are skipped by `ON CONFLICT DO NOTHING`
+            missing_uuids = [
+                organism["uuid_organisme"]
+                for organism in organisms_to_insert
+                if organism["uuid_organisme"] not in self._id_by_uuid
+            ]
+            if missing_uuids:
+                for id_organism, uuid_organism in DB.session.execute(
+                    select(BibOrganismes.id_organisme, BibOrganismes.uuid_organisme).where(
+                        BibOrganismes.uuid_organisme.in_(missing_uuids)
+                    )
+                ):
+                    self._id_by_uuid[to_uuid(uuid_organism)] = id_organism
+        for organism in organisms_to_insert:
+            self._id_by_uuid.setdefault(organism["uuid_organisme"], None)
+
+    def _get_or_create_by_name(self, organism_names):
+        def select_by_name(names):
+            if not names:
+                return
+            for id_organism, organism_name in DB.session.execute(
+                select(BibOrganismes.id_organisme, BibOrganismes.nom_organisme)
+                .where(BibOrganismes.nom_organisme.in_(names))
+                .order_by(BibOrganismes.id_organisme)
+            ):
+                self._id_by_name.setdefault(organism_name, id_organism)
+
+        def build_insert(names):
+            # /!\ The actor email is not used as the organism email: only the three non-null
+            #   fields will be written: `id_organisme`, `uuid_organisme`, `nom_organisme`
+            return (
+                pg_insert(BibOrganismes)
+                .values(
+                    [{"uuid_organisme": uuid.uuid4(), "nom_organisme": name} for name in names]
+                )
+                .on_conflict_do_nothing()
+                .returning(BibOrganismes.id_organisme, BibOrganismes.nom_organisme)
+            )
+
+        select_by_name(organism_names)
+        missing_names = [name for name in organism_names if name not in self._id_by_name]
+        if missing_names:
+            for id_organism, organism_name in execute_isolated(
+                build_insert, missing_names, log_organism_error
+            ):
+                self._id_by_name[organism_name] = id_organism
+            # Organisms inserted meanwhile are skipped by `ON CONFLICT DO NOTHING`
+            select_by_name([name for name in missing_names if name not in self._id_by_name])
+        for name in organism_names:
+            self._id_by_name.setdefault(name, None)
+
+
+class RoleResolver:
+    """
+    IDs of the users matching the email of actors, for the whole synchronization.
+
+    The emails of a batch of actors are looked up with one query by chunk, see `prepare`. Emails
+    matching no user are remembered as well, so that they are not looked up again.
+    """
+
+    def __init__(self, chunk_size=1000):
+        """
+        Parameters
+        ----------
+        chunk_size : int
+            maximum number of emails by query
+        """
+        self.chunk_size = chunk_size
+        # ID of the user, or None if no user matches the email
+        self._id_by_email = {}
+
+    def prepare(self, emails):
+        """
+        Look up the users matching emails, unless already looked up.
+
+        Parameters
+        ----------
+        emails : Iterable[str]
+            emails of actors
+        """
+        emails = [
+            email for email in dict.fromkeys(emails) if email and email not in self._id_by_email
+        ]
+        for chunk in iter_chunks(emails, self.chunk_size):
+            for id_role, email in DB.session.execute(
+                select(User.id_role, User.email)
+                .where(User.email.in_(chunk), User.groupe.is_(False))
+                .order_by(User.id_role)
+            ):
+                self._id_by_email.setdefault(email, id_role)
+            for email in chunk:
+                self._id_by_email.setdefault(email, None)
+
+    def get_id(self, email):
+        """
+        Return the ID of the user - not a group - matching an email.
+
+        Parameters
+        ----------
+        email : str
+            email of an actor
+
+        Returns
+        -------
+        int or None
+            ID of the user, or None if no user matches the email
+        """
+        self.prepare([email])
+        return self._id_by_email.get(email)
+
+
+class SyncContext:
+    """
+    State shared by the steps of a synchronization: the resolvers of the IDs referenced by the
+    records, and the counters reported at the end of the synchronization.
+    """
+
+    def __init__(self, chunk_size=1000, deadline=None):
+        """
+        Parameters
+        ----------
+        chunk_size : int
+            maximum number of rows by statement
+        deadline : float, optional
+            `time.monotonic()` past which the writes stop, between two batches or stages
+        """
+        self.nomenclatures = get_nomenclature_resolver()
+        self.nomenclatures.refresh()
+        self.organisms = OrganismResolver(chunk_size=chunk_size)
+        self.roles = RoleResolver(chunk_size=chunk_size)
+        # ID of the "Contact principal"-for-orphan-metadata user, once ensured
+        self.id_orphan_contact = None
+        # IDs of the modules new datasets are associated to, once retrieved
+        self.id_dataset_modules = None
+        # UUIDs of the AF and DS written, and of those which failed - on a database error, or with
+        #   actors failing to be associated - by object type ("AF", "DS"). The records skipped by
+        #   validation, e.g. a DS whose AF is not in the database, are in neither.
+        self.written_uuids = {"AF": set(), "DS": set()}
+        self.failed_uuids = {"AF": set(), "DS": set()}
+        self.deadline = deadline
+        # Records not processed as the deadline passed, with their actors, by object type
+        self.remaining = {"AF": [], "DS": []}
+        self.report = Counter()
+
+    def is_past_deadline(self) -> bool:
+        """
+        Return whether the deadline of the synchronization, if any, has passed.
+        """
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def get_written_uuids(self, object_type: str) -> set:
+        """
+        Return the UUIDs of the records written, whose actors have all been associated.
+
+        Parameters
+        ----------
+        object_type : str
+            type of the records: "AF" or "DS"
+
+        Returns
+        -------
+        set
+            the UUIDs, as `uuid.UUID`
+        """
+        return self.written_uuids[object_type] - self.failed_uuids[object_type]
+
+    def log_report(self):
+        """
+        Log how many rows have actually been changed, how the actors have been associated with
+        the metadata, and how many records have been left out by their fingerprint.
+        """
+        for object_type in ("AF", "DS"):
+            prefix = object_type.lower()
+            logger.info(
+                f"MTD - {object_type} ROWS : {self.report[f'{prefix}_inserted']} inserted"
+                f" + {self.report[f'{prefix}_updated']} updated"
+                f" + {self.report[f'{prefix}_unchanged']} unchanged (update skipped)"
+            )
+        if self.report["fingerprint_hits"] or self.report["fingerprint_misses"]:
+            logger.info(
+                f"MTD - FINGERPRINTS : {self.report['fingerprint_hits']} hits (unchanged - SKIPPED)"
+                f" + {self.report['fingerprint_misses']} misses (new or changed)"
+            )
+        logger.info(
+            f"MTD - ACTORS : {self.report['actors_by_organism']} associated through their organism"
+            f" + {self.report['actors_by_email']} associated through their email"
+            f" + {self.report['actors_orphan_contact']} associated to the 'orphan' metadata contact"
+            f" + {self.report['actors_not_associated']} not associated"
+        )
@@ -0,0 +1,463 @@
+import io
+import logging
+from collections import Counter
+
+from geonature.core.gn_meta.models import TAcquisitionFramework, TDatasets
+from geonature.utils.env import DB
+from pypnnomenclature.models import BibNomenclaturesTypes, TNomenclatures
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Integer,
+    MetaData,
+    Table,
+    Unicode,
+    and_,
+    case,
+    exists,
+    func,
+    literal_column,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import UUID, insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+
+from .mtd_utils import is_distinct_from, write_actor_rows
+from .records import AcquisitionFrameworkRecord, DatasetRecord
+from .resolvers import NOMENCLATURE_MAPPING, iter_chunks, to_uuid
+
+# Get the logger instance "MTD_SYNC"
+logger = logging.getLogger("MTD_SYNC")
+
+AF_FIELDS = [field for field in AcquisitionFrameworkRecord.__slots__ if field != "actors"]
+DS_FIELDS = [
+    field
+    for field in DatasetRecord.__slots__
+    if field not in ("actors", "uuid_acquisition_framework", "id_acquisition_framework")
+]
+
+# Staging tables: temporary, dropped at the end of the transaction in which they are created
+staging_metadata = MetaData()
+
+
+def _staging_table(name, *columns):
+    return Table(
+        name,
+        staging_metadata,
+        Column("position", Integer),
+        *columns,
+        prefixes=["TEMPORARY"],
+        postgresql_on_commit="DROP",
+    )
+
+
+staging_af = _staging_table(
+    "tmp_mtd_sync_af",
+    *(Column(field, TAcquisitionFramework.__table__.c[field].type) for field in AF_FIELDS),
+)
+staging_ds = _staging_table(
+    "tmp_mtd_sync_ds",
+    *(
+        (
+            Column(field, Unicode)
+            if field in NOMENCLATURE_MAPPING
+            else Column(field, TDatasets.__table__.c[field].type)
+        )
+        for field in DS_FIELDS
+    ),
+    Column("uuid_acquisition_framework", UUID(as_uuid=True)),
+)
+staging_actors = _staging_table(
+    "tmp_mtd_sync_actors",
+    Column("unique_id", UUID(as_uuid=True)),
+    Column("id_organism", Integer),
+    Column("id_role", Integer),
+    Column("id_nomenclature_actor_role", Integer),
+)
+
+
+def _format_csv_value(value):
+    # In the CSV format of COPY, an unquoted empty value is NULL, whereas "" is an empty string
+    if value is None:
+        return ""
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class CSVStream(io.TextIOBase):
+    """
+    File-like object reading rows as CSV lines, formatted as they are read: rows are streamed to
+    `COPY ... FROM STDIN` without being written to a buffer at once.
+    """
+
+    def __init__(self, rows):
+        """
+        Parameters
+        ----------
+        rows : Iterable[tuple]
+            values of the rows
+        """
+        self._lines = (",".join(map(_format_csv_value, row)) + "\n" for row in rows)
+        self._buffer = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size is None or size < 0:
+            size = len(self._buffer)
+        content, self._buffer = self._buffer[:size], self._buffer[size:]
+        return content
+
+
+def stage_rows(table: Table, rows):
+    """
+    Create a staging table in the current transaction, and load rows into it with `COPY`.
+
+    Parameters
+    ----------
+    table : Table
+        the staging table
+    rows : Iterable[tuple]
+        values of the rows, in the order of the columns of the table
+    """
+    connection = DB.session.connection()
+    table.drop(connection, checkfirst=True)
+    table.create(connection)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(column.name for column in table.columns)})"
+            " FROM STDIN WITH (FORMAT csv)",
+            CSVStream(rows),
+        )
+    finally:
+        cursor.close()
+
+
+def merge_af_list(af_list) -> tuple:
+    """
+    Create or update acquisition frameworks (AF) according to their UUID, loading them into a
+    staging table with `COPY`, then merging them with a single `INSERT ... SELECT ... ON CONFLICT`.
+
+    As with `sync_af_list`, AFs without a valid UUID are skipped, the last AF is kept if several
+    AFs have the same UUID, and unchanged AFs are not updated.
+
+    Parameters
+    ----------
+    af_list : list
+        AF infos, without their actors
+
+    Returns
+    -------
+    set
+        UUID of the synchronized AFs
+    Counter
+        number of AFs `inserted`, `updated`, `unchanged` and `skipped`
+    """
+    counts = Counter()
+    af_uuids = set()
+
+    def iter_rows():
+        for position, af in enumerate(af_list):
+            af_uuid = to_uuid(af["unique_acquisition_framework_id"])
+            if af_uuid is None:
+                logger.warning(
+                    f"No valid UUID provided for the AF with UUID '{af['unique_acquisition_framework_id']}' and name '{af['acquisition_framework_name']}' - SKIPPING SYNCHRONIZATION FOR THIS AF."
+                )
+                counts["skipped"] += 1
+                continue
+            af_uuids.add(af_uuid)
+            yield (
+                position,
+                *(
+                    af_uuid if field == "unique_acquisition_framework_id" else af.get(field)
+                    for field in AF_FIELDS
+                ),
+            )
+
+    stage_rows(staging_af, iter_rows())
+    source = (
+        select(*(staging_af.c[field] for field in AF_FIELDS))
+        .distinct(staging_af.c.unique_acquisition_framework_id)
+        .order_by(staging_af.c.unique_acquisition_framework_id, staging_af.c.position.desc())
+    )
+    statement = pg_insert(TAcquisitionFramework).from_select(AF_FIELDS, source)
+    new_values = {
+        field: statement.excluded[field]
+        for field in AF_FIELDS
+        if field != "unique_acquisition_framework_id"
+    }
+    statement = statement.on_conflict_do_update(
+        index_elements=["unique_acquisition_framework_id"],
+        set_=new_values,
+        where=is_distinct_from(TAcquisitionFramework, new_values),
+    ).returning(literal_column("(xmax = 0)", Boolean).label("inserted"))
+    upserted_rows = DB.session.execute(statement).all()
+    counts["inserted"] = sum(1 for row in upserted_rows if row.inserted)
+    counts["updated"] = len(upserted_rows) - counts["inserted"]
+    counts["unchanged"] = len(af_uuids) - len(upserted_rows)
+    return af_uuids, counts
+
+
+def merge_ds_list(ds_list) -> tuple:
+    """
+    Create or update datasets (DS) according to their UUID, loading them into a staging table
+    with `COPY`, then merging them with set-based statements: their nomenclatures and AF are
+    resolved with joins, existing DS are updated with one `UPDATE ... FROM` - only if they
+    changed - and new DS are inserted with one `INSERT ... SELECT`.
+
+    As `sync_ds` does, a DS is skipped with a warning if the code of its data origin nomenclature
+    or its AF is not found in the database, and its values which are not set are left as is.
+
+    Parameters
+    ----------
+    ds_list : list
+        DS infos, without their actors
+
+    Returns
+    -------
+    set
+        UUID of the synchronized DS
+    list
+        ID of the inserted DS
+    Counter
+        number of DS `inserted`, `updated`, `unchanged` and `skipped`
+    """
+    counts = Counter()
+    ds_uuids = set()
+
+    def iter_rows():
+        for position, ds in enumerate(ds_list):
+            ds_uuid = to_uuid(ds["unique_dataset_id"])
+            if ds_uuid is None:
+                logger.warning(
+                    f"No valid UUID provided for the DS with UUID '{ds['unique_dataset_id']}' and name '{ds['dataset_name']}' - SKIPPING SYNCHRONIZATION FOR THIS DS."
+                )
+                counts["skipped"] += 1
+                continue
+            ds_uuids.add(ds_uuid)
+            values = dict(ds, unique_dataset_id=ds_uuid)
+            if not values.get("cd_nomenclature_data_origin"):
+                values["cd_nomenclature_data_origin"] = "NSP"
+            yield (
+                position,
+                *(values.get(field) for field in DS_FIELDS),
+                to_uuid(ds["uuid_acquisition_framework"]),
+            )
+
+    stage_rows(staging_ds, iter_rows())
+    latest_ds = (
+        select(staging_ds)
+        .distinct(staging_ds.c.unique_dataset_id)
+        .order_by(staging_ds.c.unique_dataset_id, staging_ds.c.position.desc())
+        .subquery("latest_ds")
+    )
+    nomenclatures = (
+        select(
+            TNomenclatures.id_nomenclature,
+            TNomenclatures.cd_nomenclature,
+            BibNomenclaturesTypes.mnemonique,
+        )
+        .join(BibNomenclaturesTypes, BibNomenclaturesTypes.id_type == TNomenclatures.id_type)
+        .subquery("nomenclatures")
+    )
+    af = TAcquisitionFramework.__table__
+    joined_ds = latest_ds.outerjoin(
+        af, af.c.unique_acquisition_framework_id == latest_ds.c.uuid_acquisition_framework
+    )
+    columns = {}
+    nomenclature_ids = {}
+    for field in DS_FIELDS:
+        if field in NOMENCLATURE_MAPPING:
+            nomenclature = nomenclatures.alias(f"nomenclature_{field}")
+            joined_ds = joined_ds.outerjoin(
+                nomenclature,
+                and_(
+                    nomenclature.c.mnemonique == NOMENCLATURE_MAPPING[field],
+                    nomenclature.c.cd_nomenclature == latest_ds.c[field],
+                ),
+            )
+            nomenclature_ids[field] = nomenclature.c.id_nomenclature
+            columns[field.replace("cd_nomenclature", "id_nomenclature")] = (
+                nomenclature.c.id_nomenclature
+            )
+        else:
+            columns[field] = latest_ds.c[field]
+    columns["id_acquisition_framework"] = af.c.id_acquisition_framework
+
+    # FIXME: see `sync_ds` about differences in referential of nomenclatures values between INPN and GeoNature
+    id_data_origin = nomenclature_ids["cd_nomenclature_data_origin"]
+    skipped_uuids = set()
+    for ds in DB.session.execute(
+        select(
+            latest_ds.c.unique_dataset_id,
+            latest_ds.c.dataset_name,
+            latest_ds.c.cd_nomenclature_data_origin,
+            latest_ds.c.uuid_acquisition_framework,
+            id_data_origin.label("id_nomenclature_data_origin"),
+        )
+        .select_from(joined_ds)
+        .where(id_data_origin.is_(None) | af.c.id_acquisition_framework.is_(None))
+    ):
+        if ds.id_nomenclature_data_origin is None:
+            logger.warning(
+                f"MTD - Nomenclature with code '{ds.cd_nomenclature_data_origin}' not found in database - SKIPPING SYNCHRONIZATION OF DATASET WITH UUID '{ds.unique_dataset_id}' AND NAME '{ds.dataset_name}'"
+            )
+        else:
+            logger.warning(
+                f"MTD - AF with UUID '{ds.uuid_acquisition_framework}' not found in database - SKIPPING SYNCHRONIZATION OF DATASET WITH UUID '{ds.unique_dataset_id}' AND NAME '{ds.dataset_name}'"
+            )
+        skipped_uuids.add(to_uuid(ds.unique_dataset_id))
+    counts["skipped"] += len(skipped_uuids)
+    ds_uuids -= skipped_uuids
+
+    source = (
+        select(
+            *(column.label(name) for name, column in columns.items()),
+            # Codes of the nomenclatures, to tell the ones not set from the ones not found
+            *(latest_ds.c[field] for field in nomenclature_ids),
+        )
+        .select_from(joined_ds)
+        .where(id_data_origin.is_not(None), af.c.id_acquisition_framework.is_not(None))
+        .subquery("source_ds")
+    )
+    nb_existing_ds = DB.session.scalar(
+        select(func.count())
+        .select_from(source)
+        .where(exists().where(TDatasets.unique_dataset_id == source.c.unique_dataset_id))
+    )
+    # Values which are not set are left as is, as `sync_ds` does
+    new_values = {
+        name: func.coalesce(source.c[name], TDatasets.__table__.c[name])
+        for name in columns
+        if name != "unique_dataset_id"
+    }
+    counts["updated"] = len(
+        DB.session.execute(
+            update(TDatasets)
+            .where(
+                TDatasets.unique_dataset_id == source.c.unique_dataset_id,
+                is_distinct_from(TDatasets, new_values),
+            )
+            .values(new_values)
+            .returning(TDatasets.id_dataset)
+        ).all()
+    )
+    counts["unchanged"] = nb_existing_ds - counts["updated"]
+    # As `sync_ds` and `sync_ds_list` do, nomenclatures which are not set get the default value of
+    #   their column, and those whose code is not found are NULL
+    insert_values = [
+        (
+            case(
+                (
+                    source.c[name.replace("id_nomenclature", "cd_nomenclature")].is_(None),
+                    func.ref_nomenclatures.get_default_nomenclature_value(
+                        NOMENCLATURE_MAPPING[name.replace("id_nomenclature", "cd_nomenclature")]
+                    ),
+                ),
+                else_=source.c[name],
+            )
+            if name.startswith("id_nomenclature")
+            else source.c[name]
+        )
+        for name in columns
+    ]
+    id_new_datasets = DB.session.scalars(
+        pg_insert(TDatasets)
+        .from_select(
+            list(columns),
+            select(*insert_values).where(
+                ~exists().where(TDatasets.unique_dataset_id == source.c.unique_dataset_id)
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["unique_dataset_id"])
+        .returning(TDatasets.id_dataset)
+    ).all()
+    counts["inserted"] = len(id_new_datasets)
+    return ds_uuids, id_new_datasets, counts
+
+
+def merge_actor_links(
+    CorActor, pk_name: str, uuid_column, actor_rows, chunk_size: int = 1000, failed_uuids=None
+):
+    """
+    Associate actors with acquisition frameworks or datasets, loading the links into a staging
+    table with `COPY`, then inserting them with a single `INSERT ... SELECT`, joined on the UUID
+    of the AFs or DS.
+
+    If the insert fails on a constraint, the links are written with `write_actor_rows`, so that
+    only the failing links are left out.
+
+    Parameters
+    ----------
+    CorActor : Union[CorAcquisitionFrameworkActor, CorDatasetActor]
+        the SQLAlchemy model corresponding to the destination table
+    pk_name : Literal['id_acquisition_framework', 'id_dataset']
+        pk attribute name
+    uuid_column : sqlalchemy.orm.attributes.InstrumentedAttribute
+        column of the UUID of the AFs or DS
+    actor_rows : list[tuple]
+        rows built by `get_actor_rows`, with the UUID of the AF or DS as the value of `pk_name`
+    chunk_size : int
+        maximum number of rows by statement, if the links are written with `write_actor_rows`
+    failed_uuids : set, optional
+        if provided, the UUIDs of the AFs or DS whose links fail to be written are added to it
+    """
+    stage_rows(
+        staging_actors,
+        (
+            (
+                position,
+                values[pk_name],
+                values.get("id_organism"),
+                values.get("id_role"),
+                values["id_nomenclature_actor_role"],
+            )
+            for position, (values, _, _) in enumerate(actor_rows)
+        ),
+    )
+    pk_column = getattr(uuid_column.class_, pk_name)
+    statement = (
+        pg_insert(CorActor)
+        .from_select(
+            [pk_name, "id_organism", "id_role", "id_nomenclature_actor_role"],
+            select(
+                pk_column,
+                staging_actors.c.id_organism,
+                staging_actors.c.id_role,
+                staging_actors.c.id_nomenclature_actor_role,
+            )
+            .distinct()
+            .join(staging_actors, staging_actors.c.unique_id == uuid_column),
+        )
+        .on_conflict_do_nothing()
+    )
+    try:
+        with DB.session.begin_nested():
+            DB.session.execute(statement)
+        return
+    except IntegrityError:
+        logger.warning("MTD - ACTORS : set-based association failed, associating actors by chunks")
+    id_by_uuid = {}
+    for chunk in iter_chunks({values[pk_name] for values, _, _ in actor_rows}, chunk_size):
+        for record_uuid, pk_value in DB.session.execute(
+            select(uuid_column, pk_column).where(uuid_column.in_(chunk))
+        ):
+            id_by_uuid[to_uuid(record_uuid)] = pk_value
+    write_actor_rows(
+        CorActor,
+        pk_name,
+        [
+            ({**values, pk_name: id_by_uuid[values[pk_name]]}, actor, uuid_mtd)
+            for values, actor, uuid_mtd in actor_rows
+            if values[pk_name] in id_by_uuid
+        ],
+        chunk_size=chunk_size,
+        failed_uuids=failed_uuids,
+    )
@@ -0,0 +1,107 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from geonature.utils.env import DB
+from sqlalchemy import func, select
+
+# Get the logger instance "MTD_SYNC"
+logger = logging.getLogger("MTD_SYNC")
+
+# Classes of the PostgreSQL advisory locks taken by the synchronizations, with the two-key form
+#   - (GLOBAL_SYNC_LOCK_CLASS, 0): exclusive for the global sync, shared for the per-user syncs
+#   - (USER_SYNC_LOCK_CLASS, id_role): exclusive for the syncs of a user
+GLOBAL_SYNC_LOCK_CLASS = 0x6D7464
+USER_SYNC_LOCK_CLASS = 0x6D7475
+
+# Interval, in seconds, between two attempts to acquire the locks while waiting
+LOCK_POLL_INTERVAL = 0.5
+
+
+def _try_lock(connection, keys) -> bool:
+    """
+    Try to acquire advisory locks on a connection, all or none.
+
+    Parameters
+    ----------
+    connection : sqlalchemy.engine.Connection
+        the connection holding the locks
+    keys : list[tuple]
+        the locks to acquire, as (class ID, object ID, shared)
+
+    Returns
+    -------
+    bool
+        True if all the locks have been acquired
+    """
+    for class_id, object_id, shared in keys:
+        try_lock = func.pg_try_advisory_lock_shared if shared else func.pg_try_advisory_lock
+        if not connection.execute(select(try_lock(class_id, object_id))).scalar():
+            connection.execute(select(func.pg_advisory_unlock_all()))
+            return False
+    return True
+
+
+@contextmanager
+def _sync_lock():
+    # Session-level advisory locks belong to a connection: a dedicated one is held for the whole
+    #   synchronization, as the ORM session commits - and releases its connection - along the way
+    #   Autocommit, not to leave a transaction idle meanwhile
+    with DB.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        try:
+            yield connection
+        finally:
+            connection.execute(select(func.pg_advisory_unlock_all()))
+
+
+@contextmanager
+def user_sync_lock(id_role: int, wait: float = 0):
+    """
+    Single-flight of the synchronizations of a user, across processes.
+
+    The leader holds an exclusive lock keyed by `id_role`, and a shared lock which the global
+    synchronization takes exclusively. A follower waits at most `wait` seconds for the leader to
+    finish, and does not synchronize either way: the leader's result is in the database, or is
+    about to be.
+
+    Parameters
+    ----------
+    id_role : int
+        ID of the user
+    wait : float
+        maximum time, in seconds, a follower waits for the leader to finish
+
+    Yields
+    ------
+    bool
+        True for the leader, which synchronizes the user
+    """
+    keys = [(GLOBAL_SYNC_LOCK_CLASS, 0, True), (USER_SYNC_LOCK_CLASS, int(id_role), False)]
+    with _sync_lock() as connection:
+        if _try_lock(connection, keys):
+            yield True
+            return
+        logger.info(f"MTD - SYNC USER : id_role={id_role} ALREADY IN PROGRESS")
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(min(LOCK_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+            if _try_lock(connection, keys):
+                connection.execute(select(func.pg_advisory_unlock_all()))
+                break
+        yield False
+
+
+@contextmanager
+def global_sync_lock():
+    """
+    Exclusion of the global synchronization and of the per-user synchronizations, across
+    processes: wait for the running per-user synchronizations to finish. The per-user
+    synchronizations started meanwhile are followers, see `user_sync_lock`.
+    """
+    keys = [(GLOBAL_SYNC_LOCK_CLASS, 0, False)]
+    with _sync_lock() as connection:
+        if not _try_lock(connection, keys):
+            logger.info("MTD - SYNC GLOBAL : WAITING FOR THE SYNCS IN PROGRESS")
+            # Blocking, so that the per-user syncs started meanwhile cannot take the shared lock first
+            connection.execute(select(func.pg_advisory_lock(GLOBAL_SYNC_LOCK_CLASS, 0)))
+        yield
@@ -0,0 +1,417 @@
+import datetime
+import hashlib
+import json
+import logging
+import threading
+
+from geonature.utils.env import DB
+from sqlalchemy import Unicode, cast, column, func, literal, select, values
+from sqlalchemy.dialects.postgresql import UUID, insert as pg_insert
+
+from .models import TRecordFingerprint, TSyncWatermark, TUserSyncFreshness
+from .resolvers import iter_chunks, to_uuid
+
+# Get the logger instance "MTD_SYNC"
+logger = logging.getLogger("MTD_SYNC")
+
+# Hits and misses of the per-user sync freshness checks of this process
+_user_sync_freshness_stats = {"hits": 0, "misses": 0}
+_user_sync_freshness_stats_lock = threading.Lock()
+# Number of checks between two logs of the statistics at level INFO
+USER_SYNC_FRESHNESS_LOG_INTERVAL = 100
+
+
+def parse_update_date(value):
+    """
+    Convert an update date parsed from the XML (`dateMiseAJourMtd`, `dateRevision`) to a naive
+    `datetime`, in local time as the dates stored in the database.
+
+    Parameters
+    ----------
+    value : str or datetime.datetime or None
+        the update date
+
+    Returns
+    -------
+    datetime.datetime or None
+        the update date, or None if `value` is empty or is not a valid ISO 8601 date
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime.datetime):
+        update_date = value
+    else:
+        try:
+            update_date = datetime.datetime.fromisoformat(
+                str(value).strip().replace("Z", "+00:00")
+            )
+        except ValueError:
+            return None
+    if update_date.tzinfo is not None:
+        update_date = update_date.astimezone().replace(tzinfo=None)
+    return update_date
+
+
+def get_max_update_date(records):
+    """
+    Return the most recent update date of parsed records.
+
+    Parameters
+    ----------
+    records : Iterable[Record]
+        parsed acquisition frameworks or datasets
+
+    Returns
+    -------
+    datetime.datetime or None
+        the most recent update date, or None if no record has an update date
+    """
+    return max(
+        filter(None, (parse_update_date(record.get("meta_update_date")) for record in records)),
+        default=None,
+    )
+
+
+def cap_watermark(watermark, failed_records):
+    """
+    Keep a watermark below the update date of the records which failed to be synchronized, so
+    that the next incremental synchronization retries them.
+
+    Parameters
+    ----------
+    watermark : datetime.datetime or None
+        the most recent update date of the synchronized records
+    failed_records : Iterable[Record]
+        the parsed records which failed
+
+    Returns
+    -------
+    datetime.datetime or None
+        the watermark, capped just below the oldest update date of the records which failed
+    """
+    oldest_update_date = min(
+        filter(
+            None,
+            (parse_update_date(record.get("meta_update_date")) for record in failed_records),
+        ),
+        default=None,
+    )
+    if watermark is None or oldest_update_date is None:
+        return watermark
+    return min(watermark, oldest_update_date - datetime.timedelta(microseconds=1))
+
+
+def get_watermarks(id_instance: int) -> dict:
+    """
+    Retrieve the watermarks of the last completed global synchronization of an instance.
+
+    Parameters
+    ----------
+    id_instance : int
+        ID of the instance of 'INPN Métadonnées', 0 if the synchronization is not filtered
+
+    Returns
+    -------
+    dict
+        watermark by object type ("AF", "DS")
+    """
+    return dict(
+        DB.session.execute(
+            select(TSyncWatermark.object_type, TSyncWatermark.watermark).where(
+                TSyncWatermark.id_instance == id_instance
+            )
+        ).all()
+    )
+
+
+def set_watermarks(id_instance: int, watermarks: dict):
+    """
+    Move the watermarks of an instance forward. A watermark is never moved backward, and object
+    types without watermark (None) are left as is.
+
+    Parameters
+    ----------
+    id_instance : int
+        ID of the instance of 'INPN Métadonnées', 0 if the synchronization is not filtered
+    watermarks : dict
+        watermark by object type ("AF", "DS")
+    """
+    rows = [
+        {"id_instance": id_instance, "object_type": object_type, "watermark": watermark}
+        for object_type, watermark in watermarks.items()
+        if watermark is not None
+    ]
+    if not rows:
+        return
+    statement = pg_insert(TSyncWatermark).values(rows)
+    DB.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[TSyncWatermark.id_instance, TSyncWatermark.object_type],
+            set_={
+                "watermark": func.greatest(TSyncWatermark.watermark, statement.excluded.watermark),
+                "meta_update_date": func.now(),
+            },
+        )
+    )
+
+
+def filter_changed_records(records, uuid_column, uuid_field, watermark, chunk_size: int = 1000):
+    """
+    Keep only the records which are new, or changed since they were last synchronized.
+
+    A record is unchanged if it exists in the database and its update date is not more recent
+    than the watermark, or than the `meta_update_date` of the stored row - which the database
+    sets on each write. Records without update date are always kept, as their changes cannot be
+    told. The stored rows are retrieved with one `IN` query by chunk of `chunk_size` UUIDs.
+
+    Parameters
+    ----------
+    records : list[Record]
+        parsed acquisition frameworks or datasets
+    uuid_column : sqlalchemy.orm.attributes.InstrumentedAttribute
+        column of the UUID of the records, on a model with a `meta_update_date` column
+    uuid_field : str
+        field of the UUID in the records
+    watermark : datetime.datetime or None
+        the watermark of the last completed synchronization
+    chunk_size : int
+        maximum number of UUIDs by query
+
+    Returns
+    -------
+    tuple
+        the new or changed records, and the number of unchanged records
+    """
+    update_date_by_uuid = {}
+    for record in records:
+        record_uuid = to_uuid(record.get(uuid_field))
+        update_date = parse_update_date(record.get("meta_update_date"))
+        if record_uuid and update_date:
+            update_date_by_uuid[record_uuid] = update_date
+    unchanged_uuids = set()
+    Model = uuid_column.class_
+    for chunk in iter_chunks(list(update_date_by_uuid), chunk_size):
+        for record_uuid, stored_update_date in DB.session.execute(
+            select(uuid_column, Model.meta_update_date).where(uuid_column.in_(chunk))
+        ):
+            record_uuid = to_uuid(record_uuid)
+            last_sync_date = max(filter(None, (watermark, stored_update_date)), default=None)
+            if last_sync_date and update_date_by_uuid[record_uuid] <= last_sync_date:
+                unchanged_uuids.add(record_uuid)
+    changed_records = [
+        record for record in records if to_uuid(record.get(uuid_field)) not in unchanged_uuids
+    ]
+    return changed_records, len(records) - len(changed_records)
+
+
+def _serialize_parsed_value(value):
+    # Dates not set in the XML are parsed as the current date: they do not count in the content
+    if isinstance(value, datetime.datetime):
+        return None
+    return str(value)
+
+
+def compute_fingerprint(record) -> str:
+    """
+    Compute a stable fingerprint of the content of a parsed acquisition framework or dataset,
+    including its actors - in any order.
+
+    Parameters
+    ----------
+    record : Record
+        parsed acquisition framework or dataset
+
+    Returns
+    -------
+    str
+        the SHA-256 of the normalized record, as hexadecimal
+    """
+    content = {field: value for field, value in record.items() if field != "actors"}
+    content["actors"] = sorted(
+        json.dumps(dict(actor), sort_keys=True, default=_serialize_parsed_value)
+        for actor in record.get("actors") or []
+    )
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, default=_serialize_parsed_value).encode("utf-8")
+    ).hexdigest()
+
+
+def filter_unchanged_fingerprints(
+    records, uuid_column, uuid_field, object_type, chunk_size: int = 1000
+):
+    """
+    Leave out the records whose fingerprint is the one stored when they were last written, and
+    which still exist in the database. The stored fingerprints are retrieved with one `IN` query
+    by chunk of `chunk_size` UUIDs.
+
+    Parameters
+    ----------
+    records : list[Record]
+        parsed acquisition frameworks or datasets
+    uuid_column : sqlalchemy.orm.attributes.InstrumentedAttribute
+        column of the UUID of the records in the database
+    uuid_field : str
+        field of the UUID in the records
+    object_type : str
+        type of the records: "AF" or "DS"
+    chunk_size : int
+        maximum number of UUIDs by query
+
+    Returns
+    -------
+    tuple
+        the records whose fingerprint differs, and the fingerprint of these records by UUID
+    """
+    fingerprint_by_uuid = {}
+    for record in records:
+        record_uuid = to_uuid(record.get(uuid_field))
+        if record_uuid:
+            fingerprint_by_uuid[record_uuid] = compute_fingerprint(record)
+    unchanged_uuids = set()
+    for chunk in iter_chunks(list(fingerprint_by_uuid), chunk_size):
+        for record_uuid, fingerprint in DB.session.execute(
+            select(TRecordFingerprint.unique_id, TRecordFingerprint.fingerprint)
+            .join(uuid_column.class_, uuid_column == TRecordFingerprint.unique_id)
+            .where(
+                TRecordFingerprint.object_type == object_type,
+                TRecordFingerprint.unique_id.in_(chunk),
+            )
+        ):
+            record_uuid = to_uuid(record_uuid)
+            if fingerprint == fingerprint_by_uuid[record_uuid]:
+                unchanged_uuids.add(record_uuid)
+    changed_records = [
+        record for record in records if to_uuid(record.get(uuid_field)) not in unchanged_uuids
+    ]
+    for record_uuid in unchanged_uuids:
+        del fingerprint_by_uuid[record_uuid]
+    return changed_records, fingerprint_by_uuid
+
+
+def store_fingerprints(fingerprint_by_uuid, uuid_column, object_type, chunk_size: int = 1000):
+    """
+    Store the fingerprints of written records, by chunk of `chunk_size` records.
+
+    Only the fingerprints of the records found in the database are stored, so that a record which
+    failed to be inserted is not left out by the next synchronization.
+
+    Parameters
+    ----------
+    fingerprint_by_uuid : dict
+        fingerprint of the records by UUID
+    uuid_column : sqlalchemy.orm.attributes.InstrumentedAttribute
+        column of the UUID of the records in the database
+    object_type : str
+        type of the records: "AF" or "DS"
+    chunk_size : int
+        maximum number of records by statement
+    """
+    for chunk in iter_chunks(fingerprint_by_uuid.items(), chunk_size):
+        fingerprint_values = values(
+            column("unique_id", UUID(as_uuid=True)),
+            column("fingerprint", Unicode),
+            name="fingerprint_values",
+        ).data(chunk)
+        statement = pg_insert(TRecordFingerprint).from_select(
+            ["object_type", "unique_id", "fingerprint"],
+            select(
+                literal(object_type, Unicode),
+                uuid_column,
+                fingerprint_values.c.fingerprint,
+            ).join(
+                fingerprint_values,
+                uuid_column == cast(fingerprint_values.c.unique_id, UUID(as_uuid=True)),
+            ),
+        )
+        DB.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[TRecordFingerprint.object_type, TRecordFingerprint.unique_id],
+                set_={
+                    "fingerprint": statement.excluded.fingerprint,
+                    "meta_update_date": func.now(),
+                },
+            )
+        )
+
+
+def is_user_sync_fresh(id_role: int, id_af=None, ttl: int = 0) -> bool:
+    """
+    Tell whether a user has been synchronized successfully less than `ttl` seconds ago. A
+    synchronization restricted to an acquisition framework is also fresh if all the metadata of
+    the user has been synchronized since.
+
+    The check counts as a hit or a miss in the statistics of the process, see
+    `get_user_sync_freshness_stats`, logged every `USER_SYNC_FRESHNESS_LOG_INTERVAL` checks.
+
+    Parameters
+    ----------
+    id_role : int
+        ID of the user
+    id_af : int, optional
+        ID of the acquisition framework the synchronization is restricted to
+    ttl : int
+        time to live of a synchronization, in seconds
+
+    Returns
+    -------
+    bool
+        True if the synchronization can be skipped
+    """
+    fresh = (
+        DB.session.execute(
+            select(TUserSyncFreshness.id_role)
+            .where(
+                TUserSyncFreshness.id_role == id_role,
+                TUserSyncFreshness.id_af.in_({0, int(id_af or 0)}),
+                TUserSyncFreshness.last_sync_date > func.now() - datetime.timedelta(seconds=ttl),
+            )
+            .limit(1)
+        ).first()
+        is not None
+    )
+    with _user_sync_freshness_stats_lock:
+        _user_sync_freshness_stats["hits" if fresh else "misses"] += 1
+        hits, misses = _user_sync_freshness_stats["hits"], _user_sync_freshness_stats["misses"]
+    logger.debug(
+        f"MTD - SYNC USER FRESHNESS : id_role={id_role} id_af={id_af} "
+        f"{'hit' if fresh else 'miss'} (hits={hits} misses={misses})"
+    )
+    if (hits + misses) % USER_SYNC_FRESHNESS_LOG_INTERVAL == 0:
+        logger.info(f"MTD - SYNC USER FRESHNESS : hits={hits} misses={misses}")
+    return fresh
+
+
+def set_user_sync_fresh(id_role: int, id_af=None):
+    """
+    Record the successful synchronization of a user, as of now.
+
+    Parameters
+    ----------
+    id_role : int
+        ID of the user
+    id_af : int, optional
+        ID of the acquisition framework the synchronization was restricted to
+    """
+    statement = pg_insert(TUserSyncFreshness).values(
+        id_role=id_role, id_af=int(id_af or 0), last_sync_date=func.now()
+    )
+    DB.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[TUserSyncFreshness.id_role, TUserSyncFreshness.id_af],
+            set_={"last_sync_date": statement.excluded.last_sync_date},
+        )
+    )
+
+
+def get_user_sync_freshness_stats() -> dict:
+    """
+    Return the hits and misses of the per-user sync freshness checks of this process, to tune
+    `SYNC_USER_FRESHNESS_TTL`.
+
+    Returns
+    -------
+    dict
+        number of checks which skipped the synchronization ("hits") or not ("misses")
+    """
+    with _user_sync_freshness_stats_lock:
+        return dict(_user_sync_freshness_stats)
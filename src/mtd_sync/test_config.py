@@ -16,3 +16,25 @@ JDD_MODULE_CODE_ASSOCIATION = ["OCCTAX", "OCCHAB"]
 ID_PROVIDER = "cas_inpn"
 ID_USER_SOCLE_1 = 1
 ID_USER_SOCLE_2 = 2
+HTTP_POOL_CONNECTIONS = 10
+HTTP_POOL_MAXSIZE = 10
+HTTP_POOL_MAXSIZE_BY_HOST = {}
+HTTP_CONNECT_TIMEOUT = 10
+HTTP_READ_TIMEOUT = 120
+XML_CACHE_ENABLED = False
+XML_CACHE_DIR = ""
+XML_CACHE_MAX_SIZE_MB = 500
+XML_CACHE_MAX_AGE_DAYS = 7
+SYNC_CONCURRENT_FETCH = False
+SYNC_ENGINE = "record"
+SYNC_BULK_CHUNK_SIZE = 1000
+SYNC_COMMIT_BATCH_SIZE = 0
+SYNC_COMMIT_BATCH_SECONDS = 10
+SYNC_INCREMENTAL = False
+SYNC_FINGERPRINTS = False
+SYNC_USER_ASYNC = False
+SYNC_USER_ASYNC_WORKERS = 2
+SYNC_USER_FRESHNESS_TTL = 0
+SYNC_SINGLE_FLIGHT = False
+SYNC_SINGLE_FLIGHT_WAIT = 0
+SYNC_USER_REQUEST_BUDGET = 0
@@ -1,12 +1,68 @@
 from unittest.mock import patch
 
+import datetime
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
 import pytest
+import requests
 from flask import url_for, g
+from sqlalchemy import func, select
 import logging
 
 from geonature.utils.env import db
 from pypnusershub.tests.utils import set_logged_user
 from mtd_sync.mail_builder import MailBuilder
+from geonature.core.gn_meta.models import (
+    CorAcquisitionFrameworkActor,
+    TAcquisitionFramework,
+    TDatasets,
+)
+from mtd_sync.mtd_sync import (
+    FetchCancelled,
+    MTDInstanceApi,
+    SyncBudgetExceeded,
+    _sync_af_and_ds,
+    add_unexisting_digitizer,
+    fetch_concurrently,
+    process_af_and_ds,
+    process_in_batches,
+)
+from mtd_sync.mtd_utils import (
+    get_actor_rows,
+    iter_chunks,
+    sync_af,
+    sync_af_list,
+    sync_ds,
+    sync_ds_list,
+)
+from mtd_sync.http_client import MTDHttpClient, get_http_client
+from mtd_sync.records import ActorRecord, AcquisitionFrameworkRecord, DatasetRecord
+from mtd_sync.resolvers import (
+    NomenclatureResolver,
+    OrganismResolver,
+    RoleResolver,
+    SyncContext,
+    to_uuid,
+)
+from mtd_sync.staging import CSVStream, merge_actor_links, merge_af_list, merge_ds_list
+from mtd_sync.sync_lock import global_sync_lock, user_sync_lock
+from mtd_sync.sync_state import (
+    cap_watermark,
+    compute_fingerprint,
+    filter_changed_records,
+    filter_unchanged_fingerprints,
+    get_watermarks,
+    parse_update_date,
+    set_watermarks,
+    store_fingerprints,
+)
+from mtd_sync.user_sync import UserSyncExecutor
+from mtd_sync.xml_cache import XMLResponseCache, get_xml_cache
+from mtd_sync.xml_parser import iter_jdd_xml, parse_jdd_xml
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +72,739 @@ class TestMtd:
         assert 1 == 1
 
 
+class TestHttpClient:
+    def test_shared_client(self):
+        assert get_http_client() is get_http_client()
+
+    def test_pool_maxsize_by_host(self):
+        client = MTDHttpClient(pool_maxsize=2, pool_maxsize_by_host={"inpn.mnhn.fr": 5})
+        adapter = client.session.get_adapter("https://inpn.mnhn.fr/mtd")
+        assert adapter._pool_maxsize == 5
+        assert client.session.get_adapter("https://example.com")._pool_maxsize == 2
+        assert client.get_pool_stats() == []
+
+
+JDD_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Export xmlns="http://inpn.mnhn.fr/mtd">
+  <JeuDeDonnees>
+    <identifiantJdd>4D331CAE-65C4-49EB-A3D5-2B4A46CB1B4F</identifiantJdd>
+    <identifiantCadre>http://oafs.fr/meta/ca/57B7D0F2-4183-4B7B-8F08-6E105D476DC5</identifiantCadre>
+    <libelle>Jeu de donnees de test</libelle>
+    <domaineTerrestre>true</domaineTerrestre>
+    <domaineMarin>false</domaineMarin>
+    <typeDonnees>1</typeDonnees>
+    <dateCreation>2020-01-01</dateCreation>
+    <attributsAdditionnels>
+      <attributAdditionnel>
+        <nomAttribut>ID_CREATEUR</nomAttribut>
+        <valeurAttribut>1</valeurAttribut>
+      </attributAdditionnel>
+    </attributsAdditionnels>
+    <pointContactJdd>
+      <acteur>
+        <nomPrenom>Test</nomPrenom>
+        <roleActeur>1</roleActeur>
+        <organisme>Organisme de test</organisme>
+        <mail>test@example.com</mail>
+      </acteur>
+    </pointContactJdd>
+    <BaseProduction/>
+  </JeuDeDonnees>
+</Export>
+"""
+
+
+# Revised DS, whose AF is not in the database, and export of an instance without any AF
+JDD_XML_REVISED = JDD_XML.replace(
+    b"<dateCreation>2020-01-01</dateCreation>",
+    b"<dateCreation>2020-01-01</dateCreation>\n    <dateRevision>2024-03-01</dateRevision>",
+)
+CA_XML_EMPTY = b"""<?xml version="1.0" encoding="UTF-8"?>
+<Export xmlns="http://inpn.mnhn.fr/mtd"/>
+"""
+
+
+class StubResponse:
+    def __init__(self, url, status_code=200, content=b"", headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StubMTDServer:
+    """
+    Stub of the exports of 'INPN Métadonnées', sent with an ETag, and not modified since.
+    """
+
+    def __init__(self, exports):
+        self.exports = exports
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        headers = headers or {}
+        self.requests.append((url, headers))
+        if "If-None-Match" in headers:
+            return StubResponse(url, status_code=304)
+        content = self.exports["DS" if "/jdd/" in url else "AF"]
+        return StubResponse(url, content=content, headers={"ETag": '"1"'})
+
+    def log_pool_stats(self, level=logging.INFO):
+        pass
+
+
+@pytest.fixture
+def mtd_server(app, monkeypatch, tmp_path):
+    server = StubMTDServer({"AF": CA_XML_EMPTY, "DS": JDD_XML_REVISED})
+    monkeypatch.setattr("mtd_sync.mtd_sync.get_http_client", lambda: server)
+    monkeypatch.setattr("mtd_sync.mtd_sync.add_unexisting_digitizer", lambda id_digitizer: None)
+    monkeypatch.setitem(app.config["MTD_SYNC"], "XML_CACHE_ENABLED", True)
+    monkeypatch.setitem(app.config["MTD_SYNC"], "XML_CACHE_DIR", str(tmp_path))
+    monkeypatch.setitem(app.config["MTD_SYNC"], "SYNC_INCREMENTAL", True)
+    return server
+
+
+@pytest.mark.usefixtures("app")
+class TestXmlParser:
+    def test_parse_jdd_xml(self):
+        [jdd] = parse_jdd_xml(JDD_XML)
+        assert jdd["unique_dataset_id"] == "4D331CAE-65C4-49EB-A3D5-2B4A46CB1B4F"
+        assert jdd["uuid_acquisition_framework"] == "57B7D0F2-4183-4B7B-8F08-6E105D476DC5"
+        assert jdd["terrestrial_domain"] is True
+        assert jdd["id_digitizer"] == "1"
+        assert jdd["actors"] == [
+            {
+                "name": "Test",
+                "uuid_organism": None,
+                "organism": "Organisme de test",
+                "actor_role": "1",
+                "email": "test@example.com",
+            }
+        ]
+
+    def test_parse_jdd_xml_instance_filter(self, app, monkeypatch):
+        monkeypatch.setitem(app.config["MTD_SYNC"], "ID_INSTANCE_FILTER", 42)
+        stats = Counter()
+        assert parse_jdd_xml(JDD_XML, stats=stats) == []
+        assert stats["ds_skipped_instance"] == 1
+
+    def test_iter_jdd_xml_by_chunks(self):
+        chunks = [JDD_XML[i : i + 16] for i in range(0, len(JDD_XML), 16)]
+        streamed = list(iter_jdd_xml(chunks))
+        parsed = parse_jdd_xml(JDD_XML)
+        for jdd in streamed + parsed:
+            jdd.pop("meta_create_date")
+        assert streamed == parsed
+
+
+class TestRecords:
+    def test_dict_compatible_view(self):
+        ds = DatasetRecord(unique_dataset_id="uuid", uuid_acquisition_framework="af_uuid")
+        assert ds == {"unique_dataset_id": "uuid", "uuid_acquisition_framework": "af_uuid"}
+        assert ds.pop("uuid_acquisition_framework") == "af_uuid"
+        ds["id_acquisition_framework"] = 1
+        assert dict(**ds) == {"unique_dataset_id": "uuid", "id_acquisition_framework": 1}
+        assert ds.get("actors") is None
+        with pytest.raises(KeyError):
+            ds["unknown_field"] = None
+
+
+class TestSyncState:
+    def test_parse_update_date(self):
+        assert parse_update_date("2024-01-02T03:04:05") == datetime.datetime(2024, 1, 2, 3, 4, 5)
+        assert parse_update_date("2024-01-02") == datetime.datetime(2024, 1, 2)
+        assert parse_update_date("not a date") is None
+        assert parse_update_date(None) is None
+
+    def test_cap_watermark(self):
+        watermark = datetime.datetime(2024, 3, 1)
+        failed = [
+            {"meta_update_date": "2024-02-01T00:00:00"},
+            {"meta_update_date": "2024-01-15T00:00:00"},
+            {"meta_update_date": None},
+        ]
+        assert cap_watermark(watermark, []) == watermark
+        assert cap_watermark(watermark, failed[2:]) == watermark
+        capped = cap_watermark(watermark, failed)
+        assert capped < datetime.datetime(2024, 1, 15)
+        assert capped == datetime.datetime(2024, 1, 14, 23, 59, 59, 999999)
+        assert cap_watermark(datetime.datetime(2024, 1, 1), failed) == datetime.datetime(
+            2024, 1, 1
+        )
+        assert cap_watermark(None, failed) is None
+
+    def test_compute_fingerprint(self):
+        actors = [
+            ActorRecord(organism="Organism", actor_role="1"),
+            ActorRecord(name="Name", email="name@example.org", actor_role="8"),
+        ]
+        ds = DatasetRecord(
+            unique_dataset_id="uuid",
+            dataset_name="Dataset",
+            meta_create_date=datetime.datetime.now(),
+            actors=actors,
+        )
+        same_ds = DatasetRecord(**{**ds, "actors": actors[::-1]})
+        same_ds["meta_create_date"] = datetime.datetime.now()
+        assert compute_fingerprint(same_ds) == compute_fingerprint(ds)
+        same_ds["dataset_name"] = "Renamed dataset"
+        assert compute_fingerprint(same_ds) != compute_fingerprint(ds)
+
+
+class TestBulkSync:
+    def test_iter_chunks(self):
+        assert list(iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+        assert list(iter_chunks([], 2)) == []
+
+    def test_csv_stream(self):
+        stream = CSVStream([(1, 'Name "quoted"', None), (2, "", True)])
+        content = stream.read(5) + stream.read()
+        assert content == '"1","Name ""quoted""",\n"2","","True"\n'
+        assert stream.read() == ""
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestNomenclatureResolver:
+    def test_get_id(self, app):
+        nomenclatures = NomenclatureResolver()
+        for type_mnemonique, cd_nomenclature in [("ROLE_ACTEUR", "1"), ("DS_PUBLIQUE", "NSP")]:
+            assert nomenclatures.get_id(type_mnemonique, cd_nomenclature) == db.session.scalar(
+                select(
+                    func.ref_nomenclatures.get_id_nomenclature(type_mnemonique, cd_nomenclature)
+                )
+            )
+        assert nomenclatures.get_id("ROLE_ACTEUR", "unknown") is None
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestOrganismResolver:
+    def test_get_id(self, app):
+        organism_uuid = "7a0e2b8c-38b1-4ad2-9a0f-1c6e3e0f5b2d"
+        actors = [
+            {"uuid_organism": organism_uuid, "organism": "MTD organism", "email": "a@example.com"},
+            {"uuid_organism": None, "organism": "MTD organism 2", "email": None},
+            {"uuid_organism": None, "organism": "MTD organism 2", "email": None},
+        ]
+        organisms = OrganismResolver()
+        organisms.prepare(actors)
+        ids = [organisms.get_id(actor) for actor in actors]
+        assert None not in ids
+        assert ids[1] == ids[2]
+        assert OrganismResolver().get_id(actors[0]) == ids[0]
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestRoleResolver:
+    def test_get_id(self, app, users_with_mail):
+        user = users_with_mail["user"]
+        roles = RoleResolver()
+        roles.prepare([user.email, "unknown@example.com", None])
+        assert roles.get_id(user.email) == user.id_role
+        assert roles.get_id("unknown@example.com") is None
+
+
+def make_af(**fields):
+    """
+    Build a parsed AF, with a new UUID unless given.
+    """
+    return AcquisitionFrameworkRecord(
+        **{
+            "unique_acquisition_framework_id": str(uuid.uuid4()).upper(),
+            "acquisition_framework_name": "MTD AF",
+            "acquisition_framework_desc": "",
+            "acquisition_framework_start_date": datetime.datetime(2020, 1, 1),
+            "acquisition_framework_end_date": None,
+            "meta_create_date": datetime.datetime(2020, 1, 1),
+            "meta_update_date": None,
+            "id_digitizer": None,
+            **fields,
+        }
+    )
+
+
+def make_ds(uuid_af, **fields):
+    """
+    Build a parsed DS of an AF, without actors, with a new UUID unless given.
+    """
+    [ds] = parse_jdd_xml(JDD_XML)
+    del ds["actors"]
+    ds.update(
+        unique_dataset_id=str(uuid.uuid4()).upper(),
+        uuid_acquisition_framework=uuid_af,
+        id_digitizer=None,
+        **fields,
+    )
+    return ds
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestBulkUpsert:
+    def test_outcomes(self, app):
+        af_list = [make_af(), make_af()]
+        af_ids, counts = sync_af_list(af_list)
+        assert counts == Counter(inserted=2)
+        af_list[1]["acquisition_framework_name"] = "MTD AF renamed"
+        new_af = make_af()
+        af_ids_again, counts = sync_af_list(
+            [*af_list, new_af, make_af(unique_acquisition_framework_id="not an UUID")]
+        )
+        assert counts == Counter(inserted=1, updated=1, unchanged=1, skipped=1)
+        # The unchanged AF, which the upsert does not return, is selected again
+        for af in af_list:
+            uuid_af = af["unique_acquisition_framework_id"]
+            assert af_ids_again[uuid_af] == af_ids[uuid_af]
+        assert new_af["unique_acquisition_framework_id"] in af_ids_again
+        assert "not an UUID" not in af_ids_again
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestSyncDsList:
+    def test_outcomes(self, app):
+        af_ids, _ = sync_af_list([make_af()])
+        [uuid_af] = af_ids
+        nomenclatures = NomenclatureResolver()
+        ds = make_ds(uuid_af)
+        ds_list = [
+            make_ds(str(uuid.uuid4())),
+            ds,
+            make_ds(uuid_af, cd_nomenclature_data_origin="unknown"),
+            make_ds(uuid_af, unique_dataset_id="not an UUID"),
+        ]
+        ds_ids, outcomes = sync_ds_list(ds_list, nomenclatures)
+        # One outcome by DS, in the order of the list
+        assert outcomes == ["skipped", "inserted", "skipped", "skipped"]
+        assert list(ds_ids) == [ds["unique_dataset_id"]]
+        new_ds = make_ds(uuid_af)
+        ds_ids_again, outcomes = sync_ds_list([new_ds, DatasetRecord(**ds)], nomenclatures)
+        assert outcomes == ["inserted", "unchanged"]
+        assert ds_ids_again[ds["unique_dataset_id"]] == ds_ids[ds["unique_dataset_id"]]
+        _, outcomes = sync_ds_list(
+            [DatasetRecord(**{**new_ds, "dataset_name": "MTD DS"})], nomenclatures
+        )
+        assert outcomes == ["updated"]
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestProcessInBatches:
+    def process_af(self, af_with_actors):
+        af, _ = af_with_actors
+        return sync_af(dict(af))
+
+    def test_replay(self, app, monkeypatch):
+        monkeypatch.setitem(app.config["MTD_SYNC"], "SYNC_COMMIT_BATCH_SIZE", 10)
+        af_list = [make_af(), make_af(acquisition_framework_name=None), make_af()]
+        written_uuids, failed_uuids = set(), set()
+        counts = process_in_batches(
+            [(af, []) for af in af_list],
+            self.process_af,
+            "AF",
+            "unique_acquisition_framework_id",
+            written_uuids=written_uuids,
+            failed_uuids=failed_uuids,
+        )
+        assert counts == Counter(synchronized=2, failed=1)
+        af_uuids = [to_uuid(af["unique_acquisition_framework_id"]) for af in af_list]
+        assert failed_uuids == {af_uuids[1]}
+        assert written_uuids == {af_uuids[0], af_uuids[2]}
+        # The first AF, rolled back with its batch, is written again by the replay
+        stored_uuids = db.session.scalars(
+            select(TAcquisitionFramework.unique_acquisition_framework_id).where(
+                TAcquisitionFramework.unique_acquisition_framework_id.in_(af_uuids)
+            )
+        )
+        assert set(map(to_uuid, stored_uuids)) == {af_uuids[0], af_uuids[2]}
+
+    def test_deadline(self, app):
+        records_with_actors = [(make_af(), []), (make_af(), [])]
+        remaining = []
+        counts = process_in_batches(
+            records_with_actors,
+            self.process_af,
+            "AF",
+            "unique_acquisition_framework_id",
+            deadline=time.monotonic(),
+            remaining=remaining,
+        )
+        assert not counts
+        assert remaining == records_with_actors
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestWatermarks:
+    def test_set_watermarks(self, app):
+        id_instance = 424242
+        set_watermarks(id_instance, {"AF": datetime.datetime(2024, 1, 1), "DS": None})
+        assert get_watermarks(id_instance) == {"AF": datetime.datetime(2024, 1, 1)}
+        # Never moved backward
+        set_watermarks(
+            id_instance,
+            {"AF": datetime.datetime(2023, 1, 1), "DS": datetime.datetime(2024, 2, 1)},
+        )
+        assert get_watermarks(id_instance) == {
+            "AF": datetime.datetime(2024, 1, 1),
+            "DS": datetime.datetime(2024, 2, 1),
+        }
+        # Kept below the records which failed
+        failed = [{"meta_update_date": "2024-03-01"}]
+        set_watermarks(id_instance, {"DS": cap_watermark(datetime.datetime(2024, 6, 1), failed)})
+        assert get_watermarks(id_instance)["DS"] == datetime.datetime(
+            2024, 2, 29, 23, 59, 59, 999999
+        )
+
+    def test_filter_changed_records(self, app):
+        stored_af_list = [make_af(meta_update_date="2024-01-01") for _ in range(3)]
+        sync_af_list(stored_af_list)
+        af_list = [
+            AcquisitionFrameworkRecord(**stored_af_list[0]),
+            AcquisitionFrameworkRecord(**{**stored_af_list[1], "meta_update_date": "2100-01-01"}),
+            # Without update date, its changes cannot be told
+            AcquisitionFrameworkRecord(**{**stored_af_list[2], "meta_update_date": None}),
+            make_af(meta_update_date="2024-01-01"),
+        ]
+        changed_af_list, nb_unchanged = filter_changed_records(
+            af_list,
+            TAcquisitionFramework.unique_acquisition_framework_id,
+            "unique_acquisition_framework_id",
+            datetime.datetime(2024, 6, 1),
+        )
+        assert nb_unchanged == 1
+        assert changed_af_list == af_list[1:]
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestFingerprints:
+    def filter_af_list(self, af_list):
+        return filter_unchanged_fingerprints(
+            af_list,
+            TAcquisitionFramework.unique_acquisition_framework_id,
+            "unique_acquisition_framework_id",
+            "AF",
+        )
+
+    def test_store_and_filter(self, app):
+        af_list = [make_af(), make_af()]
+        sync_af_list(af_list[:1])
+        changed_af_list, fingerprints = self.filter_af_list(af_list)
+        assert changed_af_list == af_list
+        store_fingerprints(
+            fingerprints, TAcquisitionFramework.unique_acquisition_framework_id, "AF"
+        )
+        # Only the fingerprint of the AF found in the database is stored
+        changed_af_list, fingerprints = self.filter_af_list(af_list)
+        assert changed_af_list == af_list[1:]
+        assert list(fingerprints) == [to_uuid(af_list[1]["unique_acquisition_framework_id"])]
+        af_list[0]["acquisition_framework_name"] = "MTD AF renamed"
+        changed_af_list, _ = self.filter_af_list(af_list)
+        assert changed_af_list == af_list
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestNoOpUpdates:
+    def test_sync_af(self, app):
+        report = Counter()
+        af = make_af()
+        assert sync_af(dict(af), report) is not None
+        # The metadata dates alone do not change the AF
+        sync_af(dict(af), report)
+        sync_af({**af, "meta_update_date": datetime.datetime(2024, 1, 1)}, report)
+        sync_af({**af, "acquisition_framework_name": "MTD AF renamed"}, report)
+        assert report == Counter(af_inserted=1, af_unchanged=2, af_updated=1)
+
+    def test_sync_ds(self, app):
+        report = Counter()
+        nomenclatures = NomenclatureResolver()
+        [uuid_af] = sync_af_list([make_af()])[0]
+        ds = make_ds(uuid_af)
+        assert sync_ds(dict(ds), nomenclatures, report, id_modules=[]) is not None
+        sync_ds(dict(ds), nomenclatures, report, id_modules=[])
+        sync_ds({**ds, "meta_update_date": "2024-01-01"}, nomenclatures, report, id_modules=[])
+        sync_ds({**ds, "dataset_name": "MTD DS"}, nomenclatures, report, id_modules=[])
+        assert report == Counter(ds_inserted=1, ds_unchanged=2, ds_updated=1)
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestStaging:
+    def test_merge_af_list(self, app):
+        af_list = [make_af(), make_af()]
+        af_uuids, counts = merge_af_list(af_list)
+        assert +counts == Counter(inserted=2)
+        af_list[1]["acquisition_framework_name"] = "MTD AF renamed"
+        af_uuids, counts = merge_af_list(
+            [*af_list, make_af(unique_acquisition_framework_id="not an UUID")]
+        )
+        assert +counts == Counter(updated=1, unchanged=1, skipped=1)
+        assert af_uuids == {to_uuid(af["unique_acquisition_framework_id"]) for af in af_list}
+
+    def test_merge_ds_list(self, app):
+        [uuid_af] = sync_af_list([make_af()])[0]
+        ds_list = [
+            make_ds(uuid_af, cd_nomenclature_data_type=None),
+            make_ds(str(uuid.uuid4())),
+            make_ds(uuid_af, cd_nomenclature_data_origin="unknown"),
+        ]
+        ds_uuids, id_new_datasets, counts = merge_ds_list(ds_list)
+        assert +counts == Counter(inserted=1, skipped=2)
+        assert ds_uuids == {to_uuid(ds_list[0]["unique_dataset_id"])}
+        # A nomenclature without code gets the default value of its column, as with `sync_ds`
+        [dataset] = db.session.scalars(
+            select(TDatasets).where(TDatasets.id_dataset.in_(id_new_datasets))
+        ).all()
+        assert dataset.id_nomenclature_data_type == db.session.scalar(
+            select(func.ref_nomenclatures.get_default_nomenclature_value("DATA_TYP"))
+        )
+        ds_list[0]["dataset_name"] = "MTD DS"
+        _, id_new_datasets, counts = merge_ds_list(ds_list[:1] + [make_ds(uuid_af)])
+        assert +counts == Counter(inserted=1, updated=1)
+        assert len(id_new_datasets) == 1
+
+    def test_merge_actor_links(self, app):
+        af = make_af()
+        sync_af_list([af])
+        uuid_af = to_uuid(af["unique_acquisition_framework_id"])
+        actors = [
+            ActorRecord(
+                name="Test",
+                uuid_organism=None,
+                organism="MTD organism",
+                actor_role="1",
+                email=None,
+            )
+        ]
+        actor_rows = get_actor_rows(
+            actors, "id_acquisition_framework", uuid_af, uuid_af, SyncContext()
+        )
+        failed_uuids = set()
+        merge_actor_links(
+            CorAcquisitionFrameworkActor,
+            "id_acquisition_framework",
+            TAcquisitionFramework.unique_acquisition_framework_id,
+            actor_rows,
+            failed_uuids=failed_uuids,
+        )
+        assert not failed_uuids
+        assert db.session.scalar(
+            select(func.count())
+            .select_from(CorAcquisitionFrameworkActor)
+            .join(
+                TAcquisitionFramework,
+                TAcquisitionFramework.id_acquisition_framework
+                == CorAcquisitionFrameworkActor.id_acquisition_framework,
+            )
+            .where(TAcquisitionFramework.unique_acquisition_framework_id == uuid_af)
+        ) == len(actors)
+
+
+class TestSyncLock:
+    # Not an existing user: the locks are only keyed by the ID
+    id_role = -424242
+
+    def test_user_sync_lock(self, app):
+        with user_sync_lock(self.id_role) as leader:
+            assert leader
+            # Another sync of the same user is a follower, even once it has waited
+            with user_sync_lock(self.id_role, wait=0.1) as leader:
+                assert not leader
+            # Not the syncs of other users
+            with user_sync_lock(self.id_role - 1) as leader:
+                assert leader
+        with user_sync_lock(self.id_role) as leader:
+            assert leader
+
+    def test_global_sync_lock(self, app):
+        acquired, released = threading.Event(), threading.Event()
+
+        def sync_af_and_ds():
+            with app.app_context(), global_sync_lock():
+                acquired.set()
+                released.wait(5)
+
+        thread = threading.Thread(target=sync_af_and_ds)
+        with user_sync_lock(self.id_role):
+            thread.start()
+            # The global sync waits for the user syncs in progress
+            assert not acquired.wait(0.5)
+        assert acquired.wait(5)
+        # Then the user syncs are followers
+        with user_sync_lock(self.id_role) as leader:
+            assert not leader
+        released.set()
+        thread.join(5)
+        with user_sync_lock(self.id_role) as leader:
+            assert leader
+
+
+class TestFetchConcurrently:
+    def test_timeout(self, app):
+        cancel_event, stopped = threading.Event(), threading.Event()
+
+        def slow_fetch():
+            # Downloads until cancelled, as `MTDInstanceApi._iter_response_chunks`
+            while not cancel_event.wait(0.01):
+                pass
+            stopped.set()
+
+        assert fetch_concurrently(lambda: "fast", timeout=5) == ["fast"]
+        with pytest.raises(FuturesTimeoutError):
+            fetch_concurrently(lambda: "fast", slow_fetch, timeout=0.1, cancel_event=cancel_event)
+        # The fetcher still running is stopped, not only left behind
+        assert stopped.wait(5)
+
+    def test_cancel_download(self):
+        class Response:
+            url = "https://example.org/export.xml"
+            closed = False
+
+            def iter_content(self, chunk_size):
+                for _ in range(10):
+                    yield b"<xml/>"
+
+            def close(self):
+                self.closed = True
+
+        mtd_api = MTDInstanceApi("https://example.org", None)
+        response = Response()
+        chunks = mtd_api._iter_response_chunks(response)
+        assert next(chunks) == b"<xml/>"
+        mtd_api.cancel_event.set()
+        with pytest.raises(FetchCancelled):
+            next(chunks)
+        assert response.closed
+
+
+@pytest.mark.usefixtures("temporary_transaction")
+class TestSyncAfAndDs:
+    def test_skipped_records_do_not_hold_back(self, app, mtd_server):
+        _sync_af_and_ds()
+        # The DS is skipped, its AF not being in the database, and is skipped again by the next
+        #   syncs: neither the watermark nor the XML cache wait for it
+        assert not db.session.scalar(
+            select(func.count()).where(
+                TDatasets.unique_dataset_id == "4D331CAE-65C4-49EB-A3D5-2B4A46CB1B4F"
+            )
+        )
+        id_instance = app.config["MTD_SYNC"]["ID_INSTANCE_FILTER"] or 0
+        assert get_watermarks(id_instance)["DS"] == datetime.datetime(2024, 3, 1)
+        xml_cache = get_xml_cache(app.config["MTD_SYNC"])
+        assert all(xml_cache.get(url) is not None for url, _ in mtd_server.requests)
+
+    def test_not_modified(self, mtd_server, monkeypatch):
+        parsed, processed = [], []
+
+        def iter_jdd_xml_spy(*args, **kwargs):
+            parsed.append(args)
+            return iter_jdd_xml(*args, **kwargs)
+
+        def process_af_and_ds_spy(af_list, ds_list, *args, **kwargs):
+            processed.append((af_list, ds_list))
+            return {"AF": [], "DS": []}
+
+        monkeypatch.setattr("mtd_sync.mtd_sync.iter_jdd_xml", iter_jdd_xml_spy)
+        monkeypatch.setattr("mtd_sync.mtd_sync.process_af_and_ds", process_af_and_ds_spy)
+        _sync_af_and_ds()
+        assert len(parsed) == 1 and len(processed) == 1
+        # Both exports are requested again conditionally, and answered 304: nothing is parsed
+        #   nor written
+        _sync_af_and_ds()
+        assert all("If-None-Match" in headers for _, headers in mtd_server.requests[2:])
+        assert len(mtd_server.requests) == 4
+        assert len(parsed) == 1 and len(processed) == 1
+
+    def test_write_deadline(self, monkeypatch):
+        monkeypatch.setattr(
+            "mtd_sync.mtd_sync.add_unexisting_digitizer", lambda id_digitizer: None
+        )
+        ds_list = parse_jdd_xml(JDD_XML)
+        with pytest.raises(SyncBudgetExceeded) as error:
+            process_af_and_ds([], ds_list, deadline=time.monotonic())
+        assert error.value.stage == "write"
+        # The DS not processed are resumed, with their actors
+        assert ds_list[0]["actors"]
+        assert error.value.resume() == {"AF": [], "DS": []}
+
+    def test_digitizer_request_error(self, monkeypatch):
+        class TimingOutClient:
+            def get(self, url, **kwargs):
+                raise requests.Timeout(url)
+
+        monkeypatch.setattr("mtd_sync.mtd_sync.get_http_client", TimingOutClient)
+        # Skipped, without failing the synchronization
+        assert add_unexisting_digitizer(-1) is None
+
+
+class TestUserSyncExecutor:
+    def test_submit_deduplicates_jobs(self, app):
+        started, released = threading.Event(), threading.Event()
+        calls = []
+
+        def sync_af_and_ds_by_user(id_role, id_afs=None):
+            calls.append((id_role, sorted(id_afs or [])))
+            started.set()
+            released.wait(5)
+
+        with patch("mtd_sync.user_sync.sync_af_and_ds_by_user", sync_af_and_ds_by_user), patch(
+            "mtd_sync.user_sync.sync_af_and_ds_by_user_afs", sync_af_and_ds_by_user
+        ):
+            executor = UserSyncExecutor(app, max_workers=1)
+            assert executor.submit(1)
+            assert started.wait(5)
+            # Pending or running jobs of the same user are not submitted again
+            assert not executor.submit(1)
+            assert not executor.submit(1, id_afs=[2])
+            # Only the AFs not pending yet are submitted
+            assert executor.submit(3, id_afs=[4, 5])
+            assert executor.submit(3, id_afs=[5, 6])
+            assert not executor.submit(3, id_afs=[4, 6])
+            released.set()
+            executor.shutdown()
+        assert calls == [(1, []), (3, [4, 5]), (3, [6])]
+
+
+class TestXMLCache:
+    def test_conditional_headers(self, tmp_path):
+        cache = XMLResponseCache(str(tmp_path), max_size=1024, max_age=3600)
+        url = "https://inpn.mnhn.fr/mtd/cadre/export/xml/GetRecordsByInstanceId?id=1"
+        assert cache.get_conditional_headers(url) == {}
+        cache.set(url, b"<xml/>", etag='"abc"', last_modified="Wed, 21 Oct 2015 07:28:00 GMT")
+        assert cache.get_conditional_headers(url) == {
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT",
+        }
+        assert cache.read(url) == b"<xml/>"
+
+    def test_no_validator(self, tmp_path):
+        cache = XMLResponseCache(str(tmp_path), max_size=1024, max_age=3600)
+        cache.set("https://example.com", b"<xml/>")
+        assert cache.get("https://example.com") is None
+
+    def test_eviction(self, tmp_path):
+        cache = XMLResponseCache(str(tmp_path), max_size=10, max_age=3600)
+        cache.set("https://example.com/1", b"123456", etag="1")
+        time.sleep(0.01)
+        cache.set("https://example.com/2", b"123456", etag="2")
+        assert cache.get("https://example.com/1") is None
+        assert cache.get("https://example.com/2") is not None
+        cache.max_age = -1
+        assert cache.get("https://example.com/2") is None
+
+    def test_spool(self, tmp_path):
+        cache = XMLResponseCache(str(tmp_path), max_size=1024, max_age=3600)
+        chunks = cache.spool("https://example.com", [b"<a>", b"</a>"], etag="1")
+        assert b"".join(chunks) == b"<a></a>"
+        assert cache.get("https://example.com") is None
+        cache.commit("https://example.com")
+        assert cache.read("https://example.com") == b"<a></a>"
+
+
 @pytest.fixture
 def users_with_mail(users):
     """
@@ -0,0 +1,137 @@
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from geonature.utils.config import config
+
+from .mtd_sync import (
+    resume_sync_af_and_ds_by_user,
+    sync_af_and_ds_by_user,
+    sync_af_and_ds_by_user_afs,
+)
+
+# Get the logger instance "MTD_SYNC"
+logger = logging.getLogger("MTD_SYNC")
+
+_user_sync_executor = None
+_user_sync_executor_lock = threading.Lock()
+
+
+class UserSyncExecutor:
+    """
+    Pool of threads running the per-user MTD synchronizations off the request path.
+
+    A job is identified by the ID of the role and, for a sync restricted to acquisition
+    frameworks, the IDs of the AFs. An AF is not submitted again while it is pending or running,
+    nor is any while a full sync of the same user is.
+    """
+
+    def __init__(self, app, max_workers=2):
+        """
+        Parameters
+        ----------
+        app : flask.Flask
+            the application, whose context the synchronizations run in
+        max_workers : int
+            number of threads running synchronizations
+        """
+        self.app = app
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="mtd_sync_user"
+        )
+        self._jobs = set()
+        self._lock = threading.Lock()
+
+    def submit(self, id_role, id_afs=None, resume=None) -> bool:
+        """
+        Submit the synchronization of a user, unless it is already pending or running.
+
+        Parameters
+        ----------
+        id_role : int
+            ID of the user
+        id_afs : Iterable[int], optional
+            IDs of acquisition frameworks, to restrict the sync to
+        resume : callable, optional
+            stages of the sync not completed within its time budget in the request, to run
+            instead of the whole sync (see `SyncBudgetExceeded`)
+
+        Returns
+        -------
+        bool
+            True if the job has been submitted, False if it has been de-duplicated
+        """
+        keys = {(id_role, id_af) for id_af in id_afs or [None]}
+        with self._lock:
+            if (id_role, None) in self._jobs:
+                return False
+            # Only the AFs not pending or running yet
+            keys -= self._jobs
+            if not keys:
+                return False
+            self._jobs |= keys
+        try:
+            self._executor.submit(self._run, id_role, keys, resume)
+        except RuntimeError:
+            # The executor is shut down, as the interpreter is exiting
+            with self._lock:
+                self._jobs -= keys
+            return False
+        return True
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """
+        Stop accepting synchronizations, e.g. on application exit.
+
+        Parameters
+        ----------
+        wait : bool
+            wait for the synchronizations submitted to finish
+        cancel_pending : bool
+            cancel the synchronizations not started yet
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_pending)
+
+    def _run(self, id_role, keys, resume=None):
+        id_afs = [id_af for _, id_af in keys if id_af is not None]
+        try:
+            with self.app.app_context():
+                if resume is not None:
+                    resume_sync_af_and_ds_by_user(id_role, resume)
+                elif id_afs:
+                    sync_af_and_ds_by_user_afs(id_role=id_role, id_afs=id_afs)
+                else:
+                    sync_af_and_ds_by_user(id_role=id_role)
+        except Exception as e:
+            logger.exception(f"Error while get JDD via MTD: {e}")
+        finally:
+            with self._lock:
+                self._jobs -= keys
+
+
+def get_user_sync_executor(app) -> UserSyncExecutor:
+    """
+    Return the executor of per-user synchronizations shared by the whole module, creating it from
+    configuration on first call.
+
+    Parameters
+    ----------
+    app : flask.Flask
+        the application, whose context the synchronizations run in
+
+    Returns
+    -------
+    UserSyncExecutor
+        the shared executor
+    """
+    global _user_sync_executor
+    if _user_sync_executor is None:
+        with _user_sync_executor_lock:
+            if _user_sync_executor is None:
+                _user_sync_executor = UserSyncExecutor(
+                    app, max_workers=config["MTD_SYNC"]["SYNC_USER_ASYNC_WORKERS"]
+                )
+                # On exit, only the running synchronizations are waited for
+                atexit.register(_user_sync_executor.shutdown, cancel_pending=True)
+    return _user_sync_executor
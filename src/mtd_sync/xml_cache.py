@@ -0,0 +1,256 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+# Get the logger instance "MTD_SYNC"
+logger = logging.getLogger("MTD_SYNC")
+
+
+class XMLResponseCache:
+    """
+    On-disk cache of the XML exports retrieved from 'INPN Métadonnées'.
+
+    For each URL, the raw XML is stored along with the validators (`ETag`, `Last-Modified`) sent by
+    the server, so that the next request for the same URL can be made conditional.
+    Entries are evicted when they are older than `max_age` seconds, and the oldest entries are
+    evicted when the total size of the cache exceeds `max_size` bytes.
+    """
+
+    def __init__(self, directory, max_size, max_age):
+        """
+        Parameters
+        ----------
+        directory : str
+            directory where cache entries are written
+        max_size : int
+            maximum total size, in bytes, of the cached XML
+        max_age : float
+            maximum age, in seconds, of a cache entry
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, url, extension):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def _write_atomic(self, path, content: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _remove(self, url, extensions=("json", "xml", "json.pending", "xml.pending")):
+        for extension in extensions:
+            try:
+                os.unlink(self._path(url, extension))
+            except FileNotFoundError:
+                pass
+
+    def _iter_entries(self):
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as metadata_file:
+                    yield json.load(metadata_file)
+            except (OSError, ValueError):
+                continue
+
+    def get(self, url):
+        """
+        Return the metadata of the cache entry for an URL.
+
+        Parameters
+        ----------
+        url : str
+            URL of the XML export
+
+        Returns
+        -------
+        dict or None
+            metadata of the entry - `url`, `etag`, `last_modified`, `stored_at`, `size` -
+            or None if there is no valid entry for the URL
+        """
+        try:
+            with open(self._path(url, "json")) as metadata_file:
+                metadata = json.load(metadata_file)
+        except (OSError, ValueError):
+            return None
+        if time.time() - metadata["stored_at"] > self.max_age or not os.path.exists(
+            self._path(url, "xml")
+        ):
+            self._remove(url)
+            return None
+        return metadata
+
+    def get_conditional_headers(self, url) -> dict:
+        """
+        Return the headers to send for a conditional request on an URL.
+
+        Parameters
+        ----------
+        url : str
+            URL of the XML export
+
+        Returns
+        -------
+        dict
+            `If-None-Match` and/or `If-Modified-Since` headers, empty if the URL is not cached
+        """
+        metadata = self.get(url)
+        headers = {}
+        if metadata is None:
+            return headers
+        if metadata["etag"]:
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata["last_modified"]:
+            headers["If-Modified-Since"] = metadata["last_modified"]
+        return headers
+
+    def read(self, url) -> bytes:
+        """
+        Return the cached XML for an URL.
+        """
+        with open(self._path(url, "xml"), "rb") as xml_file:
+            return xml_file.read()
+
+    def set(self, url, content: bytes, etag=None, last_modified=None):
+        """
+        Store the XML retrieved for an URL, along with its validators.
+
+        Nothing is stored if the server did not send any validator, as the entry could not be used
+        for a conditional request.
+
+        Parameters
+        ----------
+        url : str
+            URL of the XML export
+        content : bytes
+            raw XML
+        etag : str, optional
+            value of the `ETag` header of the response
+        last_modified : str, optional
+            value of the `Last-Modified` header of the response
+        """
+        for _ in self.spool(url, [content], etag=etag, last_modified=last_modified):
+            pass
+        self.commit(url)
+
+    def spool(self, url, xml_chunks, etag=None, last_modified=None):
+        """
+        Yield the chunks of the XML retrieved for an URL, while writing them to a pending entry.
+
+        The pending entry replaces the current entry for the URL only once `commit` is called.
+        Nothing is written if the server did not send any validator.
+
+        Parameters
+        ----------
+        url : str
+            URL of the XML export
+        xml_chunks : Iterable[bytes]
+            chunks of the raw XML
+        etag : str, optional
+            value of the `ETag` header of the response
+        last_modified : str, optional
+            value of the `Last-Modified` header of the response
+
+        Yields
+        ------
+        bytes
+            the chunks of the raw XML
+        """
+        # Drop the pending entry possibly left by an interrupted synchronization
+        self._remove(url, extensions=("json.pending", "xml.pending"))
+        if not etag and not last_modified:
+            yield from xml_chunks
+            return
+        size = 0
+        with open(self._path(url, "xml.pending"), "wb") as pending_file:
+            for chunk in xml_chunks:
+                pending_file.write(chunk)
+                size += len(chunk)
+                yield chunk
+        metadata = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": None,
+            "size": size,
+        }
+        self._write_atomic(self._path(url, "json.pending"), json.dumps(metadata).encode("utf-8"))
+
+    def commit(self, url):
+        """
+        Replace the entry for an URL by its pending entry, if any.
+
+        Parameters
+        ----------
+        url : str
+            URL of the XML export
+        """
+        try:
+            with open(self._path(url, "json.pending")) as metadata_file:
+                metadata = json.load(metadata_file)
+        except (OSError, ValueError):
+            return
+        if metadata["size"] > self.max_size:
+            logger.debug("MTD - XML CACHE : response for %s too large to be cached" % url)
+            self._remove(url)
+            return
+        os.replace(self._path(url, "xml.pending"), self._path(url, "xml"))
+        metadata["stored_at"] = time.time()
+        self._write_atomic(self._path(url, "json"), json.dumps(metadata).encode("utf-8"))
+        os.unlink(self._path(url, "json.pending"))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove expired entries, then the oldest entries until the cache fits in `max_size`.
+        """
+        now = time.time()
+        entries = []
+        for metadata in self._iter_entries():
+            if now - metadata["stored_at"] > self.max_age:
+                self._remove(metadata["url"])
+            else:
+                entries.append(metadata)
+        total_size = sum(metadata["size"] for metadata in entries)
+        for metadata in sorted(entries, key=lambda metadata: metadata["stored_at"]):
+            if total_size <= self.max_size:
+                break
+            self._remove(metadata["url"])
+            total_size -= metadata["size"]
+
+
+def get_xml_cache(configuration_mtd):
+    """
+    Return the XML cache configured for the module, or None if it is disabled.
+
+    Parameters
+    ----------
+    configuration_mtd : dict
+        configuration of the MTD_SYNC module
+
+    Returns
+    -------
+    XMLResponseCache or None
+        the XML cache
+    """
+    if not configuration_mtd["XML_CACHE_ENABLED"]:
+        return None
+    return XMLResponseCache(
+        directory=configuration_mtd["XML_CACHE_DIR"]
+        or os.path.join(tempfile.gettempdir(), "mtd_sync"),
+        max_size=configuration_mtd["XML_CACHE_MAX_SIZE_MB"] * 1024 * 1024,
+        max_age=configuration_mtd["XML_CACHE_MAX_AGE_DAYS"] * 24 * 3600,
+    )
@@ -1,7 +1,7 @@
 import datetime
 import json
 import logging
-from typing import Union
+from typing import Iterable, Iterator, Union
 
 from flask import current_app
 from lxml import etree as ET
@@ -9,6 +9,7 @@ from lxml import etree as ET
 from geonature.utils.config import config
 from geonature.core.gn_meta.models import TAcquisitionFramework
 
+from .records import AcquisitionFrameworkRecord, ActorRecord, DatasetRecord, intern_str
 
 namespace = config["MTD_SYNC"]["XML_NAMESPACE"]
 
@@ -36,37 +37,241 @@ def get_tag_content(parent, tag_name, default_value=None):
     return default_value
 
 
+# Namespaced names of the tags read by the parsers, computed once and for all
+_tags = {
+    tag_name: namespace + tag_name
+    for tag_name in [
+        # Actors
+        "nomPrenom",
+        "roleActeur",
+        "idOrganisme",
+        "organisme",
+        "mail",
+        # Additional attributes
+        "attributsAdditionnels",
+        "nomAttribut",
+        "valeurAttribut",
+        # Acquisition frameworks
+        "identifiantCadre",
+        "libelle",
+        "description",
+        "ReferenceTemporelle",
+        "dateCreationMtd",
+        "dateMiseAJourMtd",
+        "dateLancement",
+        "dateCloture",
+        "acteurPrincipal",
+        "acteurAutre",
+        # Datasets
+        "identifiantJdd",
+        "libelleCourt",
+        "domaineTerrestre",
+        "domaineMarin",
+        "typeDonnees",
+        "typeDonneesCollectees",
+        "dateCreation",
+        "dateRevision",
+        "BaseProduction",
+        "pointContactPF",
+        "pointContactJdd",
+        "contactBaseProduction",
+    ]
+}
+
+
+def get_children_contents(parent, list_tags=()):
+    """
+    Walk the children of a xml node once, and map each (namespaced) tag to the content of its first
+    occurrence, as `get_tag_content` would find it.
+    Params:
+        parent (etree Element): the parent node, possibly None
+        list_tags (iterable): (namespaced) tags for which all the child nodes are also collected
+    Return
+        tuple: the dict of contents by tag, and the dict of child nodes by tag for `list_tags`
+    """
+    contents = {}
+    children = {tag: [] for tag in list_tags}
+    if parent is not None:
+        for child in parent:
+            tag = child.tag
+            if tag not in contents:
+                contents[tag] = child.text
+            if tag in children:
+                children[tag].append(child)
+    return contents, children
+
+
+def get_content(contents, tag_name, default_value=None):
+    """
+    Return the content of a xml tag from the contents returned by `get_children_contents`
+    Params:
+        contents (dict): the contents by tag
+        tag_name (str): the name of the tag, without namespace
+        default_value (any): the default value if the tag doesn't exist or is empty
+    Return
+        any: the tag content or the default value
+    """
+    text = contents.get(_tags[tag_name])
+    if text:
+        return text
+    return default_value
+
+
+def get_first_child(children, tag_name):
+    """
+    Return the first child node of a tag from the child nodes returned by `get_children_contents`
+    Params:
+        children (dict): the child nodes by tag
+        tag_name (str): the name of the tag, without namespace
+    Return
+        etree Element: the first child node, or None
+    """
+    tag_children = children[_tags[tag_name]]
+    return tag_children[0] if tag_children else None
+
+
+def parse_additional_attributes_xml(attributs_additionnels_node):
+    """
+    Parse the `attributsAdditionnels` node of an acquisition framework or a dataset
+    Param:
+        attributs_additionnels_node (etree Element): the `attributsAdditionnels` node, possibly None
+    Returns:
+        dict: the values by attribute name (`nomAttribut`), the last one prevailing
+    """
+    additional_attributes = {}
+    if attributs_additionnels_node is not None:
+        for attr in attributs_additionnels_node:
+            attr_contents, _ = get_children_contents(attr)
+            additional_attributes[get_content(attr_contents, "nomAttribut")] = get_content(
+                attr_contents, "valeurAttribut"
+            )
+    return additional_attributes
+
+
 def parse_actors_xml(actors):
     """
     Parse the parameters of the Actor provided as an XML node in the input variable "actors"
     Param:
         actors (etree Element): Node of an actor type containing from one to multiple actors
     Returns:
-        dict: A dictionnary of the actors informations
+        list: A list of the actors informations, as `ActorRecord`
     """
     actor_list = []
     if actors is not None:
         for actor_node in actors:
-            name = get_tag_content(actor_node, "nomPrenom")
-            actor_role = get_tag_content(actor_node, "roleActeur")
-            uuid_organism = get_tag_content(actor_node, "idOrganisme")
-            organism = get_tag_content(actor_node, "organisme")
-            email = get_tag_content(actor_node, "mail")
+            actor_contents, _ = get_children_contents(actor_node)
+            name = get_content(actor_contents, "nomPrenom")
+            actor_role = get_content(actor_contents, "roleActeur")
+            uuid_organism = get_content(actor_contents, "idOrganisme")
+            organism = get_content(actor_contents, "organisme")
+            email = get_content(actor_contents, "mail")
 
             actor_list.append(
-                {
-                    "name": name,
-                    "uuid_organism": uuid_organism,
-                    "organism": organism,
-                    "actor_role": actor_role,
-                    "email": email,
-                }
+                ActorRecord(
+                    name=intern_str(name),
+                    uuid_organism=intern_str(uuid_organism),
+                    organism=intern_str(organism),
+                    actor_role=intern_str(actor_role),
+                    email=intern_str(email),
+                )
             )
 
     return actor_list
 
 
-def parse_acquisition_frameworks_xml(xml: str) -> list:
+def iter_xml_elements(xml_chunks: Iterable[bytes], tag_name: str) -> Iterator[ET._Element]:
+    """
+    Incrementally parse an XML fed by chunks, and yield each element with the given tag as soon as
+    it is complete.
+
+    Once the consumer is done with an element, the element and its previous siblings are cleared,
+    so that memory usage does not grow with the size of the XML.
+
+    Parameters
+    ----------
+    xml_chunks : Iterable[bytes]
+        chunks of the XML, e.g. the chunks of a streamed HTTP response
+    tag_name : str
+        name of the tag of the elements to yield, without namespace
+
+    Yields
+    ------
+    etree Element
+        the complete elements with the given tag
+    """
+    parser = ET.XMLPullParser(
+        events=("end",),
+        tag=namespace + tag_name,
+        ns_clean=True,
+        recover=True,
+        encoding="utf-8",
+    )
+
+    def read_events():
+        for _, element in parser.read_events():
+            yield element
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+    for chunk in xml_chunks:
+        parser.feed(chunk)
+        yield from read_events()
+    parser.close()
+    yield from read_events()
+
+
+def is_retained_instance(id_instance, id_instance_filter) -> bool:
+    """
+    Tell whether a record is to be retrieved given its instance and the configured instance filter
+    Params:
+        id_instance (str): the ID of the instance of the record (`ID_INSTANCE` additional attribute)
+        id_instance_filter (int): the configured `ID_INSTANCE_FILTER`
+    Return
+        bool: True if there is no filter or if the record is associated to the filtered instance
+    """
+    return not id_instance_filter or id_instance == str(id_instance_filter)
+
+
+def iter_acquisition_frameworks_xml(xml_chunks: Iterable[bytes], stats=None) -> Iterator[dict]:
+    """
+    Incrementally parse an XML of acquisition frameworks fed by chunks.
+
+    The ID of the instance is read first, so that acquisition frameworks that are not associated
+    to the configured `ID_INSTANCE_FILTER` are skipped without being further parsed.
+
+    Parameters
+    ----------
+    xml_chunks : Iterable[bytes]
+        chunks of the XML of acquisition frameworks
+    stats : collections.Counter, optional
+        counter whose key `af_skipped_instance` is incremented for each skipped acquisition framework
+
+    Yields
+    ------
+    AcquisitionFrameworkRecord
+        a parsed acquisition framework from the XML
+    """
+    id_instance_filter = current_app.config["MTD_SYNC"]["ID_INSTANCE_FILTER"]
+    for af in iter_xml_elements(xml_chunks, "CadreAcquisition"):
+        additional_attributes = parse_additional_attributes_xml(
+            af.find(_tags["attributsAdditionnels"])
+        )
+        # Filter with id_instance
+        id_instance = additional_attributes.get("ID_INSTANCE")
+        if not is_retained_instance(id_instance, id_instance_filter):
+            if id_instance is None:
+                log_missing_id_instance(af)
+            if stats is not None:
+                stats["af_skipped_instance"] += 1
+            continue
+        current_af, _ = parse_acquisition_framework(af, additional_attributes)
+        yield current_af
+
+
+def parse_acquisition_frameworks_xml(xml: str, stats=None) -> list:
     """
     Parse an XML of acquisition frameworks from a string.
 
@@ -74,22 +279,15 @@ def parse_acquisition_frameworks_xml(xml: str) -> list:
     ----------
     xml : str
         The XML of acquisition frameworks
+    stats : collections.Counter, optional
+        see `iter_acquisition_frameworks_xml`
 
     Returns
     -------
     af_list : list
         A list of dict with each dict representing a parsed acquisition framework from the XML
     """
-    root = ET.fromstring(xml, parser=_xml_parser)
-    af_iter = root.iterfind(".//{http://inpn.mnhn.fr/mtd}CadreAcquisition")
-    af_list = []
-    id_instance_filter = current_app.config["MTD_SYNC"]["ID_INSTANCE_FILTER"]
-    for af in af_iter:
-        current_af, id_instance = parse_acquisition_framework(af)
-        # Filter with id_instance
-        if not id_instance_filter or id_instance_filter and id_instance == str(id_instance_filter):
-            af_list.append(current_af)
-    return af_list
+    return list(iter_acquisition_frameworks_xml([xml], stats=stats))
 
 
 def parse_single_acquisition_framework_xml(xml):
@@ -104,180 +302,239 @@ def parse_single_acquisition_framework_xml(xml):
     return parsed_af
 
 
-def parse_acquisition_framework(ca):
-    # We extract all the required informations from the different tags of the XML file
-    ca_uuid = get_tag_content(ca, "identifiantCadre")
+def log_missing_id_instance(ca):
+    """
+    Log a warning message for an AF without ID_INSTANCE
+    Param:
+        ca (etree Element): the `CadreAcquisition` node
+    """
+    ca_contents, _ = get_children_contents(ca)
+    logger.warning(
+        f"MTD - No ID_INSTANCE found for the AF with UUID '{get_content(ca_contents, 'identifiantCadre')}' and name '{get_content(ca_contents, 'libelle')}' - this AF will not be retrieved if an ID_INSTANCE_FILTER is configured"
+    )
+
+
+def parse_acquisition_framework(ca, additional_attributes=None):
+    """
+    Parse an acquisition framework from its XML node
+    Params:
+        ca (etree Element): the `CadreAcquisition` node
+        additional_attributes (dict): the additional attributes of the node, if already parsed
+    Return:
+        tuple: the parsed acquisition framework as `AcquisitionFrameworkRecord`, and the ID of its instance
+    """
     ca_name_max_length = TAcquisitionFramework.acquisition_framework_name.property.columns[
         0
     ].type.length
-    ca_name = get_tag_content(ca, "libelle")[: ca_name_max_length - 1]
-    ca_desc = get_tag_content(ca, "description", default_value="")
-    date_info = ca.find(namespace + "ReferenceTemporelle")
-    ca_create_date = get_tag_content(ca, "dateCreationMtd", default_value=datetime.datetime.now())
-    ca_update_date = get_tag_content(ca, "dateMiseAJourMtd")
-    ca_start_date = get_tag_content(
-        date_info, "dateLancement", default_value=datetime.datetime.now()
+    # We extract all the required informations from the different tags of the XML file, walking
+    #   the children of the node only once
+    list_contact_tags = [_tags["acteurPrincipal"], _tags["acteurAutre"]]
+    ca_contents, ca_children = get_children_contents(
+        ca,
+        list_tags=[
+            _tags["ReferenceTemporelle"],
+            _tags["attributsAdditionnels"],
+            *list_contact_tags,
+        ],
     )
-    ca_end_date = get_tag_content(date_info, "dateCloture")
-    ca_id_digitizer = None
-    id_instance = None
-    attributs_additionnels_node = ca.find(namespace + "attributsAdditionnels")
-    for attr in attributs_additionnels_node:
-        # We extract the ID of the user to assign it the JDD as an id_digitizer
-        if get_tag_content(attr, "nomAttribut") == "ID_CREATEUR":
-            ca_id_digitizer = get_tag_content(attr, "valeurAttribut")
-        # We extract the ID of the instance, to possibly further filter it if not associated to the configured instance
-        if get_tag_content(attr, "nomAttribut") == "ID_INSTANCE":
-            id_instance = get_tag_content(attr, "valeurAttribut")
+    ca_uuid = get_content(ca_contents, "identifiantCadre")
+    ca_name = get_content(ca_contents, "libelle")[: ca_name_max_length - 1]
+    ca_desc = get_content(ca_contents, "description", default_value="")
+    date_contents, _ = get_children_contents(get_first_child(ca_children, "ReferenceTemporelle"))
+    ca_create_date = get_content(ca_contents, "dateCreationMtd") or datetime.datetime.now()
+    ca_update_date = get_content(ca_contents, "dateMiseAJourMtd")
+    ca_start_date = get_content(date_contents, "dateLancement") or datetime.datetime.now()
+    ca_end_date = get_content(date_contents, "dateCloture")
+    if additional_attributes is None:
+        additional_attributes = parse_additional_attributes_xml(
+            get_first_child(ca_children, "attributsAdditionnels")
+        )
+    # We extract the ID of the user to assign it the JDD as an id_digitizer
+    ca_id_digitizer = additional_attributes.get("ID_CREATEUR")
+    # We extract the ID of the instance, to possibly further filter it if not associated to the configured instance
+    id_instance = additional_attributes.get("ID_INSTANCE")
     # Log a warning message if no ID_INSTANCE is found
     if id_instance is None:
-        logger.warning(
-            f"MTD - No ID_INSTANCE found for the AF with UUID '{ca_uuid}' and name '{ca_name}' - this AF will not be retrieved if an ID_INSTANCE_FILTER is configured"
-        )
+        log_missing_id_instance(ca)
 
     # We search for all the Contact nodes :
     # - Main contact in acteurPrincipal node
     # - Funder in acteurAutre node
     # - Project owner in acteurAutre node
     # - Project manager in acteurAutre node
-    list_contact_tags = ["acteurPrincipal", "acteurAutre"]
     all_actors = []
     for contact_tag in list_contact_tags:
-        if get_tag_content(ca, contact_tag) is not None:
-            for actor_node in ca.findall(namespace + contact_tag):
-                actor = parse_actors_xml(actor_node)
-                all_actors = all_actors + actor
-
-    return {
-        "unique_acquisition_framework_id": ca_uuid,
-        "acquisition_framework_name": ca_name,
-        "acquisition_framework_desc": ca_desc,
-        "acquisition_framework_start_date": ca_start_date,
-        "acquisition_framework_end_date": ca_end_date,
-        "meta_create_date": ca_create_date,
-        "meta_update_date": ca_update_date,
-        "id_digitizer": ca_id_digitizer,
-        "actors": all_actors,
-    }, id_instance
-
-
-def parse_jdd_xml(xml):
+        if ca_contents.get(contact_tag):
+            for actor_node in ca_children[contact_tag]:
+                all_actors.extend(parse_actors_xml(actor_node))
+
+    return (
+        AcquisitionFrameworkRecord(
+            unique_acquisition_framework_id=ca_uuid,
+            acquisition_framework_name=ca_name,
+            acquisition_framework_desc=ca_desc,
+            acquisition_framework_start_date=ca_start_date,
+            acquisition_framework_end_date=ca_end_date,
+            meta_create_date=ca_create_date,
+            meta_update_date=ca_update_date,
+            id_digitizer=intern_str(ca_id_digitizer),
+            actors=all_actors,
+        ),
+        id_instance,
+    )
+
+
+def format_acquisition_framework_id_from_xml(provided_af_uuid) -> Union[str, None]:
     """
-    Parse an xml of datasets from a string
-    Return:
-        list: a list of dict of the JDD in the xml
+    Format the acquisition framework UUID provided for the dataset
+        i.e. the value for the tag `<jdd:identifiantCadre>` in the XML file
+
+    Args:
+        provided_af_uuid (str): The acquisition framework UUID
+    Returns:
+        Union[str, None]: The formatted acquisition framework UUID, or None if none was provided
     """
+    if not provided_af_uuid:
+        return None
 
-    root = ET.fromstring(xml, parser=_xml_parser)
-    jdd_list = []
-
-    def format_acquisition_framework_id_from_xml(provided_af_uuid) -> Union[str, None]:
-        """
-        Format the acquisition framework UUID provided for the dataset
-            i.e. the value for the tag `<jdd:identifiantCadre>` in the XML file
-
-        Args:
-            provided_af_uuid (str): The acquisition framework UUID
-        Returns:
-            Union[str, None]: The formatted acquisition framework UUID, or None if none was provided
-        """
-        if not provided_af_uuid:
-            return None
-
-        if provided_af_uuid.startswith("http://oafs.fr/meta/ca/"):
-            return provided_af_uuid.split("/")[-1]
-
-        return provided_af_uuid
-
-    for jdd in root.findall(".//" + namespace + "JeuDeDonnees"):
-        # We extract all the required informations from the different tags of the XML file
-        jdd_uuid = get_tag_content(jdd, "identifiantJdd")
-        # TODO: handle case where value for the tag `<jdd:identifiantCadre>` in the XML file is not of the form `xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx`
-        #   Solutions - if in the form `http://oafs.fr/meta/ca/xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx` (has some entries for INPN MTD PREPROD and instance 'Thématique') :
-        #       - (retained) Format by keeping only the `xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx` part
-        #       - Add a check further in the MTD sync to process only if ca_uuid is in the right format
-        ca_uuid = format_acquisition_framework_id_from_xml(
-            get_tag_content(jdd, "identifiantCadre")
+    if provided_af_uuid.startswith("http://oafs.fr/meta/ca/"):
+        return provided_af_uuid.split("/")[-1]
+
+    return provided_af_uuid
+
+
+def parse_jdd(jdd, additional_attributes=None):
+    """
+    Parse a dataset from its XML node
+    Params:
+        jdd (etree Element): the `JeuDeDonnees` node
+        additional_attributes (dict): the additional attributes of the node, if already parsed
+    Return:
+        tuple: the parsed dataset as `DatasetRecord`, and the ID of the instance of the dataset
+    """
+    # We extract all the required informations from the different tags of the XML file, walking
+    #   the children of the node only once
+    list_contact_tags = [_tags["pointContactPF"], _tags["pointContactJdd"]]
+    jdd_contents, jdd_children = get_children_contents(
+        jdd,
+        list_tags=[
+            _tags["attributsAdditionnels"],
+            _tags["BaseProduction"],
+            *list_contact_tags,
+        ],
+    )
+    jdd_uuid = get_content(jdd_contents, "identifiantJdd")
+    # TODO: handle case where value for the tag `<jdd:identifiantCadre>` in the XML file is not of the form `xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx`
+    #   Solutions - if in the form `http://oafs.fr/meta/ca/xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx` (has some entries for INPN MTD PREPROD and instance 'Thématique') :
+    #       - (retained) Format by keeping only the `xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx` part
+    #       - Add a check further in the MTD sync to process only if ca_uuid is in the right format
+    ca_uuid = format_acquisition_framework_id_from_xml(
+        get_content(jdd_contents, "identifiantCadre")
+    )
+    dataset_name = get_content(jdd_contents, "libelle")
+    dataset_shortname = get_content(jdd_contents, "libelleCourt", default_value="")
+    dataset_desc = get_content(jdd_contents, "description", default_value="")
+    terrestrial_domain = get_content(jdd_contents, "domaineTerrestre", default_value=False)
+    marine_domain = get_content(jdd_contents, "domaineMarin", default_value=False)
+    data_type = get_content(jdd_contents, "typeDonnees")
+    collect_data_type = get_content(jdd_contents, "typeDonneesCollectees")
+    create_date = get_content(jdd_contents, "dateCreation") or datetime.datetime.now()
+    update_date = get_content(jdd_contents, "dateRevision")
+    if additional_attributes is None:
+        additional_attributes = parse_additional_attributes_xml(
+            get_first_child(jdd_children, "attributsAdditionnels")
         )
-        dataset_name = get_tag_content(jdd, "libelle")
-        dataset_shortname = get_tag_content(jdd, "libelleCourt", default_value="")
-        dataset_desc = get_tag_content(jdd, "description", default_value="")
-        terrestrial_domain = get_tag_content(jdd, "domaineTerrestre", default_value=False)
-        marine_domain = get_tag_content(jdd, "domaineMarin", default_value=False)
-        data_type = get_tag_content(jdd, "typeDonnees")
-        collect_data_type = get_tag_content(jdd, "typeDonneesCollectees")
-        create_date = get_tag_content(jdd, "dateCreation", default_value=datetime.datetime.now())
-        update_date = get_tag_content(jdd, "dateRevision")
-        attributs_additionnels_node = jdd.find(namespace + "attributsAdditionnels")
-
-        # We extract the ID of the user to assign it the JDD as an id_digitizer
-        id_digitizer = None
-        id_instance = None
-        code_statut_donnees_source = None
-        for attr in attributs_additionnels_node:
-            if get_tag_content(attr, "nomAttribut") == "ID_CREATEUR":
-                id_digitizer = get_tag_content(attr, "valeurAttribut")
-
-            if get_tag_content(attr, "nomAttribut") == "ID_INSTANCE":
-                id_instance = get_tag_content(attr, "valeurAttribut")
-
-            if get_tag_content(attr, "nomAttribut") == "CODE_STATUT_DONNEES_SOURCE":
-                code_statut_donnees_source = get_tag_content(attr, "valeurAttribut")
-
-        # We search for all the Contact nodes :
-        # - Main contact in pointContactPF node
-        # - JDD provider in pointContactJdd node
-        # - JDD builder in pointContactJdd node
-        # - Database contact in contactBaseProduction node
-        list_contact_tags = [
-            "pointContactPF",
-            "pointContactJdd",
-            "contactBaseProduction",
-        ]
-        all_actors = []
-        for contact_tag in list_contact_tags:
-            if contact_tag == "contactBaseProduction":
-                contact_node = jdd.find(namespace + "BaseProduction")
-            else:
-                contact_node = jdd
-            if get_tag_content(contact_node, contact_tag) is not None:
-                for actor_node in contact_node.findall(namespace + contact_tag):
-                    actor = parse_actors_xml(actor_node)
-                    all_actors = all_actors + actor
-
-        keywords = None
-
-        # We build the JDD data from all the variables collected from the XML file
-        current_jdd = {
-            "unique_dataset_id": jdd_uuid,
-            "uuid_acquisition_framework": ca_uuid,
-            "dataset_name": (
-                dataset_name if len(dataset_name) < 256 else f"{dataset_name[:252]}..."
-            ),
-            "dataset_shortname": dataset_shortname,
-            "dataset_desc": (
-                dataset_desc
-                if len(dataset_name) < 256
-                else f"Nom complet du jeu de données dans MTD : {dataset_name}\n {dataset_desc}"
-            ),
-            "keywords": keywords,
-            "terrestrial_domain": json.loads(terrestrial_domain),
-            "marine_domain": json.loads(marine_domain),
-            "cd_nomenclature_data_type": data_type,
-            "id_digitizer": id_digitizer,
-            "cd_nomenclature_data_origin": code_statut_donnees_source,
-            "actors": all_actors,
-            "meta_create_date": create_date,
-            "meta_update_date": update_date,
-        }
 
+    # We extract the ID of the user to assign it the JDD as an id_digitizer
+    id_digitizer = additional_attributes.get("ID_CREATEUR")
+    id_instance = additional_attributes.get("ID_INSTANCE")
+    code_statut_donnees_source = additional_attributes.get("CODE_STATUT_DONNEES_SOURCE")
+
+    # We search for all the Contact nodes :
+    # - Main contact in pointContactPF node
+    # - JDD provider in pointContactJdd node
+    # - JDD builder in pointContactJdd node
+    # - Database contact in contactBaseProduction node
+    contact_tag_base_production = _tags["contactBaseProduction"]
+    base_production_contents, base_production_children = get_children_contents(
+        get_first_child(jdd_children, "BaseProduction"),
+        list_tags=[contact_tag_base_production],
+    )
+    all_actors = []
+    for contact_tag, contact_contents, contact_children in [
+        *((contact_tag, jdd_contents, jdd_children) for contact_tag in list_contact_tags),
+        (contact_tag_base_production, base_production_contents, base_production_children),
+    ]:
+        if contact_contents.get(contact_tag):
+            for actor_node in contact_children[contact_tag]:
+                all_actors.extend(parse_actors_xml(actor_node))
+
+    keywords = None
+
+    # We build the JDD data from all the variables collected from the XML file
+    current_jdd = DatasetRecord(
+        unique_dataset_id=jdd_uuid,
+        uuid_acquisition_framework=intern_str(ca_uuid),
+        dataset_name=(dataset_name if len(dataset_name) < 256 else f"{dataset_name[:252]}..."),
+        dataset_shortname=dataset_shortname,
+        dataset_desc=(
+            dataset_desc
+            if len(dataset_name) < 256
+            else f"Nom complet du jeu de données dans MTD : {dataset_name}\n {dataset_desc}"
+        ),
+        keywords=keywords,
+        terrestrial_domain=json.loads(terrestrial_domain),
+        marine_domain=json.loads(marine_domain),
+        cd_nomenclature_data_type=intern_str(data_type),
+        id_digitizer=intern_str(id_digitizer),
+        cd_nomenclature_data_origin=intern_str(code_statut_donnees_source),
+        actors=all_actors,
+        meta_create_date=create_date,
+        meta_update_date=update_date,
+    )
+    return current_jdd, id_instance
+
+
+def iter_jdd_xml(xml_chunks: Iterable[bytes], stats=None) -> Iterator[dict]:
+    """
+    Incrementally parse an XML of datasets fed by chunks.
+
+    The ID of the instance is read first, so that datasets that are not associated to the
+    configured `ID_INSTANCE_FILTER` are skipped without being further parsed.
+
+    Parameters
+    ----------
+    xml_chunks : Iterable[bytes]
+        chunks of the XML of datasets
+    stats : collections.Counter, optional
+        counter whose key `ds_skipped_instance` is incremented for each skipped dataset
+
+    Yields
+    ------
+    DatasetRecord
+        a parsed dataset from the XML
+    """
+    id_instance_filter = current_app.config["MTD_SYNC"]["ID_INSTANCE_FILTER"]
+    for jdd in iter_xml_elements(xml_chunks, "JeuDeDonnees"):
+        additional_attributes = parse_additional_attributes_xml(
+            jdd.find(_tags["attributsAdditionnels"])
+        )
         # filter with id_instance
-        if current_app.config["MTD_SYNC"]["ID_INSTANCE_FILTER"]:
-            if id_instance and id_instance == str(
-                current_app.config["MTD_SYNC"]["ID_INSTANCE_FILTER"]
-            ):
-                jdd_list.append(current_jdd)
-        else:
-            jdd_list.append(current_jdd)
-
-    return jdd_list
+        if not is_retained_instance(additional_attributes.get("ID_INSTANCE"), id_instance_filter):
+            if stats is not None:
+                stats["ds_skipped_instance"] += 1
+            continue
+        current_jdd, _ = parse_jdd(jdd, additional_attributes)
+        yield current_jdd
+
+
+def parse_jdd_xml(xml, stats=None):
+    """
+    Parse an xml of datasets from a string
+    Params:
+        xml (bytes): the XML of datasets
+        stats (collections.Counter): see `iter_jdd_xml`
+    Return:
+        list: a list of dict of the JDD in the xml
+    """
+    return list(iter_jdd_xml([xml], stats=stats))